@@ -0,0 +1,304 @@
+import argparse
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+from NumpyPolicy import NumpyPolicy
+from ObservationEncoder import OBSERVATION_SIZE
+from OpponentPool import OpponentPool
+from OpponentServer import OpponentPolicyServer, mask_q_values
+from ReplayBuffer import ReplayBuffer
+from Seeding import spawn_seeds
+
+NUM_ACTIONS = 5
+
+# Same schedule and update cadence as Agent.py
+gamma = 0.99
+epsilon_min = 0.25
+epsilon_max = 1.0
+epsilon_random_frames = 5000
+epsilon_greedy_frames = 10000.0
+batch_size = 32
+max_steps_per_episode = 50
+max_memory_length = 50000
+update_after_actions = 32
+update_target_network = 5000
+
+
+def build_model(states, actions):
+    import tensorflow as tf
+    from tensorflow.keras import layers
+    model = tf.keras.Sequential()
+    model.add(layers.Dense(64, activation='relu', input_shape=(1, states[0])))
+    model.add(layers.Dense(20, activation='relu'))
+    model.add(layers.Dense(actions, activation='linear'))
+    model.add(layers.Flatten())
+    return model
+
+
+class Actor:
+    # steps num_envs PokerAgentEnvs with one batched forward pass for the agent and one for the opponent
+
+    def __init__(self, num_envs, weights=None, seed=None, opponent_pool_directory=None, all_in_ev=False):
+        from PokerAgentEnv import PokerAgentEnv
+        seeds = spawn_seeds(seed, num_envs + 2)
+        self.envs = [PokerAgentEnv(seed=env_seed, all_in_ev=all_in_ev) for env_seed in seeds[:num_envs]]
+        # the learner's pool opened read only: snapshots are memory mapped and shared by every actor process
+        self.opponent_pool = None
+        if opponent_pool_directory is not None:
+            self.opponent_pool = OpponentPool(directory=opponent_pool_directory, seed=seeds[num_envs + 1],
+                                              read_only=True)
+            for env in self.envs:
+                env.set_opponent_pool(self.opponent_pool)
+        self.policy = NumpyPolicy(weights) if weights is not None else None
+        self.opponent_server = OpponentPolicyServer(self.envs[0].opponent_model, num_actions=NUM_ACTIONS,
+                                                    max_batch_size=num_envs)
+        self.rng = np.random.default_rng(seeds[num_envs])
+        self.states = np.stack([env.reset() for env in self.envs])
+        self.episode_steps = np.zeros(num_envs, dtype=np.int64)
+        self.episode_rewards = np.zeros(num_envs)
+        self.frame_count = 0
+
+    def set_weights(self, weights, update_opponent=False):
+        if self.policy is None:
+            self.policy = NumpyPolicy(weights)
+        else:
+            self.policy.set_weights(weights)
+        if update_opponent and self.opponent_pool is None:
+            opponent = NumpyPolicy(weights)
+            self.opponent_server.update_model(opponent)
+            for env in self.envs:
+                env.update_opponent_model(opponent)
+
+    def epsilon(self):
+        if self.frame_count < epsilon_random_frames:
+            return 1.0
+        decayed = epsilon_max - (epsilon_max - epsilon_min) * self.frame_count / epsilon_greedy_frames
+        return max(decayed, epsilon_min)
+
+    def select_actions(self):
+        num_envs = len(self.envs)
+        valid_masks = np.zeros((num_envs, NUM_ACTIONS), dtype=bool)
+        for i, env in enumerate(self.envs):
+            valid_masks[i, env.get_player_valid_actions()] = True
+        # random valid action: argmax of random scores over the valid ones
+        actions = np.argmax(np.where(valid_masks, self.rng.random(valid_masks.shape), -1), axis=1)
+        if self.policy is not None:
+            greedy = self.rng.random(num_envs) >= self.epsilon()
+            if greedy.any():
+                q_values = self.policy.predict_on_batch(self.states[greedy])
+                actions[greedy] = np.argmax(mask_q_values(q_values, valid_masks[greedy]), axis=1)
+        return actions
+
+    def collect(self, num_steps):
+        num_envs = len(self.envs)
+        states = np.zeros((num_steps, num_envs, OBSERVATION_SIZE), dtype=np.float32)
+        next_states = np.zeros((num_steps, num_envs, OBSERVATION_SIZE), dtype=np.float32)
+        actions = np.zeros((num_steps, num_envs), dtype=np.int64)
+        rewards = np.zeros((num_steps, num_envs), dtype=np.float32)
+        dones = np.zeros((num_steps, num_envs), dtype=np.float32)
+        finished_episodes = []
+        for step in range(num_steps):
+            actions[step] = self.select_actions()
+            states[step] = self.states
+            next_states[step], rewards[step], done, _ = self.opponent_server.step_envs(self.envs, actions[step])
+            dones[step] = done
+            self.frame_count += num_envs
+            self.episode_steps += 1
+            self.episode_rewards += rewards[step]
+            self.states = next_states[step].copy()
+            # same episode cut as Agent.py: done or max_steps_per_episode steps
+            for i in np.flatnonzero(done | (self.episode_steps >= max_steps_per_episode - 1)):
+                finished_episodes.append(self.episode_rewards[i])
+                self.episode_rewards[i] = 0
+                self.episode_steps[i] = 0
+                self.states[i] = self.envs[i].reset()
+        transitions = (states.reshape(-1, OBSERVATION_SIZE), actions.ravel(), rewards.ravel(),
+                       next_states.reshape(-1, OBSERVATION_SIZE), dones.ravel())
+        return transitions, finished_episodes
+
+
+def run_actor(actor_id, seed, num_envs, steps_per_chunk, transition_queue, weights_connection, stop_event,
+              opponent_pool_directory=None, all_in_ev=False):
+    actor = Actor(num_envs, seed=seed, opponent_pool_directory=opponent_pool_directory, all_in_ev=all_in_ev)
+    while not stop_event.is_set():
+        latest = None
+        while weights_connection.poll():
+            latest = weights_connection.recv()
+        if latest is not None:
+            actor.set_weights(*latest)
+        transitions, finished_episodes = actor.collect(steps_per_chunk)
+        while not stop_event.is_set():
+            try:
+                transition_queue.put((actor_id, transitions, finished_episodes), timeout=1)
+                break
+            except queue.Full:
+                pass
+
+
+class Learner:
+
+    def __init__(self, prioritized_replay=False, opponent_pool_directory=None, batch_size=batch_size,
+                 gradient_steps=1, double_dqn=False):
+        from DQNLearner import DQNLearner
+        self.model = build_model((OBSERVATION_SIZE,), NUM_ACTIONS)
+        self.model_target = build_model((OBSERVATION_SIZE,), NUM_ACTIONS)
+        self.replay_buffer = ReplayBuffer(max_memory_length, OBSERVATION_SIZE, prioritized=prioritized_replay)
+        self.dqn = DQNLearner(self.model, self.model_target, self.replay_buffer, NUM_ACTIONS, gamma=gamma,
+                              batch_size=batch_size, double_dqn=double_dqn)
+        # gradient steps per update_after_actions frames
+        self.gradient_steps = gradient_steps
+        self.frame_count = 0
+        self.update_count = 0
+        self.pending_updates = 0
+        self.episode_reward_history = []
+        self.running_reward = 0
+        self.previous_running_reward = 0
+        self.opponent_pool = OpponentPool(directory=opponent_pool_directory) if opponent_pool_directory else None
+
+    def add(self, transitions, finished_episodes):
+        self.dqn.add_batch(*transitions)
+        num_frames = len(transitions[1])
+        target_syncs = (self.frame_count + num_frames) // update_target_network - \
+            self.frame_count // update_target_network
+        self.pending_updates += (self.frame_count + num_frames) // update_after_actions - \
+            self.frame_count // update_after_actions
+        self.frame_count += num_frames
+        self.episode_reward_history = (self.episode_reward_history + list(finished_episodes))[-100:]
+        if self.episode_reward_history:
+            self.running_reward = np.mean(self.episode_reward_history)
+        return target_syncs > 0
+
+    def train(self):
+        updates = 0
+        while self.pending_updates > 0 and self.dqn.ready():
+            updates += self.train_step()
+            self.pending_updates -= 1
+        return updates
+
+    def train_step(self):
+        updates = self.dqn.train(self.gradient_steps)
+        self.update_count += updates
+        return updates
+
+    def sync_target(self):
+        self.dqn.sync_target()
+        if self.opponent_pool is not None:
+            self.opponent_pool.add(self.model.get_weights())
+        print("running reward: {:.2f} at frame count {}".format(self.running_reward, self.frame_count))
+        if self.running_reward > self.previous_running_reward:
+            self.model.save("model.h5")
+        self.previous_running_reward = self.running_reward
+
+
+def report(start_time, learner, last_report):
+    now = time.time()
+    if now - last_report[0] < 10:
+        return
+    elapsed = now - start_time
+    print("actor frames/s: {:.0f}, learner updates/s: {:.1f} ({:.1f} while training), frames: {}, updates: {}, "
+          "run reward: {:.2f}".format(learner.frame_count / elapsed, learner.update_count / elapsed,
+                                      learner.dqn.updates_per_second(), learner.frame_count, learner.update_count,
+                                      learner.running_reward))
+    last_report[0] = now
+
+
+def run_single_process(num_envs, steps_per_chunk, total_frames, prioritized_replay, seed=None,
+                       opponent_pool_directory=None, learner_options=None, all_in_ev=False):
+    actor = Actor(num_envs, seed=seed, opponent_pool_directory=opponent_pool_directory, all_in_ev=all_in_ev)
+    learner = Learner(prioritized_replay, opponent_pool_directory, **(learner_options or {}))
+    actor.set_weights(learner.model.get_weights())
+    start_time = time.time()
+    last_report = [start_time]
+    while learner.frame_count < total_frames:
+        transitions, finished_episodes = actor.collect(steps_per_chunk)
+        sync = learner.add(transitions, finished_episodes)
+        learner.train()
+        if sync:
+            learner.sync_target()
+        actor.set_weights(learner.model.get_weights(), update_opponent=sync)
+        report(start_time, learner, last_report)
+    learner.dqn.stop()
+    return learner
+
+
+def run_multi_process(num_actors, num_envs, steps_per_chunk, total_frames, prioritized_replay, seed=None,
+                      opponent_pool_directory=None, learner_options=None, all_in_ev=False):
+    # spawn so actors never inherit the learner's TensorFlow state
+    context = mp.get_context("spawn")
+    transition_queue = context.Queue(maxsize=num_actors * 4)
+    stop_event = context.Event()
+    connections = []
+    processes = []
+    for actor_id, actor_seed in enumerate(spawn_seeds(seed, num_actors)):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_actor, args=(actor_id, actor_seed, num_envs, steps_per_chunk,
+                                                          transition_queue, receiver, stop_event,
+                                                          opponent_pool_directory, all_in_ev), daemon=True)
+        process.start()
+        connections.append(sender)
+        processes.append(process)
+    learner = Learner(prioritized_replay, opponent_pool_directory, **(learner_options or {}))
+    for connection in connections:
+        connection.send((learner.model.get_weights(), False))
+    start_time = time.time()
+    last_report = [start_time]
+    try:
+        while learner.frame_count < total_frames:
+            try:
+                actor_id, transitions, finished_episodes = transition_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            sync = learner.add(transitions, finished_episodes)
+            learner.train()
+            if sync:
+                learner.sync_target()
+            weights = learner.model.get_weights()
+            if sync:
+                for connection in connections:
+                    connection.send((weights, True))
+            else:
+                connections[actor_id].send((weights, False))
+            report(start_time, learner, last_report)
+    finally:
+        learner.dqn.stop()
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+    return learner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Self-play DQN with parallel actors and one learner")
+    parser.add_argument("--actors", type=int, default=1, help="actor processes, 1 runs everything in-process")
+    parser.add_argument("--envs-per-actor", type=int, default=8)
+    parser.add_argument("--steps-per-chunk", type=int, default=32, help="vector steps per transition batch")
+    parser.add_argument("--frames", type=int, default=500000)
+    parser.add_argument("--prioritized", action="store_true")
+    parser.add_argument("--seed", type=int, help="root seed, every actor and environment gets its own child stream")
+    parser.add_argument("--opponent-pool", help="directory for an opponent pool of past snapshots shared by the actors")
+    parser.add_argument("--batch-size", type=int, default=batch_size)
+    parser.add_argument("--gradient-steps", type=int, default=1,
+                        help="gradient steps every {} frames".format(update_after_actions))
+    parser.add_argument("--double-dqn", action="store_true")
+    parser.add_argument("--all-in-ev", action="store_true",
+                        help="reward all-in hands by their exact expected pot share instead of the dealt runout; "
+                             "preflop spots are read from preflop_matchups.npz, without it each new one enumerates "
+                             "1.7M boards (~0.5 s). Flop and turn spots take about 1 ms")
+    args = parser.parse_args()
+    learner_options = {"batch_size": args.batch_size, "gradient_steps": args.gradient_steps,
+                       "double_dqn": args.double_dqn}
+    if args.actors <= 1:
+        run_single_process(args.envs_per_actor, args.steps_per_chunk, args.frames, args.prioritized, args.seed,
+                           args.opponent_pool, learner_options, args.all_in_ev)
+    else:
+        run_multi_process(args.actors, args.envs_per_actor, args.steps_per_chunk, args.frames, args.prioritized,
+                          args.seed, args.opponent_pool, learner_options, args.all_in_ev)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
+import argparse
+
 import numpy as np
 import tensorflow as tf
-from tensorflow import keras
 from tensorflow.keras import layers
+from DQNLearner import DQNLearner
 from PokerAgentEnv import PokerAgentEnv
-
+from ReplayBuffer import ReplayBuffer
+from NumpyPolicy import NumpyPolicy
+from OpponentPool import OpponentPool, HISTORICAL
+from Instrumentation import INSTRUMENTATION
+from Checkpoint import CheckpointManager, load_checkpoint
+
+parser = argparse.ArgumentParser(description="DQN training against the opponent pool")
+parser.add_argument("--checkpoint-dir", default="checkpoints", help="where checkpoints are written and rotated")
+parser.add_argument("--resume", nargs="?", const="latest",
+                    help="continue from a checkpoint directory, or the newest one in --checkpoint-dir")
+args = parser.parse_args()
 
 # Configuration paramaters for the whole setup
 gamma = 0.99  # Discount factor for past rewards
@@ -14,8 +26,16 @@ epsilon_interval = epsilon_max - epsilon_min  # Rate at which to reduce chance o
 batch_size = 32  # Size of batch taken from replay buffer
 max_steps_per_episode = 50
 
+# Reward all-in hands by their exact expected pot share over every runout instead of the one dealt; needs
+# preflop_matchups.npz for preflop all-ins to be a lookup rather than a 1.7M board enumeration each
+all_in_ev = False
 # Use the Baseline Atari environment because of Deepmind helper functions
-env = PokerAgentEnv()
+env = PokerAgentEnv(all_in_ev=all_in_ev)
+# Past snapshots the opponent is drawn from every hand; set a directory to keep evicted ones on disk
+opponent_pool = OpponentPool(capacity=32, directory=None)
+if env.opponent_model is not None:
+    opponent_pool.add_policy(env.opponent_model, tag=HISTORICAL)
+env.set_opponent_pool(opponent_pool)
 
 def build_model(states, actions):
     model = tf.keras.Sequential()
@@ -29,15 +49,9 @@ state = np.array(env.reset())
 num_actions = env.action_space.n
 model = build_model(state.shape, num_actions)
 model_target = build_model(state.shape, num_actions)
+# NumPy copy of model for acting, refreshed after every gradient step
+greedy_policy = NumpyPolicy.from_keras_model(model)
 
-optimizer = keras.optimizers.Adam(learning_rate=0.001, clipnorm=1.0)
-
-# Experience replay buffers
-action_history = []
-state_history = []
-state_next_history = []
-rewards_history = []
-done_history = []
 episode_reward_history = []
 running_reward = 0
 episode_count = 1
@@ -50,12 +64,56 @@ epsilon_greedy_frames = 10000.0
 # Maximum replay length
 # Note: The Deepmind paper suggests 1000000 however this causes memory issues
 max_memory_length = 50000
+# Sample transitions by TD error instead of uniformly
+prioritized_replay = False
+# Experience replay buffer
+replay_buffer = ReplayBuffer(max_memory_length, state.shape[0], prioritized=prioritized_replay)
 # Train the model after x actions
 update_after_actions = 32
+# Gradient steps each time the model is trained
+gradient_steps = 1
+# Pick the next action with the model and value it with the target network
+double_dqn = False
 # How often to update the target network
 update_target_network = 5000
-# Using huber loss for stability
-loss_function = keras.losses.Huber()
+# Compiled train step fed by a background sampler thread, also keeps the Adam optimizer and Huber loss
+learner = DQNLearner(model, model_target, replay_buffer, num_actions, gamma=gamma, batch_size=batch_size,
+                     double_dqn=double_dqn)
+# Full learner state (networks, optimizer, replay buffer, opponent pool, epsilon, counters) every x frames,
+# written by a background thread; only the newest keep_checkpoints stay on disk
+checkpoint_every = 5000
+keep_checkpoints = 3
+checkpoints = CheckpointManager(args.checkpoint_dir, keep=keep_checkpoints)
+
+
+def trainer_state():
+    random_state = np.random.get_state()
+    return {"epsilon": epsilon, "frame_count": frame_count, "episode_count": episode_count,
+            "running_reward": float(running_reward), "previous_running_reward": float(previous_running_reward),
+            "episode_reward_history": [float(reward) for reward in episode_reward_history],
+            "random_state": [random_state[0], random_state[1].tolist()] + list(random_state[2:])}
+
+
+if args.resume is not None:
+    resume_path = checkpoints.latest() if args.resume == "latest" else args.resume
+    if resume_path is None:
+        raise SystemExit("no checkpoint in {}".format(args.checkpoint_dir))
+    resumed = load_checkpoint(resume_path, learner, opponent_pool)
+    epsilon = resumed["epsilon"]
+    frame_count = resumed["frame_count"]
+    episode_count = resumed["episode_count"]
+    running_reward = resumed["running_reward"]
+    previous_running_reward = resumed["previous_running_reward"]
+    episode_reward_history = resumed["episode_reward_history"]
+    random_state = resumed["random_state"]
+    np.random.set_state((random_state[0], np.array(random_state[1], dtype=np.uint32), *random_state[2:]))
+    greedy_policy.set_weights(model.get_weights())
+    # the hand that was being played is not part of the checkpoint, training picks up with a new episode
+    print("resumed from", resume_path, "frame:", frame_count, "episode:", episode_count)
+# Time deal/action/showdown/observe/opponent/train phases and print them with the running reward
+instrumentation_enabled = False
+if instrumentation_enabled:
+    INSTRUMENTATION.enable()
 while True:
 
     if episode_count%10 == 0:
@@ -75,9 +133,7 @@ while True:
         else:
             # Predict action Q-values
             # From environment state
-            state_tensor = tf.convert_to_tensor(state)
-            state_tensor = tf.expand_dims(tf.expand_dims(state_tensor, 0), 0)
-            action_probs = model(state_tensor, training=False)
+            q_values = greedy_policy.predict_on_batch(state.reshape(1, -1))[0]
             # Get allowed actions
             valid_actions = env.get_player_valid_actions()
             # Mask invalid actions by setting their Q-values to a large negative number
@@ -86,8 +142,6 @@ while True:
             masked_q_values = q_values - (mask * 1e9)
             # Choose action with highest Q-value among valid actions
             action = np.argmax(masked_q_values)
-            # Take best action
-            action = tf.argmax(action_probs[0]).numpy()
 
         # Decay probability of taking random action
         epsilon -= epsilon_interval / epsilon_greedy_frames
@@ -100,73 +154,31 @@ while True:
         episode_reward += reward
 
         # Save actions and states in replay buffer
-        action_history.append(action)
-        state_history.append(state)
-        state_next_history.append(state_next)
-        done_history.append(done)
-        rewards_history.append(reward)
+        learner.add(state, action, reward, state_next, done)
         state = state_next
 
         # Update every fourth frame and once batch size is over 32
-        if frame_count % update_after_actions == 0 and len(done_history) > batch_size:
-
-            # Get indices of samples for replay buffers
-            indices = np.random.choice(range(len(done_history)), size=batch_size)
-
-            # Using list comprehension to sample from replay buffer
-            state_sample = np.array([state_history[i] for i in indices])
-            state_next_sample = np.array([state_next_history[i] for i in indices])
-            rewards_sample = [rewards_history[i] for i in indices]
-            action_sample = [action_history[i] for i in indices]
-            done_sample = tf.convert_to_tensor(
-                [float(done_history[i]) for i in indices]
-            )
-
-            # Build the updated Q-values for the sampled future states
-            # Use the target model for stability
-            future_rewards = model_target.predict(state_next_sample.reshape(batch_size, 1, state.shape[0]), verbose=0)
-            # Q value = reward + discount factor * expected future reward
-            updated_q_values = rewards_sample + gamma * tf.reduce_max(future_rewards, axis=1)
-
-            # If final frame set the last value to -1
-            updated_q_values = updated_q_values * (1 - done_sample) - done_sample
-
-            # Create a mask so we only calculate loss on the updated Q-values
-            masks = tf.one_hot(action_sample, num_actions)
-
-            with tf.GradientTape() as tape:
-                # Train the model on the states and updated Q-values
-                q_values = model(state_sample.reshape(batch_size, 1, state.shape[0]))
-                # Apply the masks to the Q-values to get the Q-value for action taken
-                q_action = tf.reduce_sum(tf.multiply(q_values, masks), axis=1)
-                # Calculate loss between new Q-value and old Q-value
-                loss = loss_function(updated_q_values, q_action)
-
-            # Backpropagation
-            grads = tape.gradient(loss, model.trainable_variables)
-            optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        if frame_count % update_after_actions == 0 and learner.ready():
+            with INSTRUMENTATION.timer("train_step"):
+                learner.train(gradient_steps)
+                greedy_policy.set_weights(model.get_weights())
+
+        if frame_count % checkpoint_every == 0:
+            checkpoints.save(frame_count, learner, trainer_state(), opponent_pool)
 
         if frame_count % update_target_network == 0:
-            # update the opponent model
-            new_opponent_model = build_model(state.shape, num_actions)
-            new_opponent_model.set_weights(model.get_weights())
-            env.update_opponent_model(new_opponent_model)
+            # add the current model to the opponent pool as the latest snapshot
+            opponent_pool.add(model.get_weights())
             # update the the target network with new weights
-            model_target.set_weights(model.get_weights())
+            learner.sync_target()
             # Log details
-            template = "running reward: {:.2f} at episode {}, frame count {}"
-            print(template.format(running_reward, episode_count, frame_count))
+            template = "running reward: {:.2f} at episode {}, frame count {}, updates/s {:.1f}"
+            print(template.format(running_reward, episode_count, frame_count, learner.updates_per_second()))
+            if instrumentation_enabled:
+                print(INSTRUMENTATION.summary())
             if running_reward > previous_running_reward:
                 model.save("model.h5")
             previous_running_reward = running_reward
-        # Limit the state and reward history
-        if len(rewards_history) > max_memory_length:
-            del rewards_history[:1]
-            del state_history[:1]
-            del state_next_history[:1]
-            del action_history[:1]
-            del done_history[:1]
-
         if done:
             break
 
@@ -179,5 +191,8 @@ while True:
     episode_count += 1
 
     if episode_count > 10000:
+        learner.stop()
+        checkpoints.save(frame_count, learner, trainer_state(), opponent_pool, wait=True)
+        checkpoints.wait()
         model.save("ohlala.h5")
         break
@@ -0,0 +1,223 @@
+import numpy as np
+from BettingRules import state_index, valid_actions_index, playable_index, STAGE_READY, SHOWDOWN_TABLE, \
+    VALID_MASKS, PLAYABLE
+from Cards import NUM_CARDS
+from Enums import Position, Action
+from HandEvaluator import get_hand_evaluator
+from ObservationEncoder import encode_observations
+from PokerEnv import INITIAL_STACK_SIZE, SMALL_BLIND, BIG_BLIND
+from Settlement import settle_batch
+
+CARDS_PER_TABLE = 9  # 2 hole cards per seat + 5 community cards
+BOARD_OFFSET = 4
+
+FOLD = Action.FOLD.value
+CHECK = Action.CHECK.value
+CALL = Action.CALL.value
+MIN_RAISE = Action.MIN_RAISE.value
+BIG_RAISE = Action.BIG_RAISE.value
+
+
+class BatchPokerEnv:
+    # seat 0 is PokerEnv.player, seat 1 is PokerEnv.opponent
+
+    def __init__(self, n_tables, seed=None):
+        self.n_tables = n_tables
+        self.rng = np.random.default_rng(seed)
+        self.evaluator = get_hand_evaluator()
+        self.rows = np.arange(n_tables)
+        self.stack = np.zeros((n_tables, 2), dtype=np.int64)
+        self.total_bet = np.zeros((n_tables, 2), dtype=np.int64)
+        self.position = np.zeros((n_tables, 2), dtype=np.int64)
+        self.is_fold = np.zeros((n_tables, 2), dtype=bool)
+        self.already_played = np.zeros((n_tables, 2), dtype=bool)
+        self.is_small_blind = np.zeros((n_tables, 2), dtype=bool)
+        self.hand_start_stack = np.zeros((n_tables, 2), dtype=np.int64)
+        self.pot = np.zeros(n_tables, dtype=np.int64)
+        self.cards = np.zeros((n_tables, CARDS_PER_TABLE), dtype=np.int64)
+        self.community_count = np.zeros(n_tables, dtype=np.int64)
+        self.to_act = np.zeros(n_tables, dtype=np.int64)
+        self.reset()
+
+    def seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        return [seed]
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        self.reset_tables(self.rows)
+        return self.get_observations()
+
+    def reset_tables(self, tables):
+        rand_stack = self.rng.integers(4, INITIAL_STACK_SIZE * 2 + 1, size=len(tables))
+        self.stack[tables, 0] = rand_stack
+        self.stack[tables, 1] = INITIAL_STACK_SIZE * 2 - rand_stack
+        self.is_small_blind[tables, 0] = False
+        self.is_small_blind[tables, 1] = True
+        self.reset_boards(tables)
+
+    def reset_boards(self, tables):
+        player_small_blind = ~self.is_small_blind[tables, 0]
+        self.is_small_blind[tables, 0] = player_small_blind
+        self.is_small_blind[tables, 1] = ~player_small_blind
+        small_blinds = self.is_small_blind[tables]
+        self.position[tables] = np.where(small_blinds, Position.SMALL_BLIND.value, Position.BIG_BLIND.value)
+        self.hand_start_stack[tables] = self.stack[tables]
+        blinds = np.minimum(np.where(small_blinds, SMALL_BLIND, BIG_BLIND), self.stack[tables])
+        self.stack[tables] -= blinds
+        self.total_bet[tables] = blinds
+        self.pot[tables] = blinds.sum(axis=1)
+        self.is_fold[tables] = False
+        self.already_played[tables] = False
+        self.community_count[tables] = 0
+        self.to_act[tables] = np.where(player_small_blind, 0, 1)
+        self.deal(tables)
+
+    def deal(self, tables):
+        shuffled = np.argsort(self.rng.random((len(tables), NUM_CARDS)), axis=1)
+        self.cards[tables] = shuffled[:, :CARDS_PER_TABLE]
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=np.int64)
+        rows = self.rows
+        cur = self.to_act.copy()
+        other = 1 - cur
+        stack_before = self.stack.copy()
+
+        cur_stack = self.stack[rows, cur]
+        other_stack = self.stack[rows, other]
+        cur_bet = self.total_bet[rows, cur]
+        other_bet = self.total_bet[rows, other]
+        playable = PLAYABLE[playable_index(self.already_played[rows, cur], self.already_played[rows, other],
+                                           self.is_small_blind[rows, cur])]
+
+        final_action, bet_amount = self.resolve_actions(actions, cur_stack, other_stack, cur_bet, other_bet)
+        final_action = np.where(playable, final_action, -1)
+
+        fold = final_action == FOLD
+        self.is_fold[rows[fold], cur[fold]] = True
+        check = final_action == CHECK
+        self.position[rows[check], cur[check]] = Position.CHECK.value
+
+        # perform_call and both raises go through place_bet
+        betting = final_action >= CALL
+        paid = np.where(betting, np.minimum(bet_amount, cur_stack), 0)
+        cur_stack = cur_stack - paid
+        cur_bet = cur_bet + paid
+        self.pot += paid
+        call = final_action == CALL
+        # an all-in call for less stays in the ledger, settle returns the uncalled part
+        self.stack[rows, cur] = cur_stack
+        self.total_bet[rows, cur] = cur_bet
+        self.position[rows[call], cur[call]] = Position.CALL.value
+        raised = final_action >= MIN_RAISE
+        self.position[rows[raised], cur[raised]] = Position.RAISE.value
+        acted = final_action >= 0
+        self.already_played[rows[acted], cur[acted]] = True
+
+        all_in = self.is_all_in_closed() & ~self.is_fold[rows, cur]
+        self.community_count[all_in] = 5
+        self.already_played[all_in] = True
+
+        hand_over = self.is_hand_over()
+        stage_ready = ~hand_over & self.is_stage_ready()
+        self.update_boards(stage_ready)
+        self.to_act = np.where(stage_ready, np.argmax(self.is_small_blind, axis=1), other)
+
+        rewards = np.zeros((self.n_tables, 2), dtype=np.int64)
+        if hand_over.any():
+            finished = rows[hand_over]
+            self.settle(finished)
+            rewards[finished] = self.stack[finished] - self.hand_start_stack[finished]
+            busted = finished[(self.stack[finished] == 0).any(axis=1)]
+            self.reset_boards(finished)
+            if len(busted):
+                self.reset_tables(busted)
+
+        info = {"to_act": self.to_act.copy(), "actions": final_action, "stack_before": stack_before}
+        return self.get_observations(), rewards, hand_over, info
+
+    def resolve_actions(self, actions, cur_stack, other_stack, cur_bet, other_bet):
+        # collapses the perform_* fallback chain into one final action and the amount passed to place_bet
+        amount = other_bet - cur_bet
+        call_action = np.where(amount > 0, CALL, CHECK)
+        # nothing to raise into once the other seat is all in
+        no_raise = (amount >= cur_stack) | (other_stack == 0) | (amount < 0)
+
+        min_bet = np.where(amount == 0, SMALL_BLIND, amount * 2)
+        min_bet = np.where(other_stack < min_bet, other_stack + amount, min_bet)
+        min_raise_action = np.where(no_raise | (cur_stack < min_bet), call_action, MIN_RAISE)
+
+        big_bet = np.where(amount == 0, BIG_BLIND * 3, amount * 3)
+        big_bet = np.where(other_stack < big_bet, other_stack + amount, big_bet)
+        big_raise_action = np.where(no_raise, call_action,
+                                    np.where(cur_stack < big_bet, min_raise_action, BIG_RAISE))
+
+        final_action = np.select(
+            [actions == FOLD, actions == CHECK, actions == CALL, actions == MIN_RAISE, actions == BIG_RAISE],
+            [FOLD, call_action, call_action, min_raise_action, big_raise_action],
+            default=-1,
+        )
+        bet_amount = np.select(
+            [final_action == CALL, final_action == MIN_RAISE, final_action == BIG_RAISE],
+            [amount, min_bet, big_bet],
+            default=0,
+        )
+        return final_action, bet_amount
+
+    def betting_states(self):
+        return state_index(self.position[:, 0], self.position[:, 1], self.already_played[:, 0],
+                           self.already_played[:, 1], self.community_count == 5,
+                           self.total_bet[:, 0] == self.total_bet[:, 1])
+
+    def is_stage_ready(self):
+        return STAGE_READY[self.betting_states()]
+
+    def is_all_in_closed(self):
+        # PokerEnv.is_all_in_closed per table
+        all_in = self.stack == 0
+        player_bet, opponent_bet = self.total_bet[:, 0], self.total_bet[:, 1]
+        return (all_in[:, 0] & all_in[:, 1]) | (all_in[:, 0] & (opponent_bet >= player_bet)) | \
+            (all_in[:, 1] & (player_bet >= opponent_bet))
+
+    def is_hand_over(self):
+        all_in_showdown = (self.community_count == 5) & self.is_all_in_closed()
+        return self.is_fold.any(axis=1) | SHOWDOWN_TABLE[self.betting_states()] | all_in_showdown
+
+    def update_boards(self, tables):
+        # 0 -> 3 -> 4 -> 5, a full board stays at 5
+        count = self.community_count
+        dealt = np.where(count == 0, 3, np.minimum(count + 1, 5))
+        self.community_count = np.where(tables, dealt, count)
+        self.already_played[tables] = False
+
+    def settle(self, tables):
+        self.stack[tables] += settle_batch(self.total_bet[tables], self.is_fold[tables], self.showdown_scores(tables))
+        self.pot[tables] = 0
+
+    def showdown_scores(self, tables):
+        # hand ranks of both seats, only filled where nobody folded since settle_batch ignores them elsewhere
+        scores = np.zeros((len(tables), 2), dtype=np.int64)
+        showdown = ~self.is_fold[tables].any(axis=1)
+        if showdown.any():
+            cards = self.cards[tables[showdown]]
+            board = cards[:, BOARD_OFFSET:]
+            scores[showdown, 0] = self.evaluator.evaluate_batch(np.hstack([cards[:, 0:2], board]))
+            scores[showdown, 1] = self.evaluator.evaluate_batch(np.hstack([cards[:, 2:4], board]))
+        return scores
+
+    def get_valid_action_mask(self):
+        # vectorized get_player_valid_actions for the seat to act
+        other = 1 - self.to_act
+        return VALID_MASKS[valid_actions_index(self.position[self.rows, other], self.already_played[self.rows, other])]
+
+    def get_observations(self, out=None):
+        rows = self.rows
+        cur = self.to_act
+        other = 1 - cur
+        hands = self.cards[rows[:, None], cur[:, None] * 2 + np.arange(2)]
+        return encode_observations(hands, self.cards[:, BOARD_OFFSET:], self.community_count,
+                                   self.position[rows, cur], self.position[rows, other], self.pot,
+                                   self.stack[rows, cur], self.stack[rows, other],
+                                   self.total_bet[rows, other] - self.total_bet[rows, cur], out=out)
@@ -0,0 +1,316 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from Enums import Action
+from PokerEnv import PokerEnv
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.h5")
+# hard limits for a fresh process that only simulates hands, checked on every run
+IMPORT_BUDGET = {"core_import_ms": 400, "core_rss_mb": 80, "agent_env_import_ms": 800, "heavy_modules_count": 0}
+HEAVY_MODULES = ("tensorflow", "keras", "h5py", "torch")
+IMPORT_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+from PokerEnv import PokerEnv
+from BatchPokerEnv import BatchPokerEnv
+PokerEnv(seed=0)
+BatchPokerEnv(64, seed=0)
+core = time.perf_counter() - start
+core_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+from PokerAgentEnv import PokerAgentEnv
+env = PokerAgentEnv(seed=0)
+env.reset()
+env.step(env.get_player_valid_actions()[0])
+agent = time.perf_counter() - start
+print(json.dumps({"core_import_ms": core * 1e3, "core_rss_mb": core_rss, "agent_env_import_ms": agent * 1e3,
+                  "heavy_modules_count": sum(name in sys.modules for name in %r)}))
+""" % (HEAVY_MODULES,)
+
+
+def timed(function, min_time):
+    # calls function(), which returns a work count, until min_time seconds have passed
+    count = 0
+    start = time.perf_counter()
+    while True:
+        count += function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count, elapsed
+
+
+def bench_poker_env_hands(min_time):
+    env = PokerEnv(seed=0)
+
+    def play_hands():
+        hands = 0
+        for turn in range(200):
+            cur_player, other_player = (env.player, env.opponent) if turn % 2 == 0 else (env.opponent, env.player)
+            action = np.random.choice(env.get_player_valid_actions(other_player))
+            hands_dealt = env.hands_dealt
+            env.execute_player_action(cur_player, other_player, action)
+            # a new hand is dealt as soon as one ends, split pots included
+            if env.hands_dealt != hands_dealt:
+                hands += 1
+                if env.player.stack_size == 0 or env.opponent.stack_size == 0:
+                    env.reset()
+        return hands
+
+    hands, elapsed = timed(play_hands, min_time)
+    return {"poker_env_hands_per_sec": hands / elapsed}
+
+
+def bench_table_env_hands(min_time, seat_counts=(2, 6, 9)):
+    # every seat calls down, so each hand has four betting rounds and a showdown with all seats and the cost per
+    # seat per hand should stay roughly flat as seats are added
+    from TableEnv import TableEnv
+    results = {}
+    for num_seats in seat_counts:
+        env = TableEnv(num_seats, seed=0)
+
+        def play_hands():
+            hands = 0
+            for _ in range(200):
+                done, _, _ = env.step(Action.CALL.value)
+                if done:
+                    hands += 1
+                    # keep every seat in: a new hand starting with a seat sitting out means someone busted
+                    if any(env.folded):
+                        env.reset()
+            return hands
+
+        hands, elapsed = timed(play_hands, min_time / len(seat_counts))
+        results["table_env_{}_seats_hands_per_sec".format(num_seats)] = hands / elapsed
+        results["table_env_{}_seats_per_seat_hand_us".format(num_seats)] = elapsed / hands / num_seats * 1e6
+    return results
+
+
+def bench_batch_env_steps(min_time, n_tables=1024):
+    from BatchPokerEnv import BatchPokerEnv
+    env = BatchPokerEnv(n_tables, seed=0)
+    rng = np.random.default_rng(0)
+    hands = [0]
+
+    def step():
+        mask = env.get_valid_action_mask()
+        actions = np.argmax(np.where(mask, rng.random(mask.shape), -1), axis=1)
+        observations, rewards, dones, info = env.step(actions)
+        hands[0] += int(dones.sum())
+        return n_tables
+
+    steps, elapsed = timed(step, min_time)
+    return {"batch_env_table_steps_per_sec": steps / elapsed, "batch_env_hands_per_sec": hands[0] / elapsed}
+
+
+def create_agent_env(with_opponent, decision_cache=None):
+    from PokerAgentEnv import PokerAgentEnv
+    from NumpyPolicy import NumpyPolicy
+    env = PokerAgentEnv(seed=0, decision_cache=decision_cache)
+    env.update_opponent_model(NumpyPolicy.load(MODEL_PATH) if with_opponent else None)
+    env.reset()
+    return env
+
+
+def bench_agent_env_steps(min_time):
+    from DecisionCache import DecisionCache
+    results = {}
+    for with_opponent, decision_cache, name in ((False, None, "agent_env_steps_per_sec"),
+                                                (True, None, "agent_env_steps_per_sec_opponent"),
+                                                (True, DecisionCache(), "agent_env_steps_per_sec_cached")):
+        env = create_agent_env(with_opponent, decision_cache)
+
+        def step():
+            for _ in range(100):
+                env.step(np.random.choice(env.get_player_valid_actions()))
+            return 100
+
+        steps, elapsed = timed(step, min_time)
+        results[name] = steps / elapsed
+        if decision_cache is not None:
+            results["decision_cache_hit_rate"] = decision_cache.hit_rate()
+    return results
+
+
+def bench_get_observation(min_time):
+    env = create_agent_env(False)
+    player, opponent = env.pokerEnv.player, env.pokerEnv.opponent
+    env.pokerEnv.update_board()
+
+    def observe():
+        for _ in range(1000):
+            env.get_observation(player, opponent)
+        return 1000
+
+    calls, elapsed = timed(observe, min_time)
+    return {"get_observation_us": elapsed / calls * 1e6}
+
+
+def bench_showdown(min_time):
+    env = PokerEnv(seed=0)
+
+    def showdowns():
+        env.reset_board()
+        env.update_all_in_stage()
+        for _ in range(100):
+            env.settle_pot()
+        return 100
+
+    calls, elapsed = timed(showdowns, min_time)
+    return {"showdowns_per_sec": calls / elapsed}
+
+
+def bench_train_step(min_time):
+    try:
+        import tensorflow  # noqa: F401
+    except ImportError:
+        return {}
+    from ActorLearner import Learner, batch_size
+    from ObservationEncoder import OBSERVATION_SIZE
+    learner = Learner()
+    rng = np.random.default_rng(0)
+    count = batch_size * 100
+    learner.replay_buffer.add_batch(rng.random((count, OBSERVATION_SIZE)), rng.integers(0, 5, count),
+                                    rng.normal(size=count), rng.random((count, OBSERVATION_SIZE)),
+                                    rng.random(count) < 0.1)
+    learner.train_step()  # builds the graph outside the timed loop
+
+    def train():
+        for _ in range(10):
+            learner.train_step()
+        return 10
+
+    steps, elapsed = timed(train, min_time)
+    learner.dqn.stop()
+    return {"train_step_ms": elapsed / steps * 1e3, "learner_updates_per_sec": steps / elapsed}
+
+
+def bench_checkpoint(min_time, capacity=50000):
+    # a full Agent.py sized replay buffer: the copy the training thread waits on, the background write and the
+    # memory mapped open a resume does
+    import tempfile
+    from ReplayBuffer import ReplayBuffer
+    from ObservationEncoder import OBSERVATION_SIZE
+    buffer = ReplayBuffer(capacity, OBSERVATION_SIZE, prioritized=True, seed=0)
+    rng = np.random.default_rng(0)
+    buffer.add_batch(rng.random((capacity, OBSERVATION_SIZE)), rng.integers(0, 5, capacity), rng.normal(size=capacity),
+                     rng.random((capacity, OBSERVATION_SIZE)), rng.random(capacity) < 0.1)
+    times = {"snapshot": 0.0, "write": 0.0, "open": 0.0}
+    with tempfile.TemporaryDirectory() as directory:
+
+        def checkpoint():
+            start = time.perf_counter()
+            snapshot = buffer.snapshot()
+            times["snapshot"] += time.perf_counter() - start
+            ReplayBuffer.write_snapshot(directory, snapshot)
+            times["write"] += time.perf_counter() - start
+            ReplayBuffer.open_snapshot(directory)
+            times["open"] += time.perf_counter() - start
+            return 1
+
+        count, _ = timed(checkpoint, min_time)
+    return {"checkpoint_snapshot_ms": times["snapshot"] / count * 1e3,
+            "checkpoint_write_ms": (times["write"] - times["snapshot"]) / count * 1e3,
+            "checkpoint_open_ms": (times["open"] - times["write"]) / count * 1e3}
+
+
+def bench_imports(min_time, repeats=3):
+    # fresh interpreters, so nothing is already imported; the fastest run is reported
+    results = {}
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        run_results = json.loads(output.strip().splitlines()[-1])
+        for metric, value in run_results.items():
+            results[metric] = min(results.get(metric, value), value)
+    return results
+
+
+BENCHMARKS = {
+    "imports": bench_imports,
+    "poker_env": bench_poker_env_hands,
+    "batch_env": bench_batch_env_steps,
+    "table_env": bench_table_env_hands,
+    "agent_env": bench_agent_env_steps,
+    "observation": bench_get_observation,
+    "showdown": bench_showdown,
+    "train_step": bench_train_step,
+    "checkpoint": bench_checkpoint,
+}
+
+
+def lower_is_better(metric):
+    return metric.endswith(("_us", "_ms", "_mb", "_count"))
+
+
+def check_budget(results, budget=IMPORT_BUDGET):
+    over_budget = []
+    for metric, limit in budget.items():
+        if metric in results and results[metric] > limit:
+            over_budget.append(metric)
+            print("{:40s} {:14.2f} over budget {:14.2f}".format(metric, results[metric], limit))
+    return over_budget
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for metric, value in results.items():
+        if metric not in baseline:
+            continue
+        base = baseline[metric]
+        if base == 0:
+            continue
+        change = (value - base) / base if not lower_is_better(metric) else (base - value) / base
+        status = "REGRESSION" if change < -tolerance else "ok"
+        if status == "REGRESSION":
+            regressions.append(metric)
+        print("{:40s} {:14.2f} baseline {:14.2f} {:+7.1%} {}".format(metric, value, base, change, status))
+    return regressions
+
+
+def run(names, min_time):
+    np.random.seed(0)
+    results = {}
+    for name in names:
+        results.update(BENCHMARKS[name](min_time))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU benchmarks for the poker environments and the learner")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--min-time", type=float, default=2.0, help="seconds spent on each benchmark")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with these results")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+    results = run(args.only, args.min_time)
+    report = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    if check_budget(results):
+        return 1
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import numpy as np
+
+from Enums import Position, Action
+
+NUM_POSITIONS = len(Position)
+NUM_ACTIONS = len(Action)
+# raise sizing shared by PokerEnv and TableEnv: multiple of the amount to call, minimum when nothing is owed
+MIN_RAISE_MULTIPLIER = 2
+BIG_RAISE_MULTIPLIER = 3
+# betting_phase results
+CONTINUE = 0
+NEXT_STREET = 1
+SHOWDOWN = 2
+
+
+def state_index(player_position, opponent_position, player_played, opponent_played, river, bets_equal):
+    # works on Python scalars and NumPy arrays alike; positions are Position values
+    return ((((player_position * NUM_POSITIONS + opponent_position) * 2 + player_played) * 2 + opponent_played) * 2
+            + river) * 2 + bets_equal
+
+
+def reference_stage_ready(player_position, opponent_position, player_played, opponent_played, bets_equal):
+    # the Position comparisons PokerEnv.is_stage_ready used to make on every call
+    if not player_played or not opponent_played or not bets_equal:
+        return False
+    pair = (player_position, opponent_position)
+    return pair in ((Position.CHECK, Position.CHECK), (Position.RAISE, Position.CALL), (Position.CALL, Position.RAISE),
+                    (Position.CHECK, Position.CALL), (Position.CALL, Position.CHECK))
+
+
+def reference_showdown(player_position, opponent_position, player_played, opponent_played, river):
+    # PokerEnv.is_hand_over without the fold check
+    if not river or not player_played or not opponent_played:
+        return False
+    pair = (player_position, opponent_position)
+    return pair in ((Position.CHECK, Position.CHECK), (Position.CALL, Position.RAISE), (Position.RAISE, Position.CALL))
+
+
+def reference_valid_actions(other_position, other_played):
+    # PokerEnv.get_player_valid_actions, keyed by the other player's position and already_played flag
+    if not other_played:
+        return [0, 2, 3, 4]
+    if other_position in (Position.CHECK, Position.CALL):
+        return [1, 3, 4]
+    if other_position == Position.RAISE:
+        return [0, 2, 3, 4]
+    return [0, 3, 4]
+
+
+def build_betting_tables():
+    size = state_index(NUM_POSITIONS - 1, NUM_POSITIONS - 1, 1, 1, 1, 1) + 1
+    stage_ready = np.zeros(size, dtype=bool)
+    showdown = np.zeros(size, dtype=bool)
+    for player_position in Position:
+        for opponent_position in Position:
+            for player_played in (0, 1):
+                for opponent_played in (0, 1):
+                    for river in (0, 1):
+                        for bets_equal in (0, 1):
+                            index = state_index(player_position.value, opponent_position.value, player_played,
+                                                opponent_played, river, bets_equal)
+                            stage_ready[index] = reference_stage_ready(player_position, opponent_position,
+                                                                       player_played, opponent_played, bets_equal)
+                            showdown[index] = reference_showdown(player_position, opponent_position, player_played,
+                                                                 opponent_played, river)
+    # the hand ending takes precedence over moving to the next street
+    phase = np.where(showdown, SHOWDOWN, np.where(stage_ready, NEXT_STREET, CONTINUE)).astype(np.int8)
+    valid_actions = [reference_valid_actions(position, played) for position in Position for played in (0, 1)]
+    valid_masks = np.zeros((len(valid_actions), NUM_ACTIONS), dtype=bool)
+    for row, actions in enumerate(valid_actions):
+        valid_masks[row, actions] = True
+    # check_if_playable: indexed by cur already_played * 4 + other already_played * 2 + cur is_small_blind
+    playable = np.array([cur_played or other_played or small_blind
+                         for cur_played in (0, 1) for other_played in (0, 1) for small_blind in (0, 1)])
+    return stage_ready, showdown, phase, valid_actions, valid_masks, playable
+
+
+STAGE_READY, SHOWDOWN_TABLE, PHASE, VALID_ACTIONS, VALID_MASKS, PLAYABLE = build_betting_tables()
+# Python lists for the scalar lookups, indexing them is much cheaper than indexing NumPy arrays one at a time
+STAGE_READY_LIST = STAGE_READY.tolist()
+SHOWDOWN_LIST = SHOWDOWN_TABLE.tolist()
+PHASE_LIST = PHASE.tolist()
+PLAYABLE_LIST = PLAYABLE.tolist()
+
+
+def valid_actions_index(other_position, other_played):
+    return other_position * 2 + other_played
+
+
+def playable_index(cur_played, other_played, cur_is_small_blind):
+    return cur_played * 4 + other_played * 2 + cur_is_small_blind
+
+
+def raise_size(to_call, multiplier, minimum, cover):
+    # chips to put in for a raise; when the deepest other stack (cover) cannot call it, the bet becomes exactly
+    # what puts that stack all in
+    bet_amount = minimum if to_call == 0 else to_call * multiplier
+    if cover < bet_amount:
+        bet_amount = cover + to_call
+    return bet_amount
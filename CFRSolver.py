@@ -0,0 +1,276 @@
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from Cards import cards_to_ids
+from Equity import get_equity_calculator
+from PokerEnv import PokerEnv
+
+NUM_ACTIONS = 5
+NUM_CARD_BUCKETS = 8
+STACK_BUCKET_SIZE = 20
+MAX_ACTIONS_PER_HAND = 24  # longer betting sequences are run out to showdown
+MAX_RAISES_PER_STREET = 2  # betting cap, keeps the traversed tree small
+RAISE_ACTIONS = ("3", "4")
+WORST_HAND_RANK = 7462
+CHECKPOINT_PATH = "cfr_checkpoint.npz"
+
+
+def regret_matching(regrets, valid_actions):
+    positive = np.maximum(regrets[valid_actions], 0)
+    total = positive.sum()
+    strategy = np.zeros(NUM_ACTIONS)
+    if total > 0:
+        strategy[valid_actions] = positive / total
+    else:
+        strategy[valid_actions] = 1.0 / len(valid_actions)
+    return strategy
+
+
+class CFRSolver:
+    # external sampling MCCFR over the PokerEnv betting rules; with plus=True regrets are floored at zero (CFR+)
+
+    def __init__(self, num_card_buckets=NUM_CARD_BUCKETS, stack_bucket_size=STACK_BUCKET_SIZE, plus=True, seed=None,
+                 capacity=1024):
+        self.num_card_buckets = num_card_buckets
+        self.stack_bucket_size = stack_bucket_size
+        self.plus = plus
+        self.rng = np.random.default_rng(seed)
+        self.env = PokerEnv(seed=self.rng)
+        self.equity_calculator = get_equity_calculator()
+        self.infoset_ids = {}
+        self.infoset_keys = []
+        self.regrets = np.zeros((capacity, NUM_ACTIONS))
+        self.strategy_sum = np.zeros((capacity, NUM_ACTIONS))
+        self.iterations = 0
+        # per deal state, filled in by iterate
+        self.start_stacks = (0, 0)
+        self.stack_bucket = 0
+        self.card_buckets = {}
+
+    def __len__(self):
+        return len(self.infoset_keys)
+
+    def infoset_id(self, key):
+        infoset_id = self.infoset_ids.get(key)
+        if infoset_id is None:
+            infoset_id = len(self.infoset_keys)
+            if infoset_id == len(self.regrets):
+                self.regrets = np.concatenate([self.regrets, np.zeros_like(self.regrets)])
+                self.strategy_sum = np.concatenate([self.strategy_sum, np.zeros_like(self.strategy_sum)])
+            self.infoset_ids[key] = infoset_id
+            self.infoset_keys.append(key)
+        return infoset_id
+
+    def seat_players(self, seat):
+        if seat == 0:
+            return self.env.player, self.env.opponent
+        return self.env.opponent, self.env.player
+
+    def card_bucket(self, seat, street):
+        bucket = self.card_buckets.get((seat, street))
+        if bucket is None:
+            hand = self.seat_players(seat)[0].get_hand()
+            if street == 0:
+                strength = self.equity_calculator.equity_ids(cards_to_ids(hand)).equity
+            else:
+                rank = self.env.evaluator.evaluate(hand, self.env.community_cards[:street])
+                strength = 1.0 - (rank - 1) / WORST_HAND_RANK
+            bucket = min(int(strength * self.num_card_buckets), self.num_card_buckets - 1)
+            self.card_buckets[(seat, street)] = bucket
+        return bucket
+
+    def infoset_key(self, seat, history):
+        street = len(self.env.community_cards)
+        is_small_blind = int(self.seat_players(seat)[0].is_small_blind)
+        return "{}|{}|{}|{}".format(self.stack_bucket, is_small_blind, self.card_bucket(seat, street), history)
+
+    def terminal_utility(self, seat):
+        return self.seat_players(seat)[0].stack_size + self.env.settle_pot()[seat] - self.start_stacks[seat]
+
+    def apply_action(self, seat, action, history):
+        # returns the next seat to act, None once the hand is over, and the extended history
+        env = self.env
+        cur_player, other_player = self.seat_players(seat)
+        performed_action = env.apply_player_action(cur_player, other_player, action)
+        history += str(performed_action.value) if performed_action is not None else "x"
+        if env.is_hand_over():
+            return None, history
+        if env.is_stage_ready():
+            env.update_board()
+            small_blind_seat = 0 if env.player.is_small_blind else 1
+            return small_blind_seat, history + "/"
+        return 1 - seat, history
+
+    def valid_actions(self, seat, history):
+        valid_actions = self.env.get_player_valid_actions(self.seat_players(seat)[1])
+        street_history = history[history.rfind("/") + 1:]
+        if sum(street_history.count(action) for action in RAISE_ACTIONS) >= MAX_RAISES_PER_STREET:
+            valid_actions = [action for action in valid_actions if action < 3] or [1]
+        return valid_actions
+
+    def walk(self, traverser, seat, history, depth):
+        env = self.env
+        if seat is None:
+            return self.terminal_utility(traverser)
+        if depth >= MAX_ACTIONS_PER_HAND:
+            env.update_all_in_stage()
+            return self.terminal_utility(traverser)
+        valid_actions = self.valid_actions(seat, history)
+        infoset_id = self.infoset_id(self.infoset_key(seat, history))
+        strategy = regret_matching(self.regrets[infoset_id], valid_actions)
+        if seat != traverser:
+            self.strategy_sum[infoset_id] += strategy
+            action = valid_actions[min(int(np.searchsorted(np.cumsum(strategy[valid_actions]), self.rng.random())),
+                                       len(valid_actions) - 1)]
+            next_seat, next_history = self.apply_action(seat, action, history)
+            return self.walk(traverser, next_seat, next_history, depth + 1)
+        action_utilities = np.zeros(NUM_ACTIONS)
+        snapshot = env.snapshot()
+        for action in valid_actions:
+            next_seat, next_history = self.apply_action(seat, action, history)
+            action_utilities[action] = self.walk(traverser, next_seat, next_history, depth + 1)
+            env.restore(snapshot)
+        node_utility = float(strategy @ action_utilities)
+        regrets = self.regrets[infoset_id]
+        regrets[valid_actions] += action_utilities[valid_actions] - node_utility
+        if self.plus:
+            np.maximum(regrets, 0, out=regrets)
+        return node_utility
+
+    def deal(self):
+        env = self.env
+        env.reset()
+        self.start_stacks = (env.player.stack_size + env.player.total_bet,
+                             env.opponent.stack_size + env.opponent.total_bet)
+        self.stack_bucket = min(self.start_stacks) // self.stack_bucket_size
+        self.card_buckets = {}
+
+    def iterate(self, num_iterations=1):
+        # one iteration samples a deal and traverses it once for each seat
+        for _ in range(num_iterations):
+            self.deal()
+            root = self.env.snapshot()
+            small_blind_seat = 0 if self.env.player.is_small_blind else 1
+            for traverser in (0, 1):
+                self.walk(traverser, small_blind_seat, "", 0)
+                self.env.restore(root)
+            self.iterations += 1
+
+    def average_strategy(self, key, valid_actions=None):
+        valid_actions = list(range(NUM_ACTIONS)) if valid_actions is None else valid_actions
+        infoset_id = self.infoset_ids.get(key)
+        strategy = np.zeros(NUM_ACTIONS)
+        if infoset_id is None or self.strategy_sum[infoset_id, valid_actions].sum() <= 0:
+            strategy[valid_actions] = 1.0 / len(valid_actions)
+            return strategy
+        strategy[valid_actions] = self.strategy_sum[infoset_id, valid_actions]
+        return strategy / strategy.sum()
+
+    def table(self):
+        count = len(self.infoset_keys)
+        return self.infoset_keys, self.regrets[:count], self.strategy_sum[:count]
+
+    def merge(self, keys, regrets, strategy_sum):
+        # adds regret and strategy deltas computed by another solver, matching infosets by key
+        ids = np.array([self.infoset_id(key) for key in keys], dtype=np.int64)
+        if len(ids) == 0:
+            return
+        self.regrets[ids] += regrets
+        self.strategy_sum[ids] += strategy_sum
+        if self.plus:
+            np.maximum(self.regrets, 0, out=self.regrets)
+
+    def save(self, path=CHECKPOINT_PATH):
+        keys, regrets, strategy_sum = self.table()
+        # write then rename so an interrupted save never clobbers the previous checkpoint
+        temporary_path = path + ".tmp.npz"
+        np.savez(temporary_path, keys=np.array(keys, dtype=str), regrets=regrets, strategy_sum=strategy_sum,
+                 iterations=self.iterations, num_card_buckets=self.num_card_buckets,
+                 stack_bucket_size=self.stack_bucket_size, plus=self.plus)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path=CHECKPOINT_PATH, seed=None):
+        with np.load(path) as checkpoint:
+            solver = cls(int(checkpoint["num_card_buckets"]), int(checkpoint["stack_bucket_size"]),
+                         bool(checkpoint["plus"]), seed=seed, capacity=max(len(checkpoint["keys"]), 1))
+            solver.merge(checkpoint["keys"].tolist(), checkpoint["regrets"], checkpoint["strategy_sum"])
+            solver.iterations = int(checkpoint["iterations"])
+        return solver
+
+
+def run_worker(args):
+    # runs iterations from a copy of the shared table and returns only what changed
+    keys, regrets, strategy_sum, settings, num_iterations, seed = args
+    solver = CFRSolver(*settings, seed=seed, capacity=max(len(keys), 1))
+    solver.merge(keys, regrets, strategy_sum)
+    solver.iterate(num_iterations)
+    new_keys, new_regrets, new_strategy_sum = solver.table()
+    new_regrets = new_regrets.copy()
+    new_strategy_sum = new_strategy_sum.copy()
+    new_regrets[:len(keys)] -= regrets
+    new_strategy_sum[:len(keys)] -= strategy_sum
+    return new_keys, new_regrets, new_strategy_sum
+
+
+def solve(solver, num_iterations, num_workers=1, iterations_per_round=1000, checkpoint_path=None, seed=0):
+    # workers run external sampling rounds in parallel and the deltas are summed into solver after each round
+    context = mp.get_context("spawn")
+    pool = context.Pool(num_workers) if num_workers > 1 else None
+    settings = (solver.num_card_buckets, solver.stack_bucket_size, solver.plus)
+    start_time = time.time()
+    start_iterations = solver.iterations
+    seed_sequence = np.random.SeedSequence(seed)
+    rounds = 0
+    try:
+        while num_iterations > 0:
+            round_iterations = min(iterations_per_round, num_iterations)
+            if pool is None:
+                solver.iterate(round_iterations)
+            else:
+                keys, regrets, strategy_sum = solver.table()
+                shares = [round_iterations // num_workers + (worker < round_iterations % num_workers)
+                          for worker in range(num_workers)]
+                # spawn hands out new children on every call, so no two rounds share a stream
+                jobs = [(keys, regrets, strategy_sum, settings, share, worker_seed)
+                        for share, worker_seed in zip(shares, seed_sequence.spawn(num_workers)) if share > 0]
+                for delta in pool.map(run_worker, jobs):
+                    solver.merge(*delta)
+                solver.iterations += round_iterations
+            num_iterations -= round_iterations
+            rounds += 1
+            if checkpoint_path is not None:
+                solver.save(checkpoint_path)
+            print("iterations: {}, infosets: {}, iterations/s: {:.1f}".format(
+                solver.iterations, len(solver), (solver.iterations - start_iterations) / (time.time() - start_time)))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return solver
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCCFR solver for the heads-up PokerEnv game")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--iterations-per-round", type=int, default=1000)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--resume", action="store_true", help="continue from --checkpoint")
+    parser.add_argument("--buckets", type=int, default=NUM_CARD_BUCKETS)
+    parser.add_argument("--vanilla", action="store_true", help="plain regret matching instead of CFR+")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.resume and os.path.exists(args.checkpoint):
+        solver = CFRSolver.load(args.checkpoint, seed=args.seed)
+    else:
+        solver = CFRSolver(args.buckets, plus=not args.vanilla, seed=args.seed)
+    solve(solver, args.iterations, args.workers, args.iterations_per_round, args.checkpoint, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import numpy as np
+from treys import Card
+
+RANK_CHARS = "23456789TJQKA"
+SUIT_CHARS = "hdcs"
+NUM_CARDS = 52
+
+
+def create_treys_cards():
+    # card id = rank index * 4 + suit index, deuces first and hearts first within a rank
+    return np.array([Card.new(r + s) for r in RANK_CHARS for s in SUIT_CHARS], dtype=np.int64)
+
+
+TREYS_CARDS = create_treys_cards()
+TREYS_TO_ID = {int(card): card_id for card_id, card in enumerate(TREYS_CARDS)}
+
+
+def card_to_id(card):
+    return TREYS_TO_ID[card]
+
+
+def cards_to_ids(cards):
+    return np.array([TREYS_TO_ID[card] for card in cards], dtype=np.int64)
+
+
+def ids_to_cards(card_ids):
+    return [int(card) for card in TREYS_CARDS[np.asarray(card_ids, dtype=np.int64)]]
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from ReplayBuffer import ReplayBuffer
+
+CHECKPOINT_PREFIX = "checkpoint-"
+TEMPORARY_SUFFIX = ".tmp"
+STATE_FILE = "state.json"
+WEIGHTS_FILE = "weights.npz"
+OPPONENTS_FILE = "opponents.npz"
+REPLAY_DIRECTORY = "replay"
+WEIGHT_LISTS = ("model", "model_target", "optimizer")
+
+
+def checkpoint_path(directory, step):
+    # zero padded so the names sort by step
+    return os.path.join(directory, "{}{:012d}".format(CHECKPOINT_PREFIX, step))
+
+
+def list_checkpoints(directory):
+    # complete checkpoints, oldest first; a .tmp one was still being written
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(CHECKPOINT_PREFIX) and not name.endswith(TEMPORARY_SUFFIX))
+    return [os.path.join(directory, name) for name in names]
+
+
+def latest_checkpoint(directory):
+    checkpoints = list_checkpoints(directory)
+    return checkpoints[-1] if checkpoints else None
+
+
+def write_checkpoint(path, snapshot):
+    # written under a temporary name and renamed once complete, so a crash never leaves a partial checkpoint
+    temporary_path = path + TEMPORARY_SUFFIX
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+    learner_state = snapshot["learner"]
+    weights = {"{}_{}".format(name, i): weight for name in WEIGHT_LISTS for i, weight in enumerate(learner_state[name])}
+    np.savez(os.path.join(temporary_path, WEIGHTS_FILE), **weights)
+    ReplayBuffer.write_snapshot(os.path.join(temporary_path, REPLAY_DIRECTORY), learner_state["replay"])
+    opponent_index = None
+    if snapshot["opponent_pool"] is not None:
+        opponent_index, flats = snapshot["opponent_pool"]
+        np.savez(os.path.join(temporary_path, OPPONENTS_FILE),
+                 **{str(snapshot_id): flat for snapshot_id, flat in flats.items()})
+    state = {"step": snapshot["step"], "trainer": snapshot["trainer"], "update_count": learner_state["update_count"],
+             "weight_counts": {name: len(learner_state[name]) for name in WEIGHT_LISTS},
+             "opponent_pool": opponent_index}
+    with open(os.path.join(temporary_path, STATE_FILE), "w") as f:
+        json.dump(state, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path, learner, opponent_pool=None):
+    # puts the learner (and the opponent pool) back as they were saved, returns the trainer state that was passed
+    # to save. The replay buffer is memory mapped, so this is quick whatever its size.
+    with open(os.path.join(path, STATE_FILE)) as f:
+        state = json.load(f)
+    with np.load(os.path.join(path, WEIGHTS_FILE)) as data:
+        learner_state = {name: [data["{}_{}".format(name, i)] for i in range(count)]
+                         for name, count in state["weight_counts"].items()}
+    learner_state["update_count"] = state["update_count"]
+    learner_state["replay"] = ReplayBuffer.open_snapshot(os.path.join(path, REPLAY_DIRECTORY))
+    learner.set_state(learner_state)
+    if opponent_pool is not None and state["opponent_pool"] is not None:
+        with np.load(os.path.join(path, OPPONENTS_FILE)) as data:
+            flats = {int(snapshot_id): data[snapshot_id] for snapshot_id in data.files}
+        opponent_pool.set_state(state["opponent_pool"], flats)
+    return state["trainer"]
+
+
+class CheckpointManager:
+    # periodic snapshots of a DQNLearner's full state into directory/checkpoint-<step>. save() copies the state
+    # on the training thread, between updates, so the networks, optimizer and replay buffer are consistent; a
+    # background thread writes the copy while training goes on. A save that comes while the last one is still
+    # being written is skipped rather than waited for. Only the newest keep checkpoints stay on disk.
+
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep
+        self.writer = None
+        self.error = None
+        self.saved = 0
+        self.skipped = 0
+        self.snapshot_time = 0.0  # spent on the training thread
+        self.write_time = 0.0  # spent on the writer thread
+        os.makedirs(directory, exist_ok=True)
+
+    def busy(self):
+        return self.writer is not None and self.writer.is_alive()
+
+    def save(self, step, learner, trainer_state, opponent_pool=None, wait=False):
+        # trainer_state is anything json can write (epsilon, frame count, ...); returns whether a save started
+        if self.busy():
+            if not wait:
+                self.skipped += 1
+                return False
+            self.writer.join()
+        self.raise_error()
+        start = time.perf_counter()
+        snapshot = {"step": step, "trainer": trainer_state, "learner": learner.get_state(),
+                    "opponent_pool": None if opponent_pool is None else opponent_pool.get_state()}
+        self.snapshot_time += time.perf_counter() - start
+        self.writer = threading.Thread(target=self.write, args=(checkpoint_path(self.directory, step), snapshot))
+        self.writer.start()
+        return True
+
+    def write(self, path, snapshot):
+        start = time.perf_counter()
+        try:
+            write_checkpoint(path, snapshot)
+            self.rotate()
+        except Exception as error:  # surfaced on the training thread by the next save or wait
+            self.error = error
+            return
+        self.write_time += time.perf_counter() - start
+        self.saved += 1
+
+    def rotate(self):
+        for path in list_checkpoints(self.directory)[:-self.keep]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def wait(self):
+        if self.writer is not None:
+            self.writer.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("writing a checkpoint failed") from error
+
+    def latest(self):
+        return latest_checkpoint(self.directory)
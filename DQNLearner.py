@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+
+import tensorflow as tf
+from tensorflow import keras
+
+
+class DQNLearner:
+    # DQN updates for a Keras Q-network whose inputs are (batch, 1, observation_size), as build_model makes them.
+    # The train step is one tf.function graph: target values, loss, gradients and the optimizer update. A sampler
+    # thread keeps up to prefetch minibatches ready as tensors, so each update only waits on the graph.
+    # double_dqn picks the next action with the online network and values it with the target network.
+
+    def __init__(self, model, model_target, replay_buffer, num_actions, gamma=0.99, batch_size=32,
+                 learning_rate=0.001, double_dqn=False, prefetch=4):
+        self.model = model
+        self.model_target = model_target
+        self.replay_buffer = replay_buffer
+        self.num_actions = num_actions
+        self.gamma = gamma
+        self.batch_size = batch_size
+        self.double_dqn = double_dqn
+        self.prefetch = prefetch
+        self.optimizer = keras.optimizers.Adam(learning_rate=learning_rate, clipnorm=1.0)
+        self.loss_function = keras.losses.Huber()
+        # the replay buffer is shared with the sampler thread, every access goes through this lock
+        self.lock = threading.Lock()
+        self.batches = queue.Queue(maxsize=prefetch)
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.sampler_error = None
+        self.update_count = 0
+        self.train_time = 0.0
+        self.compiled_train_step = tf.function(self.graph_train_step)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add(self, state, action, reward, next_state, done):
+        with self.lock:
+            self.replay_buffer.add(state, action, reward, next_state, done)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        with self.lock:
+            self.replay_buffer.add_batch(states, actions, rewards, next_states, dones)
+
+    def ready(self):
+        return len(self.replay_buffer) > self.batch_size
+
+    def start(self):
+        if self.sampler is None:
+            self.stop_event.clear()
+            self.sampler_error = None
+            self.sampler = threading.Thread(target=self.sample_loop, daemon=True)
+            self.sampler.start()
+
+    def stop(self):
+        if self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+            self.sampler = None
+        # batches sampled before a stop may be stale by the next start
+        while not self.batches.empty():
+            self.batches.get_nowait()
+
+    def sample_batch(self):
+        # also returns the buffer's write count at sampling time, see train_step
+        with self.lock:
+            states, actions, rewards, next_states, dones, indices, weights = \
+                self.replay_buffer.sample(self.batch_size)
+            added = self.replay_buffer.added
+        tensors = tuple(tf.convert_to_tensor(array) for array in (states, actions, rewards, next_states, dones,
+                                                                   weights))
+        return tensors, indices, added
+
+    def sample_loop(self):
+        try:
+            while not self.stop_event.is_set():
+                if not self.ready():
+                    time.sleep(0.001)
+                    continue
+                batch = self.sample_batch()
+                while not self.stop_event.is_set():
+                    try:
+                        self.batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as error:  # re-raised by train_step on the training thread
+            self.sampler_error = error
+
+    def next_batch(self):
+        while True:
+            try:
+                return self.batches.get(timeout=0.1)
+            except queue.Empty:
+                if self.sampler_error is not None:
+                    error = self.sampler_error
+                    self.sampler = None
+                    raise RuntimeError("the replay sampler thread failed") from error
+
+    def graph_train_step(self, states, actions, rewards, next_states, dones, weights):
+        next_states = tf.expand_dims(next_states, 1)
+        future_rewards = self.model_target(next_states, training=False)
+        if self.double_dqn:
+            next_actions = tf.argmax(self.model(next_states, training=False), axis=1)
+            future_values = tf.gather(future_rewards, next_actions, axis=1, batch_dims=1)
+        else:
+            future_values = tf.reduce_max(future_rewards, axis=1)
+        # same target as Agent.py always used: -1 on the last frame
+        updated_q_values = rewards + self.gamma * future_values
+        updated_q_values = updated_q_values * (1 - dones) - dones
+        masks = tf.one_hot(actions, self.num_actions)
+        with tf.GradientTape() as tape:
+            q_values = self.model(tf.expand_dims(states, 1), training=True)
+            q_action = tf.reduce_sum(q_values * masks, axis=1)
+            loss = self.loss_function(tf.expand_dims(updated_q_values, 1), tf.expand_dims(q_action, 1),
+                                      sample_weight=weights)
+        grads = tape.gradient(loss, self.model.trainable_variables)
+        self.optimizer.apply_gradients(zip(grads, self.model.trainable_variables))
+        return loss, updated_q_values - q_action
+
+    def train_step(self):
+        self.start()
+        tensors, indices, added = self.next_batch()
+        loss, td_errors = self.compiled_train_step(*tensors)
+        if self.replay_buffer.prioritized:
+            with self.lock:
+                # a prefetched batch can be a few batches old, slots written since then hold other transitions
+                fresh = ~self.replay_buffer.overwritten_since(indices, added)
+                self.replay_buffer.update_priorities(indices[fresh], td_errors.numpy()[fresh])
+        self.update_count += 1
+        return loss
+
+    def train(self, num_steps=1):
+        # num_steps gradient steps back to back, returns how many ran
+        if not self.ready():
+            return 0
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            self.train_step()
+        self.train_time += time.perf_counter() - start
+        return num_steps
+
+    def optimizer_weights(self):
+        # newer keras optimizers have a variables list, older ones a variables() method
+        variables = self.optimizer.variables
+        return [variable.numpy() for variable in (variables() if callable(variables) else variables)]
+
+    def set_optimizer_weights(self, weights):
+        variables = self.optimizer.variables
+        variables = variables() if callable(variables) else variables
+        if len(variables) != len(weights):
+            # the slots are only created by the first update, make them now so they can be assigned
+            self.optimizer.build(self.model.trainable_variables)
+            variables = self.optimizer.variables
+            variables = variables() if callable(variables) else variables
+        for variable, weight in zip(variables, weights):
+            variable.assign(weight)
+
+    def get_state(self):
+        # copies of the networks, the optimizer and the replay buffer; call it between train steps so they agree
+        with self.lock:
+            replay = self.replay_buffer.snapshot()
+        return {"model": self.model.get_weights(), "model_target": self.model_target.get_weights(),
+                "optimizer": self.optimizer_weights(), "update_count": self.update_count, "replay": replay}
+
+    def set_state(self, state):
+        # state as get_state returns it, except "replay" is a ReplayBuffer to train from
+        self.stop()
+        self.model.set_weights(state["model"])
+        self.model_target.set_weights(state["model_target"])
+        self.set_optimizer_weights(state["optimizer"])
+        self.update_count = state["update_count"]
+        with self.lock:
+            self.replay_buffer = state["replay"]
+
+    def sync_target(self):
+        self.model_target.set_weights(self.model.get_weights())
+
+    def updates_per_second(self):
+        # over the time spent in train, so acting time does not dilute it
+        return self.update_count / self.train_time if self.train_time > 0 else 0.0
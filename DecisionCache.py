@@ -0,0 +1,172 @@
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from ObservationEncoder import encode_observations
+from OpponentServer import predict_q_values
+
+DEFAULT_CAPACITY = 1 << 16
+
+
+def canonical_cards(hand, board):
+    # card ids with the suits renamed in order of first appearance, hand then board each sorted high to low.
+    # The renaming is a bijection, so states sharing a result are suit isomorphic; a few isomorphic ones with
+    # equal ranks in different suits still come out different, which only costs a cache miss. Only sound for a
+    # model that is itself suit invariant, the network sees the renamed cards instead of the real ones.
+    suits = {}
+    cards = []
+    for group in (sorted(hand, reverse=True), sorted(board, reverse=True)):
+        for card in group:
+            suit = suits.setdefault(card & 3, len(suits))
+            cards.append(card - (card & 3) + suit)
+    return tuple(cards)
+
+
+class DecisionCache:
+    # Q-values of a policy memoized by information set, for serving the same situations over and over without a
+    # forward pass. The key is the hole cards and board as dealt, both Positions, and pot, stacks and amount to
+    # call in chip_bucket chip steps. A miss evaluates the key's own representative state, the same cards and
+    # bucket floors, so an entry never depends on which state filled it; with chip_bucket 1 that is exactly the
+    # observation get_observation encodes and the cache answers what the model would. suit_isomorphic shares
+    # entries between suit-isomorphic spots through canonical_cards, for suit invariant models only. The raw
+    # Q-values are stored and the valid action mask applied on the way out, so states differing only in what is
+    # legal share one entry. Entries belong to the model that made them: switching models (an OpponentPool
+    # drawing a new opponent every hand) keeps every model's entries, and switching back finds them again. At
+    # most capacity entries are kept over all models, least recently used go first.
+
+    def __init__(self, model=None, num_actions=5, capacity=DEFAULT_CAPACITY, chip_bucket=1, suit_isomorphic=False):
+        self.num_actions = num_actions
+        self.capacity = capacity
+        self.chip_bucket = chip_bucket
+        self.suit_isomorphic = suit_isomorphic
+        self.entries = OrderedDict()  # (model token, key) -> list of Q-values, most recently used last
+        # tokens are never reused, so entries of a model that is gone can only age out, never be found again
+        self.model_tokens = weakref.WeakKeyDictionary()
+        self.next_token = 0
+        self.model = None
+        self.model_token = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.update_model(model)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update_model(self, model):
+        # the model lookups are answered for from now on
+        self.model = model
+        self.model_token = None if model is None else self.token(model)
+
+    def token(self, model):
+        token = self.model_tokens.get(model)
+        if token is None:
+            token = self.new_token(model)
+        return token
+
+    def new_token(self, model):
+        token = self.next_token
+        self.next_token += 1
+        self.model_tokens[model] = token
+        return token
+
+    def invalidate(self, model=None):
+        # for a model (the current one by default) whose weights changed in place: its old entries are orphaned
+        # and age out of the LRU
+        model = self.model if model is None else model
+        if model is None:
+            return
+        self.invalidations += 1
+        token = self.new_token(model)
+        if model is self.model:
+            self.model_token = token
+
+    def infoset_key(self, hand, board, cur_position, other_position, pot, cur_stack, other_stack, call_amount):
+        # hand and board are Cards ids, positions are Position values, amounts are chips
+        bucket = self.chip_bucket
+        cards = canonical_cards(hand, board) if self.suit_isomorphic else tuple(hand) + tuple(board)
+        return (cards, cur_position, other_position, pot // bucket, cur_stack // bucket,
+                other_stack // bucket, call_amount // bucket)
+
+    def representatives(self, keys):
+        # encode_observations arguments for the state each key stands for
+        num_keys = len(keys)
+        hands = np.zeros((num_keys, 2), dtype=np.int64)
+        community_cards = np.zeros((num_keys, 5), dtype=np.int64)
+        community_count = np.zeros(num_keys, dtype=np.int64)
+        for row, key in enumerate(keys):
+            cards = key[0]
+            hands[row] = cards[:2]
+            community_cards[row, :len(cards) - 2] = cards[2:]
+            community_count[row] = len(cards) - 2
+        numbers = np.array([key[1:] for key in keys], dtype=np.int64).reshape(num_keys, 6)
+        amounts = numbers[:, 2:] * self.chip_bucket
+        return (hands, community_cards, community_count, numbers[:, 0], numbers[:, 1], amounts[:, 0], amounts[:, 1],
+                amounts[:, 2], amounts[:, 3])
+
+    def fill(self, keys):
+        # one forward pass for every key, in order, and stores the results
+        q_values = predict_q_values(self.model, encode_observations(*self.representatives(keys))).tolist()
+        for key, values in zip(keys, q_values):
+            self.store((self.model_token, key), values)
+        return q_values
+
+    def store(self, entry, values):
+        self.entries[entry] = values
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, key):
+        entry = (self.model_token, key)
+        values = self.entries.get(entry)
+        if values is None:
+            self.misses += 1
+            return self.fill([key])[0]
+        self.hits += 1
+        self.entries.move_to_end(entry)
+        return values
+
+    def q_values(self, key, valid_actions):
+        # masked like OpponentServer.mask_q_values
+        values = self.lookup(key)
+        valid = set(valid_actions)
+        return [value if action in valid else value - 1e9 for action, value in enumerate(values)]
+
+    def act(self, key, valid_actions):
+        # highest Q-value among valid_actions, lowest action on ties like np.argmax as long as valid_actions is in
+        # ascending order, which PokerEnv's always are
+        values = self.lookup(key)
+        return max(valid_actions, key=values.__getitem__)
+
+    def q_values_batch(self, keys, valid_masks):
+        # (len(keys), num_actions) masked Q-values; all misses, duplicates included once, share one forward pass
+        token = self.model_token
+        found = [self.entries.get((token, key)) for key in keys]
+        missing = []
+        for key, values in zip(keys, found):
+            if values is None:
+                missing.append(key)
+            else:
+                self.entries.move_to_end((token, key))
+        missing = list(dict.fromkeys(missing))
+        filled = dict(zip(missing, self.fill(missing))) if missing else {}
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        rows = [filled[key] if values is None else values for key, values in zip(keys, found)]
+        q_values = np.array(rows, dtype=np.float32).reshape(len(keys), self.num_actions)
+        return q_values - (~np.asarray(valid_masks, dtype=bool)) * 1e9
+
+    def act_batch(self, keys, valid_masks):
+        return np.argmax(self.q_values_batch(keys, valid_masks), axis=1)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate(), "size": len(self.entries),
+                "capacity": self.capacity, "evictions": self.evictions, "invalidations": self.invalidations,
+                "models": len(self.model_tokens)}
@@ -0,0 +1,309 @@
+import os
+from collections import namedtuple
+from functools import lru_cache
+from itertools import chain, combinations, permutations
+from math import comb
+
+import numpy as np
+
+from Cards import NUM_CARDS, cards_to_ids
+from HandEvaluator import get_hand_evaluator, CARD_RANK_KEYS, CARD_SUIT_CODES, CARD_SUITS, CARD_RANK_BITS
+
+PREFLOP_EQUITY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "preflop_equity.npz")
+PREFLOP_MATCHUPS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "preflop_matchups.npz")
+PREFLOP_RUNOUTS = comb(NUM_CARDS - 4, 5)
+SUIT_PERMUTATIONS = np.array(list(permutations(range(4))), dtype=np.int64)
+# card id -> card id under each suit relabeling
+SUIT_PERMUTED_CARDS = (np.arange(NUM_CARDS) // 4 * 4 + SUIT_PERMUTATIONS[:, np.arange(NUM_CARDS) % 4]).tolist()
+Z_SCORE = 1.96  # 95% confidence bounds
+RUNOUT_CHUNK = 1 << 18  # boards evaluated at once when enumerating runouts
+
+EquityEstimate = namedtuple("EquityEstimate", ["equity", "lower", "upper", "samples"])
+RunoutEquity = namedtuple("RunoutEquity", ["equity", "win", "tie", "runouts"])
+
+
+def canonical_cards(hand, board):
+    # smallest (hand, board) over all 24 suit relabelings, so suit-isomorphic spots share a key
+    hand = np.asarray(hand, dtype=np.int64)
+    board = np.asarray(board, dtype=np.int64)
+    best = None
+    for permutation in SUIT_PERMUTATIONS:
+        key = (tuple(sorted((hand // 4 * 4 + permutation[hand % 4]).tolist())),
+               tuple(sorted((board // 4 * 4 + permutation[board % 4]).tolist())))
+        if best is None or key < best:
+            best = key
+    return best
+
+
+def canonical_matchup(hand, opponent_hand, board):
+    # canonical_cards for two known 2-card hands, hand stays first since equity is from its side. Plain Python
+    # ints through the SUIT_PERMUTED_CARDS lists: this runs on every all-in, NumPy's per-call overhead dominated
+    a, b = int(hand[0]), int(hand[1])
+    c, d = int(opponent_hand[0]), int(opponent_hand[1])
+    board = [int(card) for card in board]
+    best = None
+    for permuted in SUIT_PERMUTED_CARDS:
+        w, x, y, z = permuted[a], permuted[b], permuted[c], permuted[d]
+        key = ((w, x) if w < x else (x, w), (y, z) if y < z else (z, y),
+               tuple(sorted([permuted[card] for card in board])) if board else ())
+        if best is None or key < best:
+            best = key
+    return best
+
+
+@lru_cache(maxsize=None)
+def runout_indices(deck_size, missing):
+    # every way to pick the missing board cards out of deck_size cards, as rows of deck positions
+    count = comb(deck_size, missing)
+    return np.fromiter(chain.from_iterable(combinations(range(deck_size), missing)), dtype=np.int8,
+                       count=count * missing).reshape(count, missing)
+
+
+def preflop_index(hand):
+    # 13x13 grid: pairs on the diagonal, suited above it, offsuit below it
+    high, low = max(hand[0] // 4, hand[1] // 4), min(hand[0] // 4, hand[1] // 4)
+    if hand[0] % 4 == hand[1] % 4:
+        return low, high
+    return high, low
+
+
+def estimate_from_outcomes(outcomes):
+    # outcomes are 1 win, 0.5 tie, 0 loss per sampled runout
+    samples = len(outcomes)
+    equity = float(outcomes.mean())
+    margin = Z_SCORE * float(outcomes.std()) / float(np.sqrt(samples))
+    return EquityEstimate(equity, max(equity - margin, 0.0), min(equity + margin, 1.0), samples)
+
+
+class EquityCalculator:
+
+    def __init__(self, samples=10000, cache_size=65536, seed=None, preflop_path=PREFLOP_EQUITY_PATH,
+                 preflop_matchups_path=PREFLOP_MATCHUPS_PATH):
+        self.samples = samples
+        self.rng = np.random.default_rng(seed)
+        self.evaluator = get_hand_evaluator()
+        self.preflop_equity = None
+        self.preflop_stderr = None
+        self.preflop_samples = 0
+        if preflop_path is not None and os.path.exists(preflop_path):
+            with np.load(preflop_path) as tables:
+                self.preflop_equity = tables["equity"]
+                self.preflop_stderr = tables["stderr"]
+                self.preflop_samples = int(tables["samples"])
+        self.cached_equity = lru_cache(maxsize=cache_size)(self.compute_canonical_equity)
+        self.cached_runout_equity = lru_cache(maxsize=cache_size)(self.compute_runout_equity)
+        # canonical preflop matchup -> (wins, ties), read the first time a preflop runout is asked for
+        self.preflop_matchups_path = preflop_matchups_path
+        self.preflop_matchups = None
+
+    def equity(self, hand, community_cards=(), samples=None):
+        # hand and community_cards are treys ints, as on Player.hand and PokerEnv.community_cards
+        return self.equity_ids(cards_to_ids(hand), cards_to_ids(community_cards), samples)
+
+    def equity_ids(self, hand, community_cards=(), samples=None):
+        samples = samples or self.samples
+        if len(community_cards) == 0 and self.preflop_equity is not None:
+            row, col = preflop_index(hand)
+            equity = float(self.preflop_equity[row, col])
+            margin = Z_SCORE * float(self.preflop_stderr[row, col])
+            return EquityEstimate(equity, max(equity - margin, 0.0), min(equity + margin, 1.0), self.preflop_samples)
+        canonical_hand, canonical_board = canonical_cards(hand, community_cards)
+        return self.cached_equity(canonical_hand, canonical_board, samples)
+
+    def runout_equity(self, hand, opponent_hand, community_cards=()):
+        # treys ints, like equity
+        return self.runout_equity_ids(cards_to_ids(hand), cards_to_ids(opponent_hand), cards_to_ids(community_cards))
+
+    def runout_equity_ids(self, hand, opponent_hand, community_cards=()):
+        # exact equity of hand against a known opponent_hand over every remaining board; suit-isomorphic spots
+        # share one cache entry, so a repeated spot is a lookup
+        key = canonical_matchup(hand, opponent_hand, community_cards)
+        if len(community_cards) == 0:
+            # a preflop spot enumerates 1.7M boards, the precomputed table answers it instead when there is one
+            counts = self.get_preflop_matchups().get(key[:2])
+            if counts is not None:
+                wins, ties = counts
+                return RunoutEquity((wins + 0.5 * ties) / PREFLOP_RUNOUTS, wins / PREFLOP_RUNOUTS,
+                                    ties / PREFLOP_RUNOUTS, PREFLOP_RUNOUTS)
+        return self.cached_runout_equity(*key)
+
+    def get_preflop_matchups(self):
+        if self.preflop_matchups is None:
+            self.preflop_matchups = {}
+            if self.preflop_matchups_path is not None and os.path.exists(self.preflop_matchups_path):
+                with np.load(self.preflop_matchups_path) as table:
+                    cards = table["cards"].tolist()
+                    self.preflop_matchups = {(tuple(row[:2]), tuple(row[2:])): counts for row, counts in
+                                             zip(cards, zip(table["wins"].tolist(), table["ties"].tolist()))}
+        return self.preflop_matchups
+
+    def cache_info(self):
+        return self.cached_equity.cache_info()
+
+    def runout_cache_info(self):
+        return self.cached_runout_equity.cache_info()
+
+    def compute_runout_equity(self, hand, opponent_hand, board):
+        hands = np.array([hand, opponent_hand], dtype=np.int64)
+        board = np.array(board, dtype=np.int64)
+        known = np.zeros(NUM_CARDS, dtype=bool)
+        known[hands.ravel()] = True
+        known[board] = True
+        deck = np.flatnonzero(~known)
+        indices = runout_indices(len(deck), 5 - len(board))
+        wins = 0
+        ties = 0
+        for start in range(0, len(indices), RUNOUT_CHUNK):
+            drawn = deck[indices[start:start + RUNOUT_CHUNK]]
+            boards = np.hstack([np.broadcast_to(board, (len(drawn), len(board))), drawn])
+            scores = self.evaluator.evaluate_boards(hands, boards)
+            wins += int((scores[0] < scores[1]).sum())
+            ties += int((scores[0] == scores[1]).sum())
+        runouts = len(indices)
+        return RunoutEquity((wins + 0.5 * ties) / runouts, wins / runouts, ties / runouts, runouts)
+
+    def compute_canonical_equity(self, hand, board, samples):
+        return self.simulate(np.array(hand), np.array(board, dtype=np.int64), samples)
+
+    def simulate(self, hand, board, samples):
+        known = np.zeros(NUM_CARDS, dtype=bool)
+        known[hand] = True
+        known[board] = True
+        deck = np.flatnonzero(~known)
+        missing = 5 - len(board)
+        if missing == 0:
+            # river: every opponent hand exactly
+            opponent_hands = np.array(list(combinations(deck, 2)), dtype=np.int64)
+            boards = np.broadcast_to(board, (len(opponent_hands), 5))
+            return self.showdown(hand, opponent_hands, boards, exact=True)
+        draws = np.argsort(self.rng.random((samples, len(deck))), axis=1)[:, :2 + missing]
+        drawn = deck[draws]
+        boards = np.hstack([np.broadcast_to(board, (samples, len(board))), drawn[:, 2:]])
+        return self.showdown(hand, drawn[:, :2], boards)
+
+    def showdown(self, hand, opponent_hands, boards, exact=False):
+        count = len(boards)
+        player_score = self.evaluator.evaluate_batch(np.hstack([np.broadcast_to(hand, (count, 2)), boards]))
+        opponent_score = self.evaluator.evaluate_batch(np.hstack([opponent_hands, boards]))
+        outcomes = (player_score < opponent_score) + 0.5 * (player_score == opponent_score)
+        if exact:
+            equity = float(outcomes.mean())
+            return EquityEstimate(equity, equity, equity, count)
+        return estimate_from_outcomes(outcomes)
+
+
+def build_preflop_table(samples=200000, seed=0):
+    calculator = EquityCalculator(seed=seed, preflop_path=None)
+    equity = np.zeros((13, 13))
+    stderr = np.zeros((13, 13))
+    for high in range(13):
+        for low in range(high + 1):
+            for suited in ((False, True) if high != low else (False,)):
+                hand = np.array([high * 4, low * 4 + (0 if suited else 1)])
+                estimate = calculator.simulate(hand, np.zeros(0, dtype=np.int64), samples)
+                row, col = preflop_index(hand)
+                equity[row, col] = estimate.equity
+                stderr[row, col] = np.sqrt(estimate.equity * (1 - estimate.equity) / samples)
+    return equity, stderr
+
+
+def save_preflop_table(path=PREFLOP_EQUITY_PATH, samples=200000):
+    equity, stderr = build_preflop_table(samples)
+    np.savez_compressed(path, equity=equity, stderr=stderr, samples=samples)
+
+
+def preflop_matchup_keys():
+    # every canonical (hand, opponent_hand) pair: one hand per preflop class against every two other cards
+    keys = set()
+    for high in range(13):
+        for low in range(high + 1):
+            for suited in ((False, True) if high != low else (False,)):
+                hand = (high * 4, low * 4 + (0 if suited else 1))
+                deck = [card for card in range(NUM_CARDS) if card not in hand]
+                for opponent_hand in combinations(deck, 2):
+                    keys.add(canonical_matchup(hand, opponent_hand, ())[:2])
+    return sorted(keys)
+
+
+class AllBoards:
+    # every 5-card board out of the full deck with what scoring a hand on it needs: the board's rank multiset,
+    # its flush candidates and a card bitmask to drop the boards a matchup's hole cards block. Non-flush ranks
+    # are looked up once per rank multiset instead of once per board.
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        boards = runout_indices(NUM_CARDS, 5).astype(np.int64)
+        self.multisets, self.multiset_ids = np.unique(CARD_RANK_KEYS[boards].sum(axis=1), return_inverse=True)
+        self.card_bits = (np.uint64(1) << boards.astype(np.uint64)).sum(axis=1, dtype=np.uint64)
+        suit_codes = CARD_SUIT_CODES[boards].sum(axis=1)
+        self.flush_candidates = []
+        for suit in range(4):
+            counts = suit_codes >> (3 * suit) & 7
+            rows = np.flatnonzero(counts >= 3)
+            cards = boards[rows]
+            masks = np.where(CARD_SUITS[cards] == suit, CARD_RANK_BITS[cards], 0).sum(axis=1)
+            self.flush_candidates.append((rows, counts[rows], masks))
+
+    def scores(self, hand):
+        # rank of hand on every board; boards holding one of its cards get a meaningless value
+        hand = np.asarray(hand, dtype=np.int64)
+        rank_keys = self.evaluator.rank_keys
+        indices = np.searchsorted(rank_keys, self.multisets + CARD_RANK_KEYS[hand].sum())
+        scores = self.evaluator.rank_values[np.minimum(indices, len(rank_keys) - 1)][self.multiset_ids]
+        for suit, (rows, counts, masks) in enumerate(self.flush_candidates):
+            in_suit = CARD_SUITS[hand] == suit
+            flush = counts + in_suit.sum() >= 5
+            flush_rows = rows[flush]
+            # or, not sum: on a blocked board a hole card can repeat a board card
+            flush_masks = masks[flush] | CARD_RANK_BITS[hand[in_suit]].sum()
+            scores[flush_rows] = np.minimum(scores[flush_rows], self.evaluator.flush_ranks[flush_masks])
+        return scores
+
+    def blocked(self, cards):
+        bits = np.uint64(sum(1 << int(card) for card in cards))
+        return (self.card_bits & bits) != 0
+
+
+def build_preflop_matchup_table():
+    # exact wins and ties of every canonical preflop matchup over its 1712304 boards; each pair of hands is
+    # enumerated once for both sides, about 25 ms each
+    boards = AllBoards(get_hand_evaluator())
+    keys = preflop_matchup_keys()
+    wins = np.zeros(len(keys), dtype=np.int32)
+    ties = np.zeros(len(keys), dtype=np.int32)
+    positions = {key: i for i, key in enumerate(keys)}
+    done = np.zeros(len(keys), dtype=bool)
+    hand = None
+    for i, (key_hand, opponent_hand) in enumerate(keys):
+        if done[i]:
+            continue
+        if key_hand != hand:
+            # keys are sorted, so each hand's scores are worked out once
+            hand = key_hand
+            hand_scores = boards.scores(hand)
+        opponent_scores = boards.scores(opponent_hand)
+        open_boards = ~boards.blocked(hand + opponent_hand)
+        wins[i] = np.count_nonzero(open_boards & (hand_scores < opponent_scores))
+        ties[i] = np.count_nonzero(open_boards & (hand_scores == opponent_scores))
+        # the same matchup seen from the other side
+        mirror = positions[canonical_matchup(opponent_hand, hand, ())[:2]]
+        wins[mirror] = PREFLOP_RUNOUTS - wins[i] - ties[i]
+        ties[mirror] = ties[i]
+        done[i] = done[mirror] = True
+    cards = np.array([hand + opponent_hand for hand, opponent_hand in keys], dtype=np.int8)
+    return cards, wins, ties
+
+
+def save_preflop_matchup_table(path=PREFLOP_MATCHUPS_PATH):
+    cards, wins, ties = build_preflop_matchup_table()
+    np.savez_compressed(path, cards=cards, wins=wins, ties=ties)
+
+
+EQUITY_CALCULATOR = None
+
+
+def get_equity_calculator():
+    global EQUITY_CALCULATOR
+    if EQUITY_CALCULATOR is None:
+        EQUITY_CALCULATOR = EquityCalculator()
+    return EQUITY_CALCULATOR
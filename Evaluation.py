@@ -0,0 +1,316 @@
+import argparse
+import json
+import multiprocessing as mp
+import queue
+import sys
+import time
+
+import numpy as np
+
+from BatchPokerEnv import BatchPokerEnv, BOARD_OFFSET, FOLD, CHECK, CALL, MIN_RAISE, BIG_RAISE
+from Equity import get_equity_calculator
+from OpponentServer import predict_q_values, mask_q_values
+from PokerEnv import INITIAL_STACK_SIZE, BIG_BLIND
+from Seeding import spawn_seeds
+
+Z_SCORE = 1.96  # 95% confidence intervals
+TWO_PAIR_RANK = 3325  # HandEvaluator ranks at or below this are two pair or better
+ONE_PAIR_RANK = 6185
+STACK_HASH_INDEX = 52
+# raises are masked after this many actions in a hand: deterministic policies can otherwise keep "raising"
+# zero chips into an all-in player forever
+MAX_ACTIONS_PER_HAND = 24
+SPLITMIX_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+SPLITMIX_MUL_1 = np.uint64(0xBF58476D1CE4E5B9)
+SPLITMIX_MUL_2 = np.uint64(0x94D049BB133111EB)
+
+
+def splitmix64(x):
+    # counter based hash, the same (seed, pair, hand) always gives the same cards in any process
+    x = x + SPLITMIX_GAMMA
+    x = (x ^ (x >> np.uint64(30))) * SPLITMIX_MUL_1
+    x = (x ^ (x >> np.uint64(27))) * SPLITMIX_MUL_2
+    return x ^ (x >> np.uint64(31))
+
+
+class RunningStats:
+    # streaming mean and variance, batches and other workers are merged with Chan's formula
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add_batch(self, values):
+        if len(values):
+            self.merge(RunningStats(len(values), float(np.mean(values)), float(np.var(values) * len(values))))
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def stderr(self):
+        if self.count < 2:
+            return float("inf")
+        return float(np.sqrt(self.m2 / (self.count - 1) / self.count))
+
+    def as_tuple(self):
+        return self.count, self.mean, self.m2
+
+
+class DuplicateBatchPokerEnv(BatchPokerEnv):
+    # tables 2k and 2k + 1 get identical stacks and cards for every hand; the evaluated policies swap seats
+    # between them, so the luck of the deal cancels out when the pair is scored together.
+    # Stacks are dealt fresh every hand, so hands are independent and nobody stays busted.
+
+    def __init__(self, n_pairs, seed=0):
+        self.deal_seed = np.uint64(seed)
+        self.hand_number = np.zeros(n_pairs * 2, dtype=np.uint64)
+        super().__init__(n_pairs * 2, seed)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.deal_seed = np.uint64(seed)
+        self.hand_number[:] = 0
+        self.is_small_blind[:, 0] = False
+        self.is_small_blind[:, 1] = True
+        self.reset_boards(self.rows)
+        return self.get_observations()
+
+    def reset_tables(self, tables):
+        pass
+
+    def reset_boards(self, tables):
+        hashes = self.deal_hashes(tables)
+        rand_stack = (hashes[:, STACK_HASH_INDEX] % np.uint64(INITIAL_STACK_SIZE * 2 - 3)).astype(np.int64) + 4
+        self.stack[tables, 0] = rand_stack
+        self.stack[tables, 1] = INITIAL_STACK_SIZE * 2 - rand_stack
+        self.pending_hashes = hashes
+        super().reset_boards(tables)
+        self.hand_number[tables] += np.uint64(1)
+
+    def deal_hashes(self, tables):
+        pairs = (np.asarray(tables) // 2).astype(np.uint64)
+        keys = splitmix64(self.deal_seed ^ splitmix64((pairs << np.uint64(32)) + self.hand_number[tables]))
+        return splitmix64(keys[:, None] + np.arange(STACK_HASH_INDEX + 1, dtype=np.uint64))
+
+    def deal(self, tables):
+        self.cards[tables] = np.argsort(self.pending_hashes[:, :STACK_HASH_INDEX], axis=1)[:, :9]
+
+
+class RandomPolicy:
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def act(self, env, tables, observations, valid_masks):
+        return np.argmax(np.where(valid_masks, self.rng.random(valid_masks.shape), -1), axis=1)
+
+
+class ModelPolicy:
+    # greedy over the valid actions, for Keras models and NumpyPolicy alike
+
+    def __init__(self, model):
+        self.model = model
+
+    def act(self, env, tables, observations, valid_masks):
+        if len(tables) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.argmax(mask_q_values(predict_q_values(self.model, observations), valid_masks), axis=1)
+
+
+class RuleBasedPolicy:
+    # raise strong hands, call medium ones, check or fold the rest; preflop strength is the equity table,
+    # postflop it is the made hand class
+
+    def __init__(self, preflop_raise=0.6, preflop_call=0.45):
+        self.preflop_raise = preflop_raise
+        self.preflop_call = preflop_call
+        self.preflop_equity = get_equity_calculator().preflop_equity
+
+    def strength(self, env, tables):
+        seats = env.to_act[tables]
+        hands = env.cards[tables[:, None], seats[:, None] * 2 + np.arange(2)]
+        counts = env.community_count[tables]
+        strong = np.zeros(len(tables), dtype=bool)
+        medium = np.zeros(len(tables), dtype=bool)
+        preflop = counts == 0
+        if preflop.any():
+            ranks = hands[preflop] // 4
+            high, low = ranks.max(axis=1), ranks.min(axis=1)
+            suited = hands[preflop, 0] % 4 == hands[preflop, 1] % 4
+            equity = self.preflop_equity[np.where(suited, low, high), np.where(suited, high, low)]
+            strong[preflop] = equity >= self.preflop_raise
+            medium[preflop] = equity >= self.preflop_call
+        for count in (3, 4, 5):
+            street = counts == count
+            if street.any():
+                board = env.cards[tables[street], BOARD_OFFSET:BOARD_OFFSET + count]
+                rank = env.evaluator.evaluate_batch(np.hstack([hands[street], board]))
+                strong[street] = rank <= TWO_PAIR_RANK
+                medium[street] = rank <= ONE_PAIR_RANK
+        return strong, medium
+
+    def act(self, env, tables, observations, valid_masks):
+        strong, medium = self.strength(env, tables)
+        passive = np.where(valid_masks[:, CHECK], CHECK, FOLD)
+        calling = np.where(medium & valid_masks[:, CALL], CALL, passive)
+        return np.where(strong & valid_masks[:, BIG_RAISE], BIG_RAISE, calling)
+
+
+def load_policy(spec, seed=None):
+    # "random", "rule", "keras:<path>" for a TensorFlow model, anything else is an h5 file for NumpyPolicy
+    if spec == "random":
+        return RandomPolicy(seed)
+    if spec == "rule":
+        return RuleBasedPolicy()
+    if spec.startswith("keras:"):
+        from tensorflow import keras
+        return ModelPolicy(keras.models.load_model(spec[len("keras:"):], compile=False))
+    from NumpyPolicy import NumpyPolicy
+    return ModelPolicy(NumpyPolicy.load(spec))
+
+
+class DuplicateMatch:
+    # policy_a sits in seat 0 on even tables and seat 1 on odd tables, policy_b takes the other seat
+
+    def __init__(self, policy_a, policy_b, n_pairs, seed=0):
+        self.policies = (policy_a, policy_b)
+        self.env = DuplicateBatchPokerEnv(n_pairs, seed)
+        self.seat_a = self.env.rows % 2
+        self.pending = [[] for _ in range(self.env.n_tables)]
+        self.hand_actions = np.zeros(self.env.n_tables, dtype=np.int64)
+
+    def step(self):
+        # returns policy_a's duplicate result in chips per hand for every pair that finished a hand on both tables
+        env = self.env
+        observations = env.get_observations()
+        valid_masks = env.get_valid_action_mask()
+        valid_masks[self.hand_actions >= MAX_ACTIONS_PER_HAND, MIN_RAISE:] = False
+        actions = np.zeros(env.n_tables, dtype=np.int64)
+        a_to_act = env.to_act == self.seat_a
+        for policy, turn in zip(self.policies, (a_to_act, ~a_to_act)):
+            tables = env.rows[turn]
+            if len(tables):
+                actions[turn] = policy.act(env, tables, observations[turn], valid_masks[turn])
+        _, rewards, hand_over, _ = env.step(actions)
+        self.hand_actions = np.where(hand_over, 0, self.hand_actions + 1)
+        results = []
+        for table in np.flatnonzero(hand_over).tolist():
+            chips = int(rewards[table, self.seat_a[table]])
+            partner = table ^ 1
+            if self.pending[partner]:
+                results.append((chips + self.pending[partner].pop(0)) / 2)
+            else:
+                self.pending[table].append(chips)
+        return results
+
+
+def is_significant(stats, min_hands):
+    return stats.count * 2 >= min_hands and abs(stats.mean) > Z_SCORE * stats.stderr()
+
+
+def summarize(stats, elapsed):
+    bb_per_hand = 100 / BIG_BLIND
+    margin = Z_SCORE * stats.stderr() * bb_per_hand
+    mean = stats.mean * bb_per_hand
+    return {"hands": stats.count * 2, "bb_per_100": mean, "lower": mean - margin, "upper": mean + margin,
+            "hands_per_sec": stats.count * 2 / elapsed if elapsed > 0 else 0.0}
+
+
+def create_match(spec_a, spec_b, n_pairs, seed_sequence):
+    # independent streams for both policies, and a deal seed that differs between workers
+    seed_a, seed_b = seed_sequence.spawn(2)
+    deal_seed = int(seed_sequence.generate_state(1, np.uint64)[0])
+    return DuplicateMatch(load_policy(spec_a, seed_a), load_policy(spec_b, seed_b), n_pairs, seed=deal_seed)
+
+
+def run_worker(spec_a, spec_b, n_pairs, seed_sequence, steps_per_report, result_queue, stop_event):
+    match = create_match(spec_a, spec_b, n_pairs, seed_sequence)
+    while not stop_event.is_set():
+        stats = RunningStats()
+        for _ in range(steps_per_report):
+            stats.add_batch(match.step())
+        result_queue.put(stats.as_tuple())
+
+
+def evaluate(spec_a, spec_b, max_hands=1000000, workers=1, n_pairs=512, seed=0, min_hands=20000,
+             early_stop=True, report_every=5.0, output=None):
+    # streams a JSON line per report to stdout (and output if given) and returns the last summary
+    context = mp.get_context("spawn")
+    result_queue = context.Queue()
+    stop_event = context.Event()
+    stats = RunningStats()
+    start_time = time.time()
+    last_report = start_time
+    summary = summarize(stats, 0.0)
+    out_file = open(output, "a") if output else None
+    match = None
+    processes = []
+    worker_seeds = spawn_seeds(seed, workers)
+    if workers > 1:
+        for worker_seed in worker_seeds:
+            process = context.Process(target=run_worker, args=(spec_a, spec_b, n_pairs, worker_seed, 20,
+                                                               result_queue, stop_event), daemon=True)
+            process.start()
+            processes.append(process)
+    else:
+        match = create_match(spec_a, spec_b, n_pairs, worker_seeds[0])
+    try:
+        while stats.count * 2 < max_hands:
+            if match is not None:
+                stats.add_batch(match.step())
+            else:
+                try:
+                    stats.merge(RunningStats(*result_queue.get(timeout=1)))
+                except queue.Empty:
+                    continue
+            now = time.time()
+            done = stats.count * 2 >= max_hands or (early_stop and is_significant(stats, min_hands))
+            if now - last_report >= report_every or done:
+                summary = summarize(stats, now - start_time)
+                summary["significant"] = is_significant(stats, 0)
+                line = json.dumps(summary)
+                print(line, flush=True)
+                if out_file is not None:
+                    out_file.write(line + "\n")
+                    out_file.flush()
+                last_report = now
+            if done:
+                break
+    finally:
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if out_file is not None:
+            out_file.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duplicate heads-up match between two policies, reported in bb/100")
+    parser.add_argument("policy_a", help="random, rule, keras:<model path> or a model h5 for NumpyPolicy")
+    parser.add_argument("policy_b")
+    parser.add_argument("--hands", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pairs", type=int, default=512, help="mirrored table pairs per worker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-hands", type=int, default=20000, help="hands before early stopping is allowed")
+    parser.add_argument("--no-early-stop", action="store_true")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between streamed results")
+    parser.add_argument("--output", help="also append the streamed JSON lines to this file")
+    args = parser.parse_args()
+    evaluate(args.policy_a, args.policy_b, args.hands, args.workers, args.pairs, args.seed, args.min_hands,
+             not args.no_early_stop, args.report_every, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import numpy as np
+
+from Cards import NUM_CARDS, TREYS_CARDS
+
+TREYS_CARD_LIST = TREYS_CARDS.tolist()
+
+
+class CardDeck:
+    # shuffled Cards ids plus a draw pointer, drop-in for treys.Deck.draw
+
+    __slots__ = ("order", "pointer", "rng")
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.order = None
+        self.pointer = 0
+        self.shuffle()
+
+    def shuffle(self):
+        # a fresh order array per hand, so snapshots can share it instead of copying
+        self.order = self.rng.permutation(NUM_CARDS)
+        self.pointer = 0
+
+    def draw(self, n=1):
+        start = self.pointer
+        self.pointer = start + n
+        return [TREYS_CARD_LIST[card_id] for card_id in self.order[start:start + n].tolist()]
+
+    def draw_ids(self, n=1):
+        start = self.pointer
+        self.pointer = start + n
+        return self.order[start:start + n]
+
+
+class GameState:
+    # everything that changes during a hand; PokerEnv builds the betting rules on top
+
+    __slots__ = ("pot", "community_cards", "deck", "player", "opponent", "all_in_board_size")
+
+    def snapshot(self):
+        return (self.pot, tuple(self.community_cards), self.deck.order, self.deck.pointer,
+                self.player.snapshot(), self.opponent.snapshot(), self.all_in_board_size)
+
+    def restore(self, snapshot):
+        pot, community_cards, deck_order, deck_pointer, player, opponent, all_in_board_size = snapshot
+        self.pot = pot
+        self.community_cards = list(community_cards)
+        self.deck.order = deck_order
+        self.deck.pointer = deck_pointer
+        self.player.restore(player)
+        self.opponent.restore(opponent)
+        self.all_in_board_size = all_in_board_size
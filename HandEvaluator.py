@@ -0,0 +1,132 @@
+import os
+from itertools import combinations_with_replacement
+
+import numpy as np
+
+from Cards import NUM_CARDS, TREYS_CARDS
+
+HAND_RANKS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hand_ranks.npz")
+RANK_POWERS = 5 ** np.arange(13, dtype=np.int64)  # base 5 digit per rank, at most 4 cards of a rank
+CARD_RANKS = np.arange(NUM_CARDS) // 4
+CARD_SUITS = np.arange(NUM_CARDS) % 4
+CARD_RANK_KEYS = RANK_POWERS[CARD_RANKS]
+CARD_RANK_BITS = 1 << CARD_RANKS
+CARD_SUIT_CODES = 8 ** CARD_SUITS  # summed over a board, 3 bits per suit hold its card count
+
+
+def build_hand_rank_tables():
+    # evaluates every rank multiset (5-7 cards) and every flush rank mask once with treys
+    from treys import Evaluator  # only needed when hand_ranks.npz is missing
+    evaluator = Evaluator()
+    keys = []
+    ranks = []
+    for num_cards in (5, 6, 7):
+        for multiset in combinations_with_replacement(range(13), num_cards):
+            if max(multiset.count(r) for r in set(multiset)) > 4:
+                continue
+            # consecutive suits never give five of a kind in one suit
+            card_ids = [rank * 4 + i % 4 for i, rank in enumerate(multiset)]
+            cards = [int(card) for card in TREYS_CARDS[card_ids]]
+            keys.append(int(CARD_RANK_KEYS[card_ids].sum()))
+            ranks.append(evaluator.evaluate(cards[:2], cards[2:]))
+    order = np.argsort(keys)
+    flush_ranks = np.full(1 << 13, np.iinfo(np.uint16).max, dtype=np.uint16)
+    for mask in range(1 << 13):
+        suited = [rank for rank in range(13) if mask >> rank & 1]
+        if 5 <= len(suited) <= 7:
+            cards = [int(card) for card in TREYS_CARDS[[rank * 4 for rank in suited]]]
+            flush_ranks[mask] = evaluator.evaluate(cards[:2], cards[2:])
+    return np.array(keys, dtype=np.int64)[order], np.array(ranks, dtype=np.uint16)[order], flush_ranks
+
+
+def save_hand_rank_tables(path=HAND_RANKS_PATH):
+    rank_keys, rank_values, flush_ranks = build_hand_rank_tables()
+    np.savez_compressed(path, rank_keys=rank_keys, rank_values=rank_values, flush_ranks=flush_ranks)
+
+
+class HandEvaluator:
+
+    def __init__(self, path=HAND_RANKS_PATH):
+        if not os.path.exists(path):
+            save_hand_rank_tables(path)
+        with np.load(path) as tables:
+            self.rank_keys = tables["rank_keys"]
+            self.rank_values = tables["rank_values"]
+            self.flush_ranks = tables["flush_ranks"]
+        self.rank_lookup = dict(zip(self.rank_keys.tolist(), self.rank_values.tolist()))
+        self.flush_lookup = self.flush_ranks.tolist()
+        # treys int -> (rank key, suit, rank bit) for the scalar path
+        self.card_features = {int(card): (int(CARD_RANK_KEYS[i]), int(CARD_SUITS[i]), int(CARD_RANK_BITS[i]))
+                              for i, card in enumerate(TREYS_CARDS)}
+
+    def evaluate(self, cards, board):
+        # drop-in for treys.Evaluator.evaluate, lower is better
+        key = 0
+        suit_masks = [0, 0, 0, 0]
+        suit_counts = [0, 0, 0, 0]
+        for card in cards + board:
+            rank_key, suit, rank_bit = self.card_features[card]
+            key += rank_key
+            suit_masks[suit] |= rank_bit
+            suit_counts[suit] += 1
+        rank = self.rank_lookup[key]
+        for suit in range(4):
+            if suit_counts[suit] >= 5:
+                rank = min(rank, self.flush_lookup[suit_masks[suit]])
+        return rank
+
+    def evaluate_ids(self, card_ids):
+        return int(self.evaluate_batch(np.asarray(card_ids)[None, :])[0])
+
+    def evaluate_batch(self, card_ids):
+        # card_ids: (n, 5..7) array of Cards ids
+        card_ids = np.asarray(card_ids, dtype=np.int64)
+        keys = CARD_RANK_KEYS[card_ids].sum(axis=1)
+        ranks = self.rank_values[np.searchsorted(self.rank_keys, keys)].astype(np.int64)
+        suits = CARD_SUITS[card_ids]
+        for suit in range(4):
+            in_suit = suits == suit
+            flush = in_suit.sum(axis=1) >= 5
+            if flush.any():
+                masks = np.where(in_suit[flush], CARD_RANK_BITS[card_ids[flush]], 0).sum(axis=1)
+                ranks[flush] = np.minimum(ranks[flush], self.flush_ranks[masks])
+        return ranks
+
+    def evaluate_boards(self, hands, boards):
+        # ranks of every 2-card hand on every 5-card board, shape (len(hands), len(boards)); the board part of
+        # the rank key and the flush candidates are worked out once and shared by all hands
+        boards = np.asarray(boards, dtype=np.int64)
+        board_keys = CARD_RANK_KEYS[boards].sum(axis=1)
+        suit_codes = CARD_SUIT_CODES[boards].sum(axis=1)
+        # boards with 3+ cards of a suit are the only ones two hole cards can make a flush on
+        flush_candidates = []
+        for suit in range(4):
+            counts = suit_codes >> (3 * suit) & 7
+            rows = np.flatnonzero(counts >= 3)
+            cards = boards[rows]
+            # distinct cards of one suit never share a rank bit, so summing the bits is the same as or-ing them
+            masks = np.where(CARD_SUITS[cards] == suit, CARD_RANK_BITS[cards], 0).sum(axis=1)
+            flush_candidates.append((rows, counts[rows], masks))
+        ranks = np.empty((len(hands), len(boards)), dtype=np.int64)
+        for i, hand in enumerate(np.asarray(hands, dtype=np.int64)):
+            row = self.rank_values[np.searchsorted(self.rank_keys, board_keys + CARD_RANK_KEYS[hand].sum())]
+            row = row.astype(np.int64)
+            for suit, (rows, counts, masks) in enumerate(flush_candidates):
+                in_suit = CARD_SUITS[hand] == suit
+                flush = counts + in_suit.sum() >= 5
+                if flush.any():
+                    flush_rows = rows[flush]
+                    row[flush_rows] = np.minimum(row[flush_rows],
+                                                 self.flush_ranks[masks[flush] + CARD_RANK_BITS[hand[in_suit]].sum()])
+            ranks[i] = row
+        return ranks
+
+
+HAND_EVALUATOR = None
+
+
+def get_hand_evaluator():
+    global HAND_EVALUATOR
+    if HAND_EVALUATOR is None:
+        HAND_EVALUATOR = HandEvaluator()
+    return HAND_EVALUATOR
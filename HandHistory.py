@@ -0,0 +1,171 @@
+import os
+
+import numpy as np
+
+from Cards import TREYS_CARDS, ids_to_cards
+from Settlement import SPLIT_POT
+
+MAGIC = b"SPHH"
+VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u4"), ("record_size", "<u4"), ("max_actions", "<u4")])
+MAX_RECORDED_ACTIONS = 32
+NO_ACTION = -1  # performed value of an action PokerEnv ignored, e.g. the big blind acting first
+SPLIT_POT_WINNER = 255  # winner value of a shared pot
+RECORD_DTYPE = np.dtype([
+    ("start_stacks", "<i4", 2),  # before blinds, seat 0 is PokerEnv.player and seat 1 PokerEnv.opponent
+    ("end_stacks", "<i4", 2),  # after the pot is paid out
+    ("pot", "<i4"),
+    ("small_blind_seat", "u1"),
+    ("winner", "u1"),
+    ("board_count", "u1"),
+    ("num_actions", "u1"),  # may exceed MAX_RECORDED_ACTIONS, only the first ones are stored
+    ("cards", "i1", 9),  # Cards ids: seat 0 hole cards, seat 1 hole cards, then the five board cards
+    ("seats", "u1", MAX_RECORDED_ACTIONS),
+    ("actions", "u1", MAX_RECORDED_ACTIONS),  # as requested, which is what replay feeds back
+    ("performed", "i1", MAX_RECORDED_ACTIONS),  # as resolved by PokerEnv
+])
+
+
+def create_header():
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["record_size"] = RECORD_DTYPE.itemsize
+    header["max_actions"] = MAX_RECORDED_ACTIONS
+    return header
+
+
+def check_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC or header["version"][0] != VERSION or \
+            header["record_size"][0] != RECORD_DTYPE.itemsize:
+        raise ValueError("{} is not a version {} hand history file".format(path, VERSION))
+
+
+class HandHistoryWriter:
+    # fixed width records buffered in memory and appended to path in bulk; attach with PokerEnv.hand_history
+
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self.buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self.count = 0
+        self.written = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            check_header(path)
+            self.written = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+        else:
+            with open(path, "wb") as f:
+                f.write(create_header().tobytes())
+
+    def __len__(self):
+        return self.written + self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def begin_hand(self, env):
+        # called once the blinds are posted and the hole cards dealt
+        if self.count == len(self.buffer):
+            self.flush()
+        record = self.buffer[self.count]
+        record["start_stacks"] = (env.player.stack_size + env.player.total_bet,
+                                  env.opponent.stack_size + env.opponent.total_bet)
+        record["small_blind_seat"] = 0 if env.player.is_small_blind else 1
+        record["num_actions"] = 0
+        record["cards"] = env.deck.order[:9]
+
+    def record_action(self, seat, action, performed_action):
+        record = self.buffer[self.count]
+        index = int(record["num_actions"])
+        if index < MAX_RECORDED_ACTIONS:
+            record["seats"][index] = seat
+            record["actions"][index] = action
+            record["performed"][index] = performed_action.value if performed_action is not None else NO_ACTION
+        record["num_actions"] = min(index + 1, 255)
+
+    def end_hand(self, env, winner):
+        # called after the pot is paid out and before the next hand is dealt, winner is a seat or SPLIT_POT
+        record = self.buffer[self.count]
+        record["end_stacks"] = (env.player.stack_size, env.opponent.stack_size)
+        record["pot"] = env.pot
+        record["winner"] = SPLIT_POT_WINNER if winner == SPLIT_POT else winner
+        record["board_count"] = len(env.community_cards)
+        self.count += 1
+
+    def flush(self):
+        if self.count == 0:
+            return
+        with open(self.path, "ab") as f:
+            f.write(self.buffer[:self.count].tobytes())
+        self.written += self.count
+        self.count = 0
+
+    def close(self):
+        self.flush()
+
+
+class HandHistoryReader:
+    # memory maps the file, so records are only read when they are touched
+
+    def __init__(self, path):
+        check_header(path)
+        self.path = path
+        size = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // RECORD_DTYPE.itemsize
+        self.records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(size,)) \
+            if size > 0 else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __iter__(self):
+        return self.iter_hands()
+
+    def iter_hands(self, start=0, stop=None, chunk_size=4096):
+        stop = len(self.records) if stop is None else min(stop, len(self.records))
+        for chunk_start in range(start, stop, chunk_size):
+            # one copy per chunk instead of one page fault per field access
+            for record in np.array(self.records[chunk_start:min(chunk_start + chunk_size, stop)]):
+                yield record
+
+    def hole_cards(self, record, seat):
+        return ids_to_cards(record["cards"][seat * 2:seat * 2 + 2])
+
+    def board(self, record):
+        return ids_to_cards(record["cards"][4:4 + record["board_count"]])
+
+    def actions(self, record):
+        count = min(int(record["num_actions"]), MAX_RECORDED_ACTIONS)
+        return list(zip(record["seats"][:count].tolist(), record["actions"][:count].tolist(),
+                        record["performed"][:count].tolist()))
+
+    def replay(self, record, env=None):
+        # plays the recorded actions through PokerEnv and returns it at the end of the hand, before settlement
+        from PokerEnv import PokerEnv
+        env = PokerEnv() if env is None else env
+        hand_history, env.hand_history = env.hand_history, None
+        small_blind_seat = int(record["small_blind_seat"])
+        # reset_board swaps the blinds, so seat the players the other way round first
+        env.player.reset(int(record["start_stacks"][0]), small_blind_seat != 0)
+        env.opponent.reset(int(record["start_stacks"][1]), small_blind_seat != 1)
+        env.reset_board()
+        env.hand_history = hand_history
+        dealt = record["cards"].astype(np.int64)
+        rest = np.setdiff1d(np.arange(len(TREYS_CARDS)), dealt)
+        env.deck.order = np.concatenate([dealt, rest])
+        env.deck.pointer = 4
+        env.player.receive_cards(ids_to_cards(dealt[:2]))
+        env.opponent.receive_cards(ids_to_cards(dealt[2:4]))
+        for seat, action, performed in self.actions(record):
+            cur_player, other_player = (env.player, env.opponent) if seat == 0 else (env.opponent, env.player)
+            env.apply_player_action(cur_player, other_player, action)
+            if env.is_hand_over():
+                break
+            env.update_stage()
+        return env
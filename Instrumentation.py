@@ -0,0 +1,154 @@
+import functools
+import time
+from bisect import bisect_left
+
+PHASES = ("deal", "action", "stage_update", "showdown", "observe", "opponent_infer", "train_step")
+# histogram upper bounds in seconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2,
+           0.1, 0.25, 0.5, 1.0)
+
+
+def default_targets():
+    # (class, method, phase) pairs timed while instrumentation is enabled
+    from ActorLearner import Learner
+    from BatchPokerEnv import BatchPokerEnv
+    from OpponentServer import OpponentPolicyServer
+    from PokerAgentEnv import PokerAgentEnv
+    from PokerEnv import PokerEnv
+    return [
+        (PokerEnv, "reset_board", "deal"),
+        (PokerEnv, "perform_player_action", "action"),
+        (PokerEnv, "update_board", "stage_update"),
+        (PokerEnv, "settle_pot", "showdown"),
+        (BatchPokerEnv, "deal", "deal"),
+        (BatchPokerEnv, "resolve_actions", "action"),
+        (BatchPokerEnv, "update_boards", "stage_update"),
+        (BatchPokerEnv, "settle", "showdown"),
+        (BatchPokerEnv, "get_observations", "observe"),
+        (PokerAgentEnv, "get_observation", "observe"),
+        (OpponentPolicyServer, "act", "opponent_infer"),
+        (Learner, "train_step", "train_step"),
+    ]
+
+
+class PhaseHistogram:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.bucket_counts[bisect_left(BUCKETS, seconds)] += 1
+
+    def as_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(BUCKETS + (float("inf"),), self.bucket_counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"count": self.count, "total_seconds": self.total, "buckets": buckets}
+
+
+class PhaseTimer:
+
+    def __init__(self, instrumentation, phase):
+        self.instrumentation = instrumentation
+        self.phase = phase
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.record(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Instrumentation:
+    # disabled by default; enable() swaps timing wrappers onto the hot-path methods and disable() puts the
+    # originals back, so nothing is paid while it is off
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = {phase: PhaseHistogram() for phase in PHASES}
+        self.originals = []
+
+    def enable(self, targets=None):
+        if self.enabled:
+            return
+        for cls, name, phase in (targets if targets is not None else default_targets()):
+            original = cls.__dict__[name]
+            self.originals.append((cls, name, original))
+            setattr(cls, name, self.wrap(original, phase))
+        self.enabled = True
+
+    def disable(self):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+        self.enabled = False
+
+    def reset(self):
+        self.phases = {phase: PhaseHistogram() for phase in PHASES}
+
+    def wrap(self, function, phase):
+        record = self.record
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(phase, time.perf_counter() - start)
+        return timed
+
+    def record(self, phase, seconds):
+        if phase not in self.phases:
+            self.phases[phase] = PhaseHistogram()
+        self.phases[phase].observe(seconds)
+
+    def timer(self, phase):
+        # for code that is not a method, e.g. the training loop in Agent.py
+        return PhaseTimer(self, phase) if self.enabled else NULL_TIMER
+
+    def as_dict(self):
+        return {phase: histogram.as_dict() for phase, histogram in self.phases.items()}
+
+    def to_prometheus(self, metric="poker_phase_seconds"):
+        lines = ["# HELP {} Time spent in each environment and training phase.".format(metric),
+                 "# TYPE {} histogram".format(metric)]
+        for phase, stats in self.as_dict().items():
+            for bound, count in stats["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('{}_bucket{{phase="{}",le="{}"}} {}'.format(metric, phase, le, count))
+            lines.append('{}_sum{{phase="{}"}} {}'.format(metric, phase, repr(stats["total_seconds"])))
+            lines.append('{}_count{{phase="{}"}} {}'.format(metric, phase, stats["count"]))
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        lines = []
+        for phase, histogram in self.phases.items():
+            if histogram.count:
+                lines.append("{:15s} calls: {:10d} total: {:9.3f}s mean: {:9.2f}us".format(
+                    phase, histogram.count, histogram.total, histogram.total / histogram.count * 1e6))
+        return "\n".join(lines)
+
+
+INSTRUMENTATION = Instrumentation()
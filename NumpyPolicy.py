@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "linear": lambda x: x,
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+}
+
+
+def default_activations(num_layers):
+    # build_model: relu on the hidden layers, linear output
+    return ["relu"] * (num_layers - 1) + ["linear"]
+
+
+class NumpyPolicy:
+    # float32 forward pass of a stack of Dense layers, no TensorFlow needed
+
+    def __init__(self, weights, activations=None):
+        self.kernels = []
+        self.biases = []
+        self.activations = activations
+        self.set_weights(weights)
+
+    def set_weights(self, weights):
+        # same flat [kernel, bias, kernel, bias, ...] list keras Model.get_weights returns
+        # asarray keeps float32 inputs as they are, so memory mapped OpponentPool snapshots are not copied
+        self.kernels = [np.asarray(kernel, dtype=np.float32) for kernel in weights[0::2]]
+        self.biases = [np.asarray(bias, dtype=np.float32) for bias in weights[1::2]]
+        if self.activations is None or len(self.activations) != len(self.kernels):
+            self.activations = default_activations(len(self.kernels))
+
+    def get_weights(self):
+        weights = []
+        for kernel, bias in zip(self.kernels, self.biases):
+            weights.extend([kernel, bias])
+        return weights
+
+    def predict_on_batch(self, observations):
+        x = np.asarray(observations, dtype=np.float32).reshape(len(observations), -1)
+        for kernel, bias, activation in zip(self.kernels, self.biases, self.activations):
+            x = ACTIVATIONS[activation](x @ kernel + bias)
+        return x
+
+    def __call__(self, observations):
+        return self.predict_on_batch(observations)
+
+    def predict(self, observations, verbose=0):
+        return self.predict_on_batch(observations)
+
+    @classmethod
+    def from_keras_model(cls, model):
+        activations = [layer.activation.__name__ for layer in model.layers if hasattr(layer, "kernel")]
+        return cls(model.get_weights(), activations)
+
+    @classmethod
+    def load(cls, path):
+        # reads the Dense layers of a keras .h5 file such as model.h5 with h5py only
+        import h5py
+        with h5py.File(path, "r") as f:
+            group = f["model_weights"] if "model_weights" in f else f
+            activations = {}
+            if "model_config" in f.attrs:
+                config = json.loads(f.attrs["model_config"])
+                for layer in config["config"]["layers"]:
+                    if "activation" in layer["config"]:
+                        activations[layer["config"]["name"]] = layer["config"]["activation"]
+            weights = []
+            layer_activations = []
+            for layer_name in group.attrs["layer_names"]:
+                layer_name = layer_name.decode() if isinstance(layer_name, bytes) else layer_name
+                weight_names = group[layer_name].attrs["weight_names"]
+                if len(weight_names) == 0:
+                    continue
+                for weight_name in weight_names:
+                    weight_name = weight_name.decode() if isinstance(weight_name, bytes) else weight_name
+                    weights.append(group[layer_name][weight_name][()])
+                layer_activations.append(activations.get(layer_name, "linear"))
+        return cls(weights, layer_activations if activations else None)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from Cards import NUM_CARDS
+from PokerEnv import INITIAL_STACK_SIZE
+
+# flat float32 layout: 2 hand cards x 17 columns, 10 position columns with a 1 at both players' Position values
+# (only the first 5 are ever set), 5 community cards x 17 columns (zero until dealt), pot, both stacks and the
+# amount to call
+HAND_START = 0
+POSITION_START = 34
+COMMUNITY_START = 44
+POT_INDEX = 129
+STACKS_INDEX = 130
+CALL_INDEX = 132
+OBSERVATION_SIZE = 133
+
+
+def create_card_one_hot_table():
+    # 13 rank columns, ace first then 2..K, and 4 suit columns h/d/c/s
+    table = np.zeros((NUM_CARDS, 17), dtype=np.float32)
+    for card_id in range(NUM_CARDS):
+        rank, suit = divmod(card_id, 4)
+        table[card_id, (rank + 1) % 13] = 1
+        table[card_id, 13 + suit] = 1
+    return table
+
+
+CARD_ONE_HOT = create_card_one_hot_table()
+
+
+def create_observation_bounds():
+    # with INITIAL_STACK_SIZE * 2 chips on the table: pot up to 4, stacks up to 1, amount to call within +-2
+    low = np.zeros(OBSERVATION_SIZE, dtype=np.float32)
+    high = np.ones(OBSERVATION_SIZE, dtype=np.float32)
+    high[POT_INDEX] = 4
+    low[CALL_INDEX] = -2
+    high[CALL_INDEX] = 2
+    return low, high
+
+
+OBSERVATION_LOW, OBSERVATION_HIGH = create_observation_bounds()
+
+
+def encode_observation(hand, community_cards, cur_position, other_position, pot, cur_stack, other_stack,
+                       call_amount, out=None):
+    # hand and community_cards are Cards ids, positions are Position values
+    if out is None:
+        out = np.zeros(OBSERVATION_SIZE, dtype=np.float32)
+    else:
+        out.fill(0)
+    num_hand = len(hand)
+    num_community = len(community_cards)
+    if num_hand:
+        out[HAND_START:HAND_START + num_hand * 17] = CARD_ONE_HOT[hand].ravel()
+    out[POSITION_START + cur_position] = 1
+    out[POSITION_START + other_position] = 1
+    if num_community:
+        out[COMMUNITY_START:COMMUNITY_START + num_community * 17] = CARD_ONE_HOT[community_cards].ravel()
+    out[POT_INDEX] = pot / INITIAL_STACK_SIZE * 2
+    out[STACKS_INDEX] = cur_stack / (INITIAL_STACK_SIZE * 2)
+    out[STACKS_INDEX + 1] = other_stack / (INITIAL_STACK_SIZE * 2)
+    out[CALL_INDEX] = call_amount / INITIAL_STACK_SIZE
+    return out
+
+
+def encode_observations(hands, community_cards, community_count, cur_positions, other_positions, pots,
+                        cur_stacks, other_stacks, call_amounts, out=None):
+    # batched encode_observation: hands (n, 2), community_cards (n, 5) of which community_count are dealt
+    num_states = len(hands)
+    if out is None:
+        out = np.zeros((num_states, OBSERVATION_SIZE), dtype=np.float32)
+    rows = np.arange(num_states)
+    out[:, HAND_START:POSITION_START] = CARD_ONE_HOT[hands].reshape(num_states, 34)
+    out[:, POSITION_START:COMMUNITY_START] = 0
+    out[rows, POSITION_START + cur_positions] = 1
+    out[rows, POSITION_START + other_positions] = 1
+    visible = np.arange(5) < np.asarray(community_count)[:, None]
+    community = CARD_ONE_HOT[community_cards] * visible[:, :, None]
+    out[:, COMMUNITY_START:POT_INDEX] = community.reshape(num_states, 85)
+    out[:, POT_INDEX] = np.asarray(pots) / INITIAL_STACK_SIZE * 2
+    out[:, STACKS_INDEX] = np.asarray(cur_stacks) / (INITIAL_STACK_SIZE * 2)
+    out[:, STACKS_INDEX + 1] = np.asarray(other_stacks) / (INITIAL_STACK_SIZE * 2)
+    out[:, CALL_INDEX] = np.asarray(call_amounts) / INITIAL_STACK_SIZE
+    return out
@@ -0,0 +1,179 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from NumpyPolicy import NumpyPolicy
+
+LATEST = "latest"
+HISTORICAL = "historical"
+EXPLOITER = "exploiter"
+DEFAULT_CATEGORY_WEIGHTS = {LATEST: 0.5, HISTORICAL: 0.4, EXPLOITER: 0.1}
+INDEX_FILE = "index.json"
+
+
+def flatten_weights(weights):
+    return np.concatenate([np.ravel(weight) for weight in weights]).astype(np.float32), \
+        [list(np.shape(weight)) for weight in weights]
+
+
+def unflatten_weights(flat, shapes):
+    # views into flat, nothing is copied
+    weights = []
+    offset = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        weights.append(flat[offset:offset + size].reshape(shape))
+        offset += size
+    return weights
+
+
+class OpponentPool:
+    # past policy snapshots as flat float32 arrays. At most capacity of them are kept as live policies (LRU).
+    # With a directory every snapshot is also written there once; evicted ones are reloaded memory mapped, and
+    # other processes can open the same directory read_only so all of them share the pages instead of copying.
+
+    def __init__(self, capacity=16, directory=None, category_weights=None, seed=None, read_only=False):
+        self.capacity = capacity
+        self.directory = directory
+        self.category_weights = dict(DEFAULT_CATEGORY_WEIGHTS if category_weights is None else category_weights)
+        self.rng = np.random.default_rng(seed)
+        self.read_only = read_only
+        self.snapshots = {}  # id -> {"tag", "shapes", "activations"}
+        self.cache = OrderedDict()  # id -> NumpyPolicy, most recently used last
+        self.next_id = 0
+        self.latest_id = None
+        self.index_mtime = None
+        if directory is not None:
+            if not read_only:
+                os.makedirs(directory, exist_ok=True)
+            self.refresh()
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def snapshot_path(self, snapshot_id):
+        return os.path.join(self.directory, "{}.npy".format(snapshot_id))
+
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def add(self, weights, tag=LATEST, activations=None):
+        if self.read_only:
+            raise RuntimeError("opponent pool was opened read only")
+        flat, shapes = flatten_weights(weights)
+        snapshot_id = self.next_id
+        self.next_id += 1
+        if tag == LATEST:
+            if self.latest_id is not None:
+                self.snapshots[self.latest_id]["tag"] = HISTORICAL
+            self.latest_id = snapshot_id
+        self.snapshots[snapshot_id] = {"tag": tag, "shapes": shapes, "activations": activations}
+        if self.directory is not None:
+            np.save(self.snapshot_path(snapshot_id), flat)
+            self.write_index()
+            flat = np.load(self.snapshot_path(snapshot_id), mmap_mode="r")
+        self.store(snapshot_id, NumpyPolicy(unflatten_weights(flat, shapes), activations))
+        return snapshot_id
+
+    def add_policy(self, policy, tag=LATEST):
+        return self.add(policy.get_weights(), tag, policy.activations)
+
+    def store(self, snapshot_id, policy):
+        self.cache[snapshot_id] = policy
+        self.cache.move_to_end(snapshot_id)
+        while len(self.cache) > self.capacity:
+            # the latest snapshot is never evicted; without a directory an evicted snapshot is gone for good
+            evicted = next((key for key in self.cache if key != self.latest_id), None)
+            if evicted is None:
+                break
+            del self.cache[evicted]
+            if self.directory is None:
+                del self.snapshots[evicted]
+
+    def get(self, snapshot_id):
+        policy = self.cache.get(snapshot_id)
+        if policy is not None:
+            self.cache.move_to_end(snapshot_id)
+            return policy
+        snapshot = self.snapshots[snapshot_id]
+        flat = np.load(self.snapshot_path(snapshot_id), mmap_mode="r")
+        policy = NumpyPolicy(unflatten_weights(flat, snapshot["shapes"]), snapshot["activations"])
+        self.store(snapshot_id, policy)
+        return policy
+
+    def ids(self, tag):
+        return [snapshot_id for snapshot_id, snapshot in self.snapshots.items() if snapshot["tag"] == tag]
+
+    def sample_id(self):
+        # a category by category_weights among the non-empty ones, then a snapshot uniformly within it
+        if self.read_only:
+            self.refresh()
+        categories = [(tag, self.ids(tag)) for tag, weight in self.category_weights.items() if weight > 0]
+        categories = [(tag, ids) for tag, ids in categories if ids]
+        if not categories:
+            return None
+        weights = np.array([self.category_weights[tag] for tag, _ in categories], dtype=np.float64)
+        _, ids = categories[self.rng.choice(len(categories), p=weights / weights.sum())]
+        return ids[self.rng.integers(len(ids))]
+
+    def sample(self):
+        snapshot_id = self.sample_id()
+        return None if snapshot_id is None else self.get(snapshot_id)
+
+    def get_state(self):
+        # the index and every snapshot's flat weights, for checkpoints; the cache order is left alone
+        flats = {}
+        for snapshot_id in self.snapshots:
+            policy = self.cache.get(snapshot_id)
+            if policy is not None:
+                flats[snapshot_id] = flatten_weights(policy.get_weights())[0]
+            else:
+                flats[snapshot_id] = np.load(self.snapshot_path(snapshot_id))
+        index = {"next_id": self.next_id, "latest_id": self.latest_id,
+                 "snapshots": {str(snapshot_id): snapshot for snapshot_id, snapshot in self.snapshots.items()}}
+        return index, flats
+
+    def set_state(self, index, flats):
+        # replaces the whole pool with a get_state result, snapshot ids and tags included
+        if self.read_only:
+            raise RuntimeError("opponent pool was opened read only")
+        self.next_id = index["next_id"]
+        self.latest_id = index["latest_id"]
+        self.snapshots = {int(snapshot_id): snapshot for snapshot_id, snapshot in index["snapshots"].items()}
+        self.cache.clear()
+        for snapshot_id, snapshot in list(self.snapshots.items()):
+            flat = flats[snapshot_id]
+            if self.directory is not None:
+                np.save(self.snapshot_path(snapshot_id), flat)
+                flat = np.load(self.snapshot_path(snapshot_id), mmap_mode="r")
+            self.store(snapshot_id, NumpyPolicy(unflatten_weights(flat, snapshot["shapes"]),
+                                                snapshot["activations"]))
+        if self.directory is not None:
+            self.write_index()
+
+    def write_index(self):
+        index = {"next_id": self.next_id, "latest_id": self.latest_id,
+                 "snapshots": {str(snapshot_id): snapshot for snapshot_id, snapshot in self.snapshots.items()}}
+        temporary_path = self.index_path() + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(index, f)
+        os.replace(temporary_path, self.index_path())
+
+    def refresh(self):
+        # picks up snapshots another process added, only rereads the index when it changed
+        try:
+            mtime = os.stat(self.index_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.index_mtime:
+            return
+        with open(self.index_path()) as f:
+            index = json.load(f)
+        self.index_mtime = mtime
+        self.next_id = index["next_id"]
+        self.latest_id = index["latest_id"]
+        self.snapshots = {int(snapshot_id): snapshot for snapshot_id, snapshot in index["snapshots"].items()}
+        for snapshot_id in [key for key in self.cache if key not in self.snapshots]:
+            del self.cache[snapshot_id]
@@ -0,0 +1,111 @@
+import numpy as np
+
+from ObservationEncoder import OBSERVATION_SIZE
+
+
+def valid_actions_to_mask(valid_actions, num_actions=5):
+    mask = np.zeros(num_actions, dtype=bool)
+    mask[valid_actions] = True
+    return mask
+
+
+def mask_q_values(q_values, valid_masks):
+    # same penalty get_other_player_action applies, for a whole batch
+    return q_values - (~valid_masks) * 1e9
+
+
+def predict_q_values(model, observations):
+    # the Keras models take (batch, 1, observation size) and flatten to (batch, actions)
+    inputs = observations.reshape(len(observations), 1, -1)
+    if hasattr(model, "predict_on_batch"):
+        return np.asarray(model.predict_on_batch(inputs))
+    return np.asarray(model(inputs))
+
+
+class OpponentPolicyServer:
+
+    def __init__(self, model, num_actions=5, max_batch_size=1024):
+        self.model = model
+        self.num_actions = num_actions
+        self.max_batch_size = max_batch_size
+        self.observations = np.zeros((max_batch_size, OBSERVATION_SIZE), dtype=np.float32)
+        self.valid_masks = np.zeros((max_batch_size, num_actions), dtype=bool)
+        self.pending_tickets = []
+        self.results = {}
+        self.next_ticket = 0
+
+    def update_model(self, model):
+        self.flush()
+        self.model = model
+
+    def act(self, observations, valid_masks, model=None):
+        # model defaults to the server's own
+        if len(observations) == 0:
+            return np.zeros(0, dtype=np.int64)
+        q_values = predict_q_values(self.model if model is None else model, observations)
+        return np.argmax(mask_q_values(q_values, valid_masks), axis=1)
+
+    def act_one(self, observation, valid_actions):
+        # synchronous path for a single environment
+        valid_mask = valid_actions_to_mask(valid_actions, self.num_actions)
+        return int(self.act(observation.reshape(1, -1), valid_mask.reshape(1, -1))[0])
+
+    def submit(self, observation, valid_actions):
+        if len(self.pending_tickets) == self.max_batch_size:
+            self.flush()
+        row = len(self.pending_tickets)
+        self.observations[row] = observation
+        self.valid_masks[row] = False
+        self.valid_masks[row, valid_actions] = True
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.pending_tickets.append(ticket)
+        return ticket
+
+    def flush(self):
+        count = len(self.pending_tickets)
+        if count == 0:
+            return
+        actions = self.act(self.observations[:count], self.valid_masks[:count])
+        self.results.update(zip(self.pending_tickets, actions.tolist()))
+        self.pending_tickets = []
+
+    def get_action(self, ticket):
+        if ticket not in self.results:
+            self.flush()
+        return self.results.pop(ticket)
+
+    def step_envs(self, envs, actions):
+        # steps many PokerAgentEnvs with one opponent forward pass per distinct opponent model: envs that drew
+        # their opponent from an OpponentPool share a pass with every env that drew the same snapshot
+        num_envs = len(envs)
+        rewards = np.zeros(num_envs)
+        dones = np.zeros(num_envs, dtype=bool)
+        requests = {}
+        groups = {}  # id(model) -> (model, env indices)
+        for i, (env, action) in enumerate(zip(envs, actions)):
+            dones[i], rewards[i] = env.step_player(action)
+            if not dones[i]:
+                requests[i] = env.get_opponent_request()
+                model = env.opponent_model
+                groups.setdefault(id(model), (model, []))[1].append(i)
+        opponent_actions = {}
+        for model, indices in groups.values():
+            if model is None:
+                continue
+            observations = np.stack([requests[i][0] for i in indices])
+            valid_masks = np.zeros((len(indices), self.num_actions), dtype=bool)
+            for row, i in enumerate(indices):
+                valid_masks[row, requests[i][1]] = True
+            opponent_actions.update(zip(indices, self.act(observations, valid_masks, model).tolist()))
+        observations = np.zeros((num_envs, OBSERVATION_SIZE), dtype=np.float32)
+        for i, env in enumerate(envs):
+            if i in requests:
+                action = opponent_actions.get(i)
+                if action is None:
+                    # no model yet, same random opponent as get_other_player_action
+                    action = env.get_other_player_action(env.pokerEnv.opponent, env.pokerEnv.player)
+                dones[i], reward = env.step_opponent(action)
+                rewards[i] += reward
+            env.get_observation(env.pokerEnv.player, env.pokerEnv.opponent, out=observations[i])
+        return observations, rewards, dones, [{} for _ in range(num_envs)]
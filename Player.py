@@ -2,7 +2,13 @@ from Enums import Position
 
 
 class Player:
+    __slots__ = ("stack_size", "hand", "total_bet", "previous_bet", "position", "is_small_blind", "is_fold",
+                 "already_played")
+
     def __init__(self, stack_size, is_small_blind):
+        self.reset(stack_size, is_small_blind)
+
+    def reset(self, stack_size, is_small_blind):
         self.stack_size = stack_size
         self.hand = []
         self.total_bet = 0
@@ -12,6 +18,15 @@ class Player:
         self.is_fold = False
         self.already_played = False
 
+    def snapshot(self):
+        # hand lists are replaced, never mutated, so they can be shared
+        return (self.stack_size, self.hand, self.total_bet, self.previous_bet, self.position, self.is_small_blind,
+                self.is_fold, self.already_played)
+
+    def restore(self, snapshot):
+        (self.stack_size, self.hand, self.total_bet, self.previous_bet, self.position, self.is_small_blind,
+         self.is_fold, self.already_played) = snapshot
+
     def receive_cards(self, cards):
         self.hand = cards
 
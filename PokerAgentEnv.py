@@ -1,143 +1,165 @@
+import os
+
 import gym
 import numpy as np
 from gym import spaces
 
-from Player import Player
-from Enums import Position, Action
-from treys import Deck, Evaluator, Card
-from tensorflow import keras
-from PokerEnv import *
-
-
-def convert_observation_to_input(observation):
-    temp_array = np.array([])
-    for obs in observation:
-        temp_array = np.hstack([temp_array, obs.flatten()])
-    return temp_array
-
-
-def create_cards_dictionary():
-    chars = ["h", "d", "c", "s"]
-    nums = [str(x) for x in range(2, 10)] + ["T", "J", "Q", "K", "A"]
-    index = 0
-    dictionary = {}
-    for n in nums:
-        for c in chars:
-            combo = n + c
-            dictionary[Card.new(combo)] = (index, combo)
-            index += 1
-    final_dic = {}
-    auxiliary_dic = {"T":10, "J":11, "Q":12, "K":13, "A":1,"h":1, "d":2, "c":3, "s":4}
-    for num_key, tup in dictionary.items():
-        card_value = tup[1][0]
-        if card_value in auxiliary_dic:
-            card_value = auxiliary_dic[card_value]
-        card_colour = auxiliary_dic[tup[1][1]]
-        final_dic[num_key] = (int(card_value), card_colour)
-    return final_dic
-
-
-def get_position_representation(cur_player, other_player):
-    position_representation = np.zeros((2, 5), dtype=np.float32)
-    position_representation[0, cur_player.position.value] = 1
-    position_representation[0, other_player.position.value] = 1
-    return position_representation
+from PokerEnv import PokerEnv
+from Cards import cards_to_ids, TREYS_TO_ID
+from ObservationEncoder import encode_observation, OBSERVATION_SIZE, OBSERVATION_LOW, OBSERVATION_HIGH
+from OpponentServer import OpponentPolicyServer
+from NumpyPolicy import NumpyPolicy
+from Equity import get_equity_calculator
+
+DEFAULT_OPPONENT_MODEL_PATH = 'old_model.h5'
+# file extension -> function loading a model with predict_on_batch; h5py is only imported once a file is read
+MODEL_LOADERS = {".h5": NumpyPolicy.load}
+
+
+def register_model_loader(extension, loader):
+    MODEL_LOADERS[extension] = loader
+
+
+def load_opponent_model(path):
+    if path is None or not os.path.exists(path):
+        return None
+    loader = MODEL_LOADERS.get(os.path.splitext(path)[1])
+    if loader is None:
+        return None
+    try:
+        return loader(path)
+    except Exception:
+        return None
 
 
 def create_observation_space():
-    return spaces.Tuple((
-        spaces.Box(low=0, high=1, shape=(2, 17), dtype=bool),
-        # Hole cards for player (binary encoded)  shape=(2, 17) 13 for cards + 4 for shape
-        spaces.Box(low=0, high=1, shape=(5, 17), dtype=bool),  # Community cards (binary encoded)
-        spaces.Box(low=0, high=INITIAL_STACK_SIZE, shape=(2,), dtype=int),  # Stack sizes for both players
-        spaces.Box(low=0, high=INITIAL_STACK_SIZE, shape=(2,), dtype=int),  # Current bets for both players
-    ))
+    # the flat float32 vector get_observation returns, see ObservationEncoder for the layout
+    return spaces.Box(low=OBSERVATION_LOW, high=OBSERVATION_HIGH, dtype=np.float32)
 
 
 class PokerAgentEnv(gym.Env):
-    def __init__(self):
+    def __init__(self, seed=None, opponent_model_path=DEFAULT_OPPONENT_MODEL_PATH, all_in_ev=False,
+                 decision_cache=None):
         super(PokerAgentEnv, self).__init__()
         self.action_space = spaces.Discrete(5)
-        self.pokerEnv = PokerEnv()
+        # all_in_ev: all-in hands are rewarded by their exact expected reward over every runout, see PokerEnv
+        self.pokerEnv = PokerEnv(seed=seed, all_in_ev=all_in_ev)
+        # the random opponent draws from the same generator as the cards
+        self.np_random = self.pokerEnv.rng
         self.observation_space = create_observation_space()
-        try:
-            self.opponent_model = keras.models.load_model('old_model.h5')
-        except:
-            self.opponent_model = None
-        self.cards_dictionary = create_cards_dictionary()
-
-    def reset(self):
+        # the opponent model is read from opponent_model_path the first time it is needed
+        self.opponent_model_path = opponent_model_path
+        self.loaded_opponent_model = None
+        self.opponent_model_loaded = False
+        self.opponent_server = OpponentPolicyServer(None, num_actions=self.action_space.n, max_batch_size=1)
+        # a DecisionCache answers the opponent's decisions from memoized Q-values instead of a forward pass each
+        self.decision_cache = decision_cache
+        self.opponent_observation = np.zeros(OBSERVATION_SIZE, dtype=np.float32)
+        # with a pool the opponent is drawn from it again at the start of every hand
+        self.opponent_pool = None
+        self.opponent_hand = None
+
+    def seed(self, seed=None):
+        self.pokerEnv.seed(seed)
+        self.np_random = self.pokerEnv.rng
+        return [seed]
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
         self.pokerEnv.reset()
         return self.get_observation(self.pokerEnv.player, self.pokerEnv.opponent)
 
     def step(self, action):
-        reward = 0
-        done, actual_action, temp_reward = self.pokerEnv.execute_player_action(self.pokerEnv.player, self.pokerEnv.opponent, action)
-        reward += temp_reward
+        done, reward = self.step_player(action)
         if not done:
             opponent_action = self.get_other_player_action(self.pokerEnv.opponent, self.pokerEnv.player)
-            done, actual_action, temp_reward =\
-                self.pokerEnv.execute_player_action(self.pokerEnv.opponent, self.pokerEnv.player, opponent_action)
+            done, temp_reward = self.step_opponent(opponent_action)
             reward += temp_reward
         observation = self.get_observation(self.pokerEnv.player, self.pokerEnv.opponent)
         return observation, reward, done, {}
 
+    def step_player(self, action):
+        done, actual_action, reward = self.pokerEnv.execute_player_action(self.pokerEnv.player, self.pokerEnv.opponent, action)
+        return done, reward
+
+    def step_opponent(self, opponent_action):
+        done, actual_action, reward =\
+            self.pokerEnv.execute_player_action(self.pokerEnv.opponent, self.pokerEnv.player, opponent_action)
+        return done, reward
+
+    def get_opponent_request(self):
+        # what an opponent policy needs to pick the opponent's next action
+        self.sample_opponent()
+        observation = self.get_observation(self.pokerEnv.opponent, self.pokerEnv.player, out=self.opponent_observation)
+        return observation, self.pokerEnv.get_player_valid_actions(other_player=self.pokerEnv.player)
+
     def get_player_valid_actions(self):
         return self.pokerEnv.get_player_valid_actions(other_player=self.pokerEnv.opponent)
 
     def get_other_player_action(self, cur_player, other_player):
+        self.sample_opponent()
         valid_actions = self.pokerEnv.get_player_valid_actions(other_player=other_player)
         if self.opponent_model is None:
-            return np.random.choice(valid_actions)
-        observation = self.get_observation(cur_player, other_player)
-        other_player_observation = np.array([observation.reshape(1, -1)])
-        q_values = self.opponent_model.predict(other_player_observation, verbose=0)
-        mask = np.ones(self.action_space.n)
-        mask[valid_actions] = 0
-        masked_q_values = q_values - (mask * 1e9)
+            return self.np_random.choice(valid_actions)
+        if self.decision_cache is not None:
+            return self.decision_cache.act(self.get_infoset_key(cur_player, other_player), valid_actions)
+        observation = self.get_observation(cur_player, other_player, out=self.opponent_observation)
         # Choose action with highest Q-value among valid actions
-        action = np.argmax(masked_q_values)
-        return action
+        return self.opponent_server.act_one(observation, valid_actions)
 
-    def update_opponent_model(self, model):
-        self.opponent_model = model
+    @property
+    def opponent_model(self):
+        if not self.opponent_model_loaded:
+            self.update_opponent_model(load_opponent_model(self.opponent_model_path))
+        return self.loaded_opponent_model
 
-    def get_observation(self, cur_player, other_player):
-        # Convert the player's hand into one-hot encoded representation
-        hand_observation = self.get_cards_representation(cur_player.get_hand(), 2)
-
-        # Convert the player's hand into one-hot encoded representation
-        positions_observation = get_position_representation(cur_player, other_player)
-
-        # Convert the community cards into one-hot encoded representation
-        community_cards_observation = self.get_cards_representation(self.pokerEnv.community_cards, 5)
-
-        # Normalize the pot size
-        pot_size_observation = np.array([self.pokerEnv.pot / INITIAL_STACK_SIZE * 2])
-
-        # Normalize the stack sizes for both players
-        stack_sizes_observation = np.array(
-            [cur_player.stack_size / (INITIAL_STACK_SIZE * 2), other_player.stack_size / (INITIAL_STACK_SIZE * 2)])
-
-        # Normalize the amount to call
-        call_observation = np.array((other_player.total_bet - cur_player.total_bet)/INITIAL_STACK_SIZE)
-
-        # Combine the different parts of the observation into a tuple
-        observation = (
-            hand_observation,
-            positions_observation,
-            community_cards_observation,
-            pot_size_observation,
-            stack_sizes_observation,
-            call_observation,
+    def update_opponent_model(self, model):
+        self.loaded_opponent_model = model
+        self.opponent_model_loaded = True
+        self.opponent_server.update_model(model)
+        if self.decision_cache is not None:
+            self.decision_cache.update_model(model)
+
+    def set_opponent_pool(self, opponent_pool):
+        self.opponent_pool = opponent_pool
+        self.opponent_hand = None
+
+    def sample_opponent(self):
+        if self.opponent_pool is None or self.opponent_hand == self.pokerEnv.hands_dealt:
+            return
+        self.opponent_hand = self.pokerEnv.hands_dealt
+        opponent = self.opponent_pool.sample()
+        if opponent is not None and opponent is not self.opponent_model:
+            self.update_opponent_model(opponent)
+
+    def get_equity(self, cur_player, samples=None):
+        # win probability of cur_player's hand against a random hand on the current board
+        return get_equity_calculator().equity(cur_player.get_hand(), self.pokerEnv.community_cards, samples)
+
+    def get_observation(self, cur_player, other_player, out=None):
+        # hand, positions, community cards, pot, both stacks and amount to call in one float32 vector
+        return encode_observation(
+            cards_to_ids(cur_player.get_hand()),
+            cards_to_ids(self.pokerEnv.community_cards),
+            cur_player.position.value,
+            other_player.position.value,
+            self.pokerEnv.pot,
+            cur_player.stack_size,
+            other_player.stack_size,
+            other_player.total_bet - cur_player.total_bet,
+            out=out,
         )
-        return convert_observation_to_input(observation)
-
-    def get_cards_representation(self, cur_cards, mum_of_cards):
-        card_representation = np.zeros((mum_of_cards, 17), dtype=np.float32)
-        for i, card in enumerate(cur_cards):
-            card_representation[i, self.cards_dictionary[card][0] - 1] = 1
-            card_representation[i, 13 + self.cards_dictionary[card][1] - 1] = 1
-        return card_representation
-
 
+    def get_infoset_key(self, cur_player, other_player):
+        # the decision_cache key for what get_observation would encode
+        return self.decision_cache.infoset_key(
+            [TREYS_TO_ID[card] for card in cur_player.get_hand()],
+            [TREYS_TO_ID[card] for card in self.pokerEnv.community_cards],
+            cur_player.position.value,
+            other_player.position.value,
+            self.pokerEnv.pot,
+            cur_player.stack_size,
+            other_player.stack_size,
+            other_player.total_bet - cur_player.total_bet,
+        )
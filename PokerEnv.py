@@ -1,36 +1,61 @@
 import numpy as np
 from Player import Player
-from treys import Deck, Evaluator, Card
+from treys import Card
 from Enums import Position, Action
+from HandEvaluator import get_hand_evaluator
+from GameState import GameState, CardDeck
+from BettingRules import state_index, valid_actions_index, playable_index, raise_size, STAGE_READY_LIST, \
+    PHASE_LIST, PLAYABLE_LIST, VALID_ACTIONS, NEXT_STREET, SHOWDOWN, MIN_RAISE_MULTIPLIER, BIG_RAISE_MULTIPLIER
+from Settlement import settle_heads_up, heads_up_outcome_payouts, winner_seat, SPLIT_POT
+from Equity import get_equity_calculator
 
 INITIAL_STACK_SIZE = 100
 SMALL_BLIND = 1
 BIG_BLIND = 2
+WINNER_NAMES = {0: "player won", 1: "opponent won", SPLIT_POT: "split pot"}
 
 
-class PokerEnv():
+class PokerEnv(GameState):
+    __slots__ = ("evaluator", "verbose", "hand_history", "rng", "hands_dealt", "all_in_ev")
 
-    def __init__(self):
+    def __init__(self, verbose=False, hand_history=None, seed=None, all_in_ev=False):
+        # verbose adds full_print to the final action string, hand_history is a HandHistoryWriter. With all_in_ev
+        # a hand that ends in an all-in runout rewards the player calculate_reward averaged over every runout
+        # instead of the one dealt; stacks still move by the dealt one.
+        self.verbose = verbose
+        self.hand_history = hand_history
+        self.all_in_ev = all_in_ev
+        self.all_in_board_size = None
         self.pot = None
-        self.community_cards = None
-        self.evaluator = None
-        self.deck = None
+        self.community_cards = []
+        self.evaluator = get_hand_evaluator()
+        # stack sizes and the deck share one generator; seed may be an int, a SeedSequence or a Generator
+        self.rng = np.random.default_rng(seed)
+        self.deck = CardDeck(self.rng)
+        self.hands_dealt = 0
         # self.cards_dictionary = self.create_cards_dictionary()
-        self.player = None
-        self.opponent = None
+        self.player = Player(0, False)
+        self.opponent = Player(0, True)
         self.reset()
 
-    def reset(self):
-        self.deck = Deck()
-        self.evaluator = Evaluator()
-        rand_stack = int(np.random.uniform(4, INITIAL_STACK_SIZE * 2 + 1))
-        self.player = Player(rand_stack, False)
-        self.opponent = Player(INITIAL_STACK_SIZE * 2 - rand_stack, True)
+    def seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.deck.rng = self.rng
+        return [seed]
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        rand_stack = int(self.rng.integers(4, INITIAL_STACK_SIZE * 2 + 1))
+        self.player.reset(rand_stack, False)
+        self.opponent.reset(INITIAL_STACK_SIZE * 2 - rand_stack, True)
         self.reset_board()
 
     def reset_board(self):
-        self.deck = Deck()
-        self.community_cards = []
+        self.hands_dealt += 1
+        self.all_in_board_size = None
+        self.deck.shuffle()
+        self.community_cards.clear()
         self.player.total_bet = 0
         self.opponent.total_bet = 0
         self.player.previous_bet = 0
@@ -55,6 +80,8 @@ class PokerEnv():
         self.player.already_played = False
         self.opponent.already_played = False
         self.deal_hole_cards()
+        if self.hand_history is not None:
+            self.hand_history.begin_hand(self)
 
     def deal_hole_cards(self):
         self.player.receive_cards(self.deck.draw(2))
@@ -63,47 +90,59 @@ class PokerEnv():
     def deal_community_cards(self, count):
         self.community_cards.extend(self.deck.draw(count))
 
-    def is_first_player_won(self):
-        if self.opponent.is_fold:
-            return True
-        if self.player.is_fold:
-            return False
-        player_score = self.evaluator.evaluate(self.community_cards, self.player.get_hand())
-        opponent_score = self.evaluator.evaluate(self.community_cards, self.opponent.get_hand())
-        if player_score <= opponent_score:
-            return True
-        else:  # need to deal with tie
-            return False
+    def showdown_scores(self):
+        if self.player.is_fold or self.opponent.is_fold:
+            return None
+        return (self.evaluator.evaluate(self.community_cards, self.player.get_hand()),
+                self.evaluator.evaluate(self.community_cards, self.opponent.get_hand()))
 
-    def is_stage_ready(self):
-        # check if both players execute action
-        if not self.player.already_played or not self.opponent.already_played:
-            return False
-        if self.player.total_bet != self.opponent.total_bet:
-            return False
-        # check check
-        if self.player.position == Position.CHECK and self.opponent.position == Position.CHECK:
-            return True
-        # raise call
-        if (self.player.position == Position.RAISE and self.opponent.position == Position.CALL) or \
-                (self.player.position == Position.CALL and self.opponent.position == Position.RAISE):
-            return True
-        # small call big checks
-        if (self.player.position == Position.CHECK and self.opponent.position == Position.CALL) or (
-                self.player.position == Position.CALL and self.opponent.position == Position.CHECK):
+    def settle_pot(self):
+        # (player, opponent) payouts from the bet ledger: split pots and the uncalled part of a bet are returned
+        # here, nothing is moved
+        player, opponent = self.player, self.opponent
+        return settle_heads_up((player.total_bet, opponent.total_bet), (player.is_fold, opponent.is_fold),
+                               self.showdown_scores())
+
+    def all_in_expected_reward(self):
+        # calculate_reward averaged over every runout of the board as it was when the players went all in
+        board = self.community_cards[:self.all_in_board_size]
+        equity = get_equity_calculator().runout_equity(self.player.get_hand(), self.opponent.get_hand(), board)
+        win, tie, loss = heads_up_outcome_payouts((self.player.total_bet, self.opponent.total_bet))
+        return equity.win * self.calculate_reward(win) + equity.tie * self.calculate_reward(tie) + \
+            (1 - equity.win - equity.tie) * self.calculate_reward(loss)
+
+    def is_all_in_closed(self):
+        # a player is all in and the other one has matched or covered the bet, so nobody has a decision left
+        player, opponent = self.player, self.opponent
+        if player.stack_size == 0 and opponent.stack_size == 0:
             return True
+        if player.stack_size == 0:
+            return opponent.total_bet >= player.total_bet
+        if opponent.stack_size == 0:
+            return player.total_bet >= opponent.total_bet
         return False
 
+    def betting_state(self):
+        # index into the BettingRules tables
+        player, opponent = self.player, self.opponent
+        return state_index(player.position.value, opponent.position.value, player.already_played,
+                           opponent.already_played, len(self.community_cards) == 5,
+                           player.total_bet == opponent.total_bet)
+
+    def betting_phase(self):
+        # CONTINUE, NEXT_STREET or SHOWDOWN from one table lookup, folds are checked separately
+        if len(self.community_cards) == 5 and self.is_all_in_closed():
+            return SHOWDOWN
+        return PHASE_LIST[self.betting_state()]
+
+    def is_stage_ready(self):
+        # both players acted, bets match and the positions close the betting round
+        return STAGE_READY_LIST[self.betting_state()]
+
     def is_hand_over(self):
         if self.player.is_fold or self.opponent.is_fold:
             return True
-        if len(self.community_cards) == 5 and self.player.already_played and self.opponent.already_played:
-            if (self.player.position == Position.CHECK and self.opponent.position == Position.CHECK) or \
-                    (
-                            self.player.position == Position.CALL and self.opponent.position == Position.RAISE) or \
-                    (self.player.position == Position.RAISE and self.opponent.position == Position.CALL):
-                return True
-        return False
+        return self.betting_phase() == SHOWDOWN
 
     def update_board(self):
         cards_on_board = len(self.community_cards)
@@ -117,6 +156,8 @@ class PokerEnv():
         self.opponent.already_played = False
 
     def update_all_in_stage(self):
+        if self.all_in_board_size is None:
+            self.all_in_board_size = len(self.community_cards)
         for i in range(3):
             self.update_board()
         self.player.already_played = True
@@ -145,34 +186,26 @@ class PokerEnv():
         return Action.FOLD
 
     def perform_check(self, cur_player, other_player):
-        if cur_player.total_bet != other_player.total_bet:
+        if cur_player.total_bet < other_player.total_bet:
             return self.perform_call(cur_player, other_player)
         cur_player.position = Position.CHECK
         return Action.CHECK
 
     def perform_call(self, cur_player, other_player):
         amount = other_player.total_bet - cur_player.total_bet
-        if amount == 0:
+        if amount <= 0:
             return self.perform_check(cur_player, other_player)
+        # an all-in call for less stays in the ledger, settle_pot returns the uncalled part
         self.pot += cur_player.place_bet(int(amount))
         cur_player.position = Position.CALL
-        if cur_player.total_bet != other_player.total_bet:
-            pot_change = other_player.total_bet - cur_player.total_bet
-            self.pot -= pot_change
-            other_player.stack_size += pot_change
         return Action.CALL
 
     def perform_min_raise(self, cur_player, other_player):
         amount = other_player.total_bet - cur_player.total_bet
-        if amount >= cur_player.stack_size:
+        # nothing to raise into once the other player is all in
+        if amount >= cur_player.stack_size or other_player.stack_size == 0 or amount < 0:
             return self.perform_call(cur_player, other_player)
-        bet_amount = 0
-        if amount == 0:
-            bet_amount = SMALL_BLIND
-        else:
-            bet_amount = amount * 2
-        if other_player.stack_size < bet_amount:
-            bet_amount = other_player.stack_size + amount
+        bet_amount = raise_size(amount, MIN_RAISE_MULTIPLIER, SMALL_BLIND, other_player.stack_size)
         if cur_player.stack_size < bet_amount:
             return self.perform_call(cur_player, other_player)
         else:
@@ -182,15 +215,10 @@ class PokerEnv():
 
     def perform_big_raise(self, cur_player, other_player):
         amount = other_player.total_bet - cur_player.total_bet
-        if amount >= cur_player.stack_size:
+        # nothing to raise into once the other player is all in
+        if amount >= cur_player.stack_size or other_player.stack_size == 0 or amount < 0:
             return self.perform_call(cur_player, other_player)
-        bet_amount = 0
-        if amount == 0:
-            bet_amount = BIG_BLIND * 3
-        else:
-            bet_amount = amount * 3
-        if other_player.stack_size < bet_amount:
-            bet_amount = other_player.stack_size + amount
+        bet_amount = raise_size(amount, BIG_RAISE_MULTIPLIER, BIG_BLIND * 3, other_player.stack_size)
         if cur_player.stack_size < bet_amount:
             return self.perform_min_raise(cur_player, other_player)
         else:
@@ -198,47 +226,54 @@ class PokerEnv():
             cur_player.position = Position.RAISE
             return Action.BIG_RAISE
 
-    def execute_player_action(self, cur_player, other_player, action):
-        final_action = ""
-        reward = 0
+    def apply_player_action(self, cur_player, other_player, action):
+        # betting part of execute_player_action, settling the hand is left to the caller
+        performed_action = None
         if self.check_if_playable(cur_player, other_player):
-            final_action = self.perform_player_action(cur_player, other_player, action).name
+            performed_action = self.perform_player_action(cur_player, other_player, action)
             cur_player.already_played = True
-        if cur_player.stack_size == 0:
-            if cur_player.position == Position.CALL:
-                self.update_all_in_stage()
-        if self.is_hand_over():
-            reward += self.calculate_reward()
-            if self.is_first_player_won():
-                self.player.stack_size += self.pot
-                final_action += "\n" + self.full_print() + "\nplayer won"
+        if not cur_player.is_fold and self.is_all_in_closed():
+            self.update_all_in_stage()
+        return performed_action
+
+    def execute_player_action(self, cur_player, other_player, action):
+        final_action = ""
+        performed_action = self.apply_player_action(cur_player, other_player, action)
+        if performed_action is not None:
+            final_action = performed_action.name
+        if self.hand_history is not None:
+            self.hand_history.record_action(0 if cur_player is self.player else 1, action, performed_action)
+        phase = self.betting_phase()
+        if self.player.is_fold or self.opponent.is_fold or phase == SHOWDOWN:
+            payouts = self.settle_pot()
+            if self.all_in_ev and self.all_in_board_size is not None and \
+                    not (self.player.is_fold or self.opponent.is_fold):
+                reward = self.all_in_expected_reward()
             else:
-                self.opponent.stack_size += self.pot
-                final_action += "\n" + self.full_print() + "\nopponent won"
+                reward = self.calculate_reward(payouts)
+            if self.verbose:
+                final_action += "\n" + self.full_print()
+            self.player.stack_size += payouts[0]
+            self.opponent.stack_size += payouts[1]
+            winner = winner_seat(payouts, (self.player.total_bet, self.opponent.total_bet))
+            final_action += "\n" + WINNER_NAMES[winner]
+            if self.hand_history is not None:
+                self.hand_history.end_hand(self, winner)
             self.reset_board()
         else:
-            reward += self.calculate_reward()
-            self.update_stage()
-        return self.is_hand_over(), final_action, reward
+            reward = self.player.previous_bet - self.player.total_bet
+            if phase == NEXT_STREET:
+                self.update_board()
+        # a new hand or a new street has just started, neither can be over yet
+        return False, final_action, reward
 
     def check_if_playable(self, cur_player, other_player):
-        if not cur_player.already_played and not other_player.already_played and not cur_player.is_small_blind:
-            return False
-        else:
-            return True
+        return PLAYABLE_LIST[playable_index(cur_player.already_played, other_player.already_played,
+                                            cur_player.is_small_blind)]
 
     def get_player_valid_actions(self, other_player):
-        valid_actions = [0, 3, 4]
-        if other_player.already_played:
-            if other_player.position == Position.CHECK:
-                valid_actions = [1, 3, 4]
-            if other_player.position == Position.CALL:
-                valid_actions = [1, 3, 4]
-            if other_player.position == Position.RAISE:
-                valid_actions = [0, 2, 3, 4]
-        else:
-            valid_actions = [0, 2, 3, 4]
-        return valid_actions
+        # shared lists from BettingRules, callers must not modify them
+        return VALID_ACTIONS[valid_actions_index(other_player.position.value, other_player.already_played)]
 
     def full_print(self):
         s = self.status_print() + "\n" + \
@@ -265,8 +300,10 @@ class PokerEnv():
             s += "pre flop"
         return s
 
-    def calculate_reward(self):
-        if self.is_hand_over() and self.is_first_player_won():
-            return self.opponent.total_bet + self.player.total_bet
-        else:
-            return self.player.previous_bet - self.player.total_bet
+    def calculate_reward(self, payouts=None):
+        # at the end of the hand the chips the player gets back from the pot, otherwise the cost of the last bet
+        if payouts is None and self.is_hand_over():
+            payouts = self.settle_pot()
+        if payouts is not None and payouts[0] > 0:
+            return payouts[0]
+        return self.player.previous_bet - self.player.total_bet
@@ -0,0 +1,69 @@
+import gymnasium
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import AsyncVectorEnv, SyncVectorEnv
+
+from ObservationEncoder import OBSERVATION_LOW, OBSERVATION_HIGH
+from OpponentServer import valid_actions_to_mask
+from PokerAgentEnv import PokerAgentEnv
+
+ENV_ID = "SmallPoker-v0"
+NUM_ACTIONS = 5
+MAX_EPISODE_STEPS = 50  # Agent.py max_steps_per_episode
+
+
+class PokerGymEnv(gymnasium.Env):
+    # Gymnasium API over PokerAgentEnv: one hand per episode against PokerAgentEnv's opponent, action mask in
+    # info["action_mask"] and action_masks()
+    metadata = {"render_modes": ["ansi"]}
+
+    def __init__(self, opponent_model=None, render_mode=None):
+        self.agent_env = PokerAgentEnv()
+        if opponent_model is not None:
+            self.agent_env.update_opponent_model(opponent_model)
+        self.observation_space = spaces.Box(low=OBSERVATION_LOW, high=OBSERVATION_HIGH, dtype=np.float32)
+        self.action_space = spaces.Discrete(NUM_ACTIONS)
+        self.render_mode = render_mode
+
+    def action_masks(self):
+        return valid_actions_to_mask(self.agent_env.get_player_valid_actions(), NUM_ACTIONS)
+
+    def get_info(self):
+        return {"action_mask": self.action_masks()}
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        if seed is not None:
+            self.agent_env.seed(seed)
+        observation = self.agent_env.reset()
+        return observation, self.get_info()
+
+    def step(self, action):
+        poker_env = self.agent_env.pokerEnv
+        hand = poker_env.hands_dealt
+        observation, reward, _, _ = self.agent_env.step(int(action))
+        # PokerEnv deals the next hand as soon as one ends, so a new hand number means this one is over
+        terminated = poker_env.hands_dealt != hand
+        return observation, float(reward), terminated, False, self.get_info()
+
+    def render(self):
+        if self.render_mode == "ansi":
+            return self.agent_env.pokerEnv.full_print()
+        return None
+
+
+def make_vector_env(num_envs, asynchronous=True, seed=None, **env_kwargs):
+    # async runs each table in a subprocess and shares the observation buffer instead of pickling observations
+    def make_env():
+        return gymnasium.wrappers.TimeLimit(PokerGymEnv(**env_kwargs), MAX_EPISODE_STEPS)
+    if asynchronous:
+        vector_env = AsyncVectorEnv([make_env] * num_envs, shared_memory=True)
+    else:
+        vector_env = SyncVectorEnv([make_env] * num_envs)
+    if seed is not None:
+        vector_env.reset(seed=seed)
+    return vector_env
+
+
+if ENV_ID not in gymnasium.registry:
+    gymnasium.register(id=ENV_ID, entry_point="PokerGymEnv:PokerGymEnv", max_episode_steps=MAX_EPISODE_STEPS)
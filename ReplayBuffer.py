@@ -0,0 +1,205 @@
+import json
+import os
+
+import numpy as np
+
+SNAPSHOT_ARRAYS = ("states", "next_states", "actions", "rewards", "dones")
+SNAPSHOT_META_FILE = "meta.json"
+
+
+class SumTree:
+
+    def __init__(self, capacity):
+        self.leaf_start = 1 << int(np.ceil(np.log2(max(capacity, 1))))
+        self.depth = int(np.log2(self.leaf_start))
+        self.tree = np.zeros(2 * self.leaf_start, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[self.leaf_start + np.asarray(indices)]
+
+    def set(self, index, priority):
+        node = self.leaf_start + index
+        change = priority - self.tree[node]
+        while node:
+            self.tree[node] += change
+            node //= 2
+
+    def update(self, indices, priorities):
+        nodes = self.leaf_start + np.asarray(indices, dtype=np.int64)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def set_leaves(self, priorities):
+        # every leaf from index 0 at once, then each level of sums from the bottom up
+        self.tree[self.leaf_start:self.leaf_start + len(priorities)] = priorities
+        start = self.leaf_start // 2
+        while start:
+            nodes = np.arange(start, 2 * start)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            start //= 2
+
+    def find(self, values):
+        # walks down from the root for every value at once, returns leaf indices
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.tree[2 * nodes]
+            go_right = values >= left
+            values = np.where(go_right, values - left, values)
+            nodes = 2 * nodes + go_right
+        return nodes - self.leaf_start
+
+
+class ReplayBuffer:
+
+    def __init__(self, capacity, observation_size, prioritized=False, alpha=0.6, beta=0.4, priority_epsilon=1e-6,
+                 seed=None):
+        self.capacity = capacity
+        self.observation_size = observation_size
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.priority_epsilon = priority_epsilon
+        self.rng = np.random.default_rng(seed)
+        self.states = np.zeros((capacity, observation_size), dtype=np.float32)
+        self.next_states = np.zeros((capacity, observation_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.position = 0
+        self.size = 0
+        self.added = 0  # transitions ever added
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity) if prioritized else None
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        if self.prioritized:
+            self.tree.set(i, self.max_priority)
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.added += 1
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        count = len(actions)
+        indices = (self.position + np.arange(count)) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+        if self.prioritized:
+            self.tree.update(indices, np.full(count, self.max_priority))
+        self.position = int((self.position + count) % self.capacity)
+        self.size = min(self.size + count, self.capacity)
+        self.added += count
+
+    def sample(self, batch_size):
+        # returns states, actions, rewards, next_states, dones, indices, importance weights
+        if self.prioritized:
+            segment = self.tree.total() / batch_size
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+            indices = np.minimum(self.tree.find(values), self.size - 1)
+            probabilities = self.tree.get(indices) / self.tree.total()
+            weights = (self.size * probabilities) ** -self.beta
+            weights = (weights / weights.max()).astype(np.float32)
+        else:
+            indices = self.rng.integers(0, self.size, size=batch_size)
+            weights = np.ones(batch_size, dtype=np.float32)
+        return (self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices],
+                self.dones[indices], indices, weights)
+
+    def overwritten_since(self, indices, added):
+        # which indices were written after the buffer had seen added transitions
+        count = self.added - added
+        if count >= self.capacity:
+            return np.ones(len(indices), dtype=bool)
+        return (np.asarray(indices) - added) % self.capacity < count
+
+    def update_priorities(self, indices, td_errors):
+        if not self.prioritized or len(indices) == 0:
+            return
+        priorities = (np.abs(td_errors) + self.priority_epsilon) ** self.alpha
+        self.tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def save(self, path):
+        size = self.size
+        priorities = self.tree.get(np.arange(size)) if self.prioritized else np.zeros(0)
+        np.savez(path, states=self.states[:size], next_states=self.next_states[:size], actions=self.actions[:size],
+                 rewards=self.rewards[:size], dones=self.dones[:size], priorities=priorities,
+                 meta=np.array([self.capacity, self.position, self.prioritized, self.max_priority,
+                                self.alpha, self.beta, self.priority_epsilon], dtype=np.float64))
+
+    @classmethod
+    def load(cls, path, seed=None):
+        with np.load(path) as data:
+            capacity, position, prioritized, max_priority, alpha, beta, priority_epsilon = data["meta"]
+            buffer = cls(int(capacity), data["states"].shape[1], prioritized=bool(prioritized), alpha=alpha,
+                         beta=beta, priority_epsilon=priority_epsilon, seed=seed)
+            size = len(data["actions"])
+            buffer.states[:size] = data["states"]
+            buffer.next_states[:size] = data["next_states"]
+            buffer.actions[:size] = data["actions"]
+            buffer.rewards[:size] = data["rewards"]
+            buffer.dones[:size] = data["dones"]
+            if buffer.prioritized and size:
+                buffer.tree.update(np.arange(size), data["priorities"])
+        buffer.size = size
+        buffer.added = size
+        buffer.position = int(position)
+        buffer.max_priority = float(max_priority)
+        return buffer
+
+    def snapshot(self):
+        # copies of the whole buffer, cheap next to writing them out, so a checkpoint can write them on another
+        # thread while this buffer keeps taking transitions
+        arrays = {name: getattr(self, name).copy() for name in SNAPSHOT_ARRAYS}
+        arrays["priorities"] = self.tree.get(np.arange(self.capacity)) if self.prioritized else np.zeros(0)
+        meta = {"capacity": self.capacity, "observation_size": self.observation_size, "position": self.position,
+                "size": self.size, "added": self.added, "prioritized": self.prioritized, "max_priority": self.max_priority,
+                "alpha": self.alpha, "beta": self.beta, "priority_epsilon": self.priority_epsilon,
+                "rng_state": self.rng.bit_generator.state}
+        return arrays, meta
+
+    @staticmethod
+    def write_snapshot(directory, snapshot):
+        # one .npy per array so open_snapshot can memory map them
+        arrays, meta = snapshot
+        os.makedirs(directory, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, name + ".npy"), array)
+        with open(os.path.join(directory, SNAPSHOT_META_FILE), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def open_snapshot(cls, directory):
+        # the arrays are memory mapped copy on write: pages are read when first sampled and new transitions stay
+        # private to this process, so resuming does not wait on reading the whole buffer
+        with open(os.path.join(directory, SNAPSHOT_META_FILE)) as f:
+            meta = json.load(f)
+        buffer = cls(meta["capacity"], meta["observation_size"], prioritized=meta["prioritized"],
+                     alpha=meta["alpha"], beta=meta["beta"], priority_epsilon=meta["priority_epsilon"])
+        for name in SNAPSHOT_ARRAYS:
+            setattr(buffer, name, np.load(os.path.join(directory, name + ".npy"), mmap_mode="c"))
+        if buffer.prioritized:
+            buffer.tree.set_leaves(np.load(os.path.join(directory, "priorities.npy")))
+        buffer.rng.bit_generator.state = meta["rng_state"]
+        buffer.position = meta["position"]
+        buffer.size = meta["size"]
+        buffer.added = meta.get("added", meta["size"])
+        buffer.max_priority = meta["max_priority"]
+        return buffer
@@ -0,0 +1,12 @@
+import numpy as np
+
+
+def spawn_seeds(seed, count):
+    # independent child seed sequences for workers or environments; seed may be None, an int or a SeedSequence
+    if isinstance(seed, np.random.SeedSequence):
+        return seed.spawn(count)
+    return np.random.SeedSequence(seed).spawn(count)
+
+
+def spawn_generators(seed, count):
+    return [np.random.default_rng(child) for child in spawn_seeds(seed, count)]
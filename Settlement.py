@@ -0,0 +1,99 @@
+import numpy as np
+
+SPLIT_POT = -1  # winner_seat result when the pot is shared
+SHOWDOWN_OUTCOME_SCORES = ((0, 1), (0, 0), (1, 0))  # scores of the first seat winning, tying and losing
+
+
+def settle(contributions, folded, scores=None, odd_chip_order=None):
+    # pays out a hand from the bet ledger: contributions are the chips each seat put in over the whole hand,
+    # scores are hand ranks (lower wins, like treys) and only needed when more than one seat reaches showdown.
+    # The pot is cut into layers at every distinct contribution, each layer is shared by the best hands still
+    # in among the seats that paid into it, so side pots and the uncalled part of a bet (a layer only its
+    # bettor paid into) fall out of the same loop. A layer nobody eligible paid into goes back to its payers.
+    # odd_chip_order lists the seats in the order they get chips that do not split evenly.
+    seats = range(len(contributions))
+    order = seats if odd_chip_order is None else odd_chip_order
+    payouts = [0] * len(contributions)
+    previous_level = 0
+    for level in sorted(set(contributions)):
+        if level <= previous_level:
+            continue
+        payers = [seat for seat in seats if contributions[seat] >= level]
+        amount = (level - previous_level) * len(payers)
+        previous_level = level
+        contenders = [seat for seat in payers if not folded[seat]] or payers
+        if len(contenders) > 1 and scores is not None:
+            best = min(scores[seat] for seat in contenders)
+            contenders = [seat for seat in contenders if scores[seat] == best]
+        share, odd_chips = divmod(amount, len(contenders))
+        for seat in contenders:
+            payouts[seat] += share
+        for seat in order:
+            if odd_chips == 0:
+                break
+            if seat in contenders:
+                payouts[seat] += 1
+                odd_chips -= 1
+    return payouts
+
+
+def settle_heads_up(contributions, folded, scores=None):
+    # settle for two seats without the layer loop, gives the same payouts
+    first, second = contributions
+    matched = min(first, second)
+    pot = matched * 2
+    payouts = [first - matched, second - matched]
+    if folded[0] != folded[1]:
+        payouts[1 if folded[0] else 0] += pot
+    elif scores is None or scores[0] == scores[1]:
+        # the matched pot is always even
+        payouts[0] += matched
+        payouts[1] += matched
+    else:
+        payouts[0 if scores[0] < scores[1] else 1] += pot
+    return payouts
+
+
+def heads_up_outcome_payouts(contributions):
+    # settle_heads_up for every way a showdown can go for the first seat: win, tie and loss
+    return [settle_heads_up(contributions, (False, False), scores) for scores in SHOWDOWN_OUTCOME_SCORES]
+
+
+def settle_batch(contributions, folded, scores=None, odd_chip_order=None):
+    # settle over a (tables, seats) ledger, vectorized across tables; one pass per seat handles every level
+    contributions = np.asarray(contributions, dtype=np.int64)
+    folded = np.asarray(folded, dtype=bool)
+    n_tables, n_seats = contributions.shape
+    rows = np.arange(n_tables)
+    if odd_chip_order is None:
+        odd_chip_order = np.arange(n_seats)
+    odd_chip_order = np.broadcast_to(odd_chip_order, (n_tables, n_seats))
+    levels = np.sort(contributions, axis=1)
+    payouts = np.zeros((n_tables, n_seats), dtype=np.int64)
+    previous_level = np.zeros(n_tables, dtype=np.int64)
+    for k in range(n_seats):
+        level = levels[:, k]
+        payers = contributions >= level[:, None]
+        amount = (level - previous_level) * payers.sum(axis=1)
+        previous_level = level
+        contenders = payers & ~folded
+        contenders = np.where(contenders.any(axis=1)[:, None], contenders, payers)
+        if scores is not None:
+            contender_scores = np.where(contenders, scores, np.iinfo(np.int64).max)
+            contenders &= contender_scores == contender_scores.min(axis=1)[:, None]
+        count = contenders.sum(axis=1)
+        share, odd_chips = np.divmod(amount, np.maximum(count, 1))
+        payouts += np.where(contenders, share[:, None], 0)
+        # the first odd_chips contenders in the odd chip order get one more chip each
+        ordered = np.take_along_axis(contenders, odd_chip_order, axis=1)
+        ordered &= np.cumsum(ordered, axis=1) <= odd_chips[:, None]
+        payouts[rows[:, None], odd_chip_order] += ordered
+    return payouts
+
+
+def winner_seat(payouts, contributions):
+    # the seat that came out ahead, SPLIT_POT when the pot was shared
+    gains = [payout - contribution for payout, contribution in zip(payouts, contributions)]
+    best = max(gains)
+    winners = [seat for seat, gain in enumerate(gains) if gain == best]
+    return winners[0] if len(winners) == 1 else SPLIT_POT
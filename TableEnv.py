@@ -0,0 +1,218 @@
+import numpy as np
+
+from BettingRules import raise_size, MIN_RAISE_MULTIPLIER, BIG_RAISE_MULTIPLIER
+from Enums import Action
+from GameState import CardDeck
+from HandEvaluator import get_hand_evaluator
+from PokerEnv import INITIAL_STACK_SIZE, SMALL_BLIND, BIG_BLIND
+from Settlement import settle
+
+MIN_SEATS = 2
+MAX_SEATS = 9
+STREET_CARDS = {0: 3, 3: 1, 4: 1}  # cards dealt to move on from a board of this size
+FACING_BET_ACTIONS = [Action.FOLD.value, Action.CALL.value, Action.MIN_RAISE.value, Action.BIG_RAISE.value]
+CHECKED_TO_ACTIONS = [Action.CHECK.value, Action.MIN_RAISE.value, Action.BIG_RAISE.value]
+
+
+class TableEnv:
+    # one table of 2-9 seats, per-seat state in lists indexed by seat. The button moves one seat every hand, the
+    # blinds sit to its left (heads-up the button posts the small blind), preflop action starts left of the big
+    # blind and later streets left of the button. Actions and raise sizes are PokerEnv's; pots, side pots
+    # included, are paid from the contributions ledger by Settlement.settle. Seats without chips sit out, and
+    # once fewer than two seats have chips every stack is topped back up to stack_size. A hand the blinds alone put
+    # every seat that could act all in is run out as soon as it is dealt, its chip changes come with the rewards
+    # of the next hand step ends.
+
+    def __init__(self, num_seats=6, stack_size=INITIAL_STACK_SIZE, seed=None):
+        if not MIN_SEATS <= num_seats <= MAX_SEATS:
+            raise ValueError("num_seats must be between {} and {}".format(MIN_SEATS, MAX_SEATS))
+        if stack_size < BIG_BLIND:
+            raise ValueError("stack_size must be at least the big blind ({})".format(BIG_BLIND))
+        self.num_seats = num_seats
+        self.stack_size = stack_size
+        self.evaluator = get_hand_evaluator()
+        self.rng = np.random.default_rng(seed)
+        self.deck = CardDeck(self.rng)
+        self.seats = list(range(num_seats))
+        self.stacks = [stack_size] * num_seats
+        self.hand_start_stacks = list(self.stacks)
+        self.bets = [0] * num_seats  # this street
+        self.contributions = [0] * num_seats  # whole hand
+        self.folded = [False] * num_seats
+        self.acted = [False] * num_seats
+        self.hands = [[] for _ in self.seats]
+        self.community_cards = []
+        self.button = 0
+        self.small_blind_seat = 0
+        self.big_blind_seat = 0
+        self.to_act = None
+        self.max_bet = 0
+        self.hands_dealt = 0
+        self.last_payouts = None
+        self.pending_rewards = [0] * num_seats  # chip changes of hands ended since step last returned rewards
+        self.reset()
+
+    def seed(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.deck.rng = self.rng
+        return [seed]
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed(seed)
+        self.stacks = [self.stack_size] * self.num_seats
+        self.button = int(self.rng.integers(self.num_seats))
+        self.pending_rewards = [0] * self.num_seats
+        self.reset_hand(move_button=False)
+
+    def next_seat(self, seat, can_act=True):
+        # the first seat after seat, clockwise, still in the hand (and with chips left when can_act)
+        for offset in range(1, self.num_seats + 1):
+            candidate = (seat + offset) % self.num_seats
+            if not self.folded[candidate] and (not can_act or self.stacks[candidate] > 0):
+                return candidate
+        return None
+
+    def reset_hand(self, move_button=True):
+        self.deal_hand(move_button)
+        while self.is_round_closed():
+            # blinds put everyone who could act all in
+            self.run_out()
+            self.settle_hand()
+            self.deal_hand(move_button=True)
+
+    def deal_hand(self, move_button):
+        if sum(1 for stack in self.stacks if stack > 0) < 2:
+            self.stacks = [self.stack_size] * self.num_seats
+        self.hands_dealt += 1
+        self.deck.shuffle()
+        self.community_cards = []
+        self.hand_start_stacks = list(self.stacks)
+        self.folded = [stack == 0 for stack in self.stacks]
+        self.bets = [0] * self.num_seats
+        self.contributions = [0] * self.num_seats
+        self.acted = [False] * self.num_seats
+        if move_button or self.folded[self.button]:
+            self.button = self.next_seat(self.button, can_act=False)
+        if self.num_seats - sum(self.folded) == 2:
+            self.small_blind_seat = self.button
+        else:
+            self.small_blind_seat = self.next_seat(self.button, can_act=False)
+        self.big_blind_seat = self.next_seat(self.small_blind_seat, can_act=False)
+        self.put_chips(self.small_blind_seat, SMALL_BLIND)
+        self.put_chips(self.big_blind_seat, BIG_BLIND)
+        self.max_bet = max(self.bets)
+        for seat in self.seats:
+            self.hands[seat] = self.deck.draw(2) if not self.folded[seat] else []
+        self.to_act = self.next_seat(self.big_blind_seat)
+
+    def put_chips(self, seat, amount):
+        amount = min(amount, self.stacks[seat])
+        self.stacks[seat] -= amount
+        self.bets[seat] += amount
+        self.contributions[seat] += amount
+
+    def get_valid_actions(self, seat=None):
+        # shared lists, callers must not modify them
+        seat = self.to_act if seat is None else seat
+        return FACING_BET_ACTIONS if self.bets[seat] < self.max_bet else CHECKED_TO_ACTIONS
+
+    def step(self, action):
+        # plays action for the seat to act; returns done, the performed Action and, when the hand ended, every
+        # seat's chip change over it. The next hand is dealt right away like PokerEnv.
+        seat = self.to_act
+        performed_action = self.perform_action(seat, action)
+        self.acted[seat] = True
+        if self.num_seats - sum(self.folded) == 1:
+            return True, performed_action, self.end_hand()
+        if self.is_round_closed():
+            can_act = sum(1 for s in self.seats if not self.folded[s] and self.stacks[s] > 0)
+            if can_act <= 1 or len(self.community_cards) == 5:
+                self.run_out()
+                return True, performed_action, self.end_hand()
+            self.next_street()
+        else:
+            self.to_act = self.next_seat(seat)
+        return False, performed_action, None
+
+    def perform_action(self, seat, action):
+        if action == Action.FOLD.value:
+            self.folded[seat] = True
+            return Action.FOLD
+        if action == Action.MIN_RAISE.value or action == Action.BIG_RAISE.value:
+            return self.perform_raise(seat, action)
+        return self.perform_call(seat)
+
+    def perform_call(self, seat):
+        to_call = self.max_bet - self.bets[seat]
+        if to_call <= 0:
+            return Action.CHECK
+        self.put_chips(seat, to_call)
+        return Action.CALL
+
+    def perform_raise(self, seat, action):
+        to_call = self.max_bet - self.bets[seat]
+        stack = self.stacks[seat]
+        cover = max(self.stacks[other] for other in self.seats if other != seat and not self.folded[other])
+        # nothing to raise into once everybody else is all in
+        if to_call >= stack or cover == 0:
+            return self.perform_call(seat)
+        if action == Action.BIG_RAISE.value:
+            bet_amount = raise_size(to_call, BIG_RAISE_MULTIPLIER, BIG_BLIND * 3, cover)
+            if bet_amount <= stack:
+                return self.place_raise(seat, bet_amount, Action.BIG_RAISE)
+        bet_amount = raise_size(to_call, MIN_RAISE_MULTIPLIER, SMALL_BLIND, cover)
+        if bet_amount <= stack:
+            return self.place_raise(seat, bet_amount, Action.MIN_RAISE)
+        return self.perform_call(seat)
+
+    def place_raise(self, seat, bet_amount, action):
+        self.put_chips(seat, bet_amount)
+        self.max_bet = self.bets[seat]
+        # everybody else has to answer the raise
+        self.acted = [False] * self.num_seats
+        return action
+
+    def is_round_closed(self):
+        # every seat that can still act has acted and matched the bet
+        for seat in self.seats:
+            if not self.folded[seat] and self.stacks[seat] > 0 and \
+                    (not self.acted[seat] or self.bets[seat] < self.max_bet):
+                return False
+        return True
+
+    def next_street(self):
+        self.community_cards.extend(self.deck.draw(STREET_CARDS[len(self.community_cards)]))
+        self.bets = [0] * self.num_seats
+        self.acted = [False] * self.num_seats
+        self.max_bet = 0
+        self.to_act = self.next_seat(self.button)
+
+    def run_out(self):
+        self.community_cards.extend(self.deck.draw(5 - len(self.community_cards)))
+
+    def odd_chip_order(self):
+        # odd chips of a split pot go to the first winners left of the button
+        return [(self.button + offset) % self.num_seats for offset in range(1, self.num_seats + 1)]
+
+    def end_hand(self):
+        self.settle_hand()
+        self.reset_hand()
+        rewards, self.pending_rewards = self.pending_rewards, [0] * self.num_seats
+        return rewards
+
+    def settle_hand(self):
+        contenders = [seat for seat in self.seats if not self.folded[seat]]
+        scores = None
+        if len(contenders) > 1:
+            scores = [self.evaluator.evaluate(self.hands[seat], self.community_cards) if not self.folded[seat] else 0
+                      for seat in self.seats]
+        payouts = settle(self.contributions, self.folded, scores, self.odd_chip_order())
+        for seat in self.seats:
+            self.stacks[seat] += payouts[seat]
+        self.pending_rewards = [reward + stack - start for reward, stack, start
+                                in zip(self.pending_rewards, self.stacks, self.hand_start_stacks)]
+        self.last_payouts = payouts
+
+    def pot(self):
+        return sum(self.contributions)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from DecisionCache import DecisionCache
+from NumpyPolicy import NumpyPolicy
+from ObservationEncoder import OBSERVATION_SIZE
+from PokerAgentEnv import PokerAgentEnv
+
+
+def random_policy(seed):
+    rng = np.random.default_rng(seed)
+    return NumpyPolicy([rng.normal(size=(OBSERVATION_SIZE, 32)).astype(np.float32),
+                        rng.normal(size=32).astype(np.float32),
+                        rng.normal(size=(32, 5)).astype(np.float32),
+                        rng.normal(size=5).astype(np.float32)])
+
+
+def opponent_decisions(env, num_steps, seed):
+    # (cached, uncached) opponent action for every opponent decision over random play
+    rng = np.random.default_rng(seed)
+    pairs = []
+    env.reset()
+    for _ in range(num_steps):
+        cur_player, other_player = env.pokerEnv.opponent, env.pokerEnv.player
+        valid_actions = env.pokerEnv.get_player_valid_actions(other_player=other_player)
+        cached = env.decision_cache.act(env.get_infoset_key(cur_player, other_player), valid_actions)
+        observation = env.get_observation(cur_player, other_player)
+        pairs.append((cached, env.opponent_server.act_one(observation, valid_actions)))
+        _, _, done, _ = env.step(rng.choice(env.get_player_valid_actions()))
+        if done:
+            env.reset()
+    return pairs
+
+
+@pytest.mark.parametrize("seed", (0, 1, 2))
+def test_cached_actions_match_the_model(seed):
+    env = PokerAgentEnv(seed=seed, opponent_model_path=None, decision_cache=DecisionCache(chip_bucket=1))
+    env.update_opponent_model(random_policy(seed))
+    pairs = opponent_decisions(env, 3000, seed)
+    assert all(cached == uncached for cached, uncached in pairs)
+    assert env.decision_cache.hits > 0
+
+
+def test_batch_matches_single_lookups():
+    env = PokerAgentEnv(seed=0, opponent_model_path=None, decision_cache=DecisionCache())
+    env.update_opponent_model(random_policy(0))
+    rng = np.random.default_rng(0)
+    keys = []
+    masks = []
+    env.reset()
+    for _ in range(500):
+        cur_player, other_player = env.pokerEnv.opponent, env.pokerEnv.player
+        keys.append(env.get_infoset_key(cur_player, other_player))
+        mask = np.zeros(5, dtype=bool)
+        mask[env.pokerEnv.get_player_valid_actions(other_player=other_player)] = True
+        masks.append(mask)
+        _, _, done, _ = env.step(rng.choice(env.get_player_valid_actions()))
+        if done:
+            env.reset()
+    batch = DecisionCache(env.opponent_model).act_batch(keys, masks)
+    single = DecisionCache(env.opponent_model)
+    assert batch.tolist() == [single.act(key, np.flatnonzero(mask).tolist()) for key, mask in zip(keys, masks)]
+
+
+def test_entries_survive_model_swaps():
+    first, second = random_policy(0), random_policy(1)
+    cache = DecisionCache(first)
+    key = cache.infoset_key([48, 49], [], 0, 1, 3, 99, 98, 1)
+    first_values = cache.q_values(key, [0, 2, 3, 4])
+    cache.update_model(second)
+    assert cache.q_values(key, [0, 2, 3, 4]) != first_values
+    cache.update_model(first)
+    assert cache.q_values(key, [0, 2, 3, 4]) == first_values
+    assert cache.info()["hits"] == 1 and cache.info()["misses"] == 2
+    # weights changed in place: the old entries must not be served again
+    first.set_weights([weight * 2 for weight in first.get_weights()])
+    cache.invalidate()
+    assert cache.q_values(key, [0, 2, 3, 4]) != first_values
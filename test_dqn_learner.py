@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from ActorLearner import build_model
+from DQNLearner import DQNLearner
+from ObservationEncoder import OBSERVATION_SIZE
+from ReplayBuffer import ReplayBuffer
+
+CAPACITY = 64
+BATCH_SIZE = 32
+
+
+def random_transitions(rng, count):
+    return (rng.random((count, OBSERVATION_SIZE)), rng.integers(0, 5, count), rng.normal(size=count),
+            rng.random((count, OBSERVATION_SIZE)), rng.random(count) < 0.1)
+
+
+def make_learner(seed):
+    tf.random.set_seed(seed)
+    replay_buffer = ReplayBuffer(CAPACITY, OBSERVATION_SIZE, prioritized=True, seed=seed)
+    replay_buffer.add_batch(*random_transitions(np.random.default_rng(seed), CAPACITY))
+    return DQNLearner(build_model((OBSERVATION_SIZE,), 5), build_model((OBSERVATION_SIZE,), 5), replay_buffer, 5,
+                      batch_size=BATCH_SIZE)
+
+
+def weights_equal(first, second):
+    return len(first) == len(second) and all(np.array_equal(a, b) for a, b in zip(first, second))
+
+
+def test_train_step_updates_the_model():
+    with make_learner(0) as learner:
+        before = learner.model.get_weights()
+        loss = learner.train_step()
+        assert np.isfinite(float(loss))
+        assert learner.update_count == 1
+        assert not weights_equal(before, learner.model.get_weights())
+
+
+def test_stale_priorities_are_not_updated():
+    with make_learner(1) as learner:
+        batch = learner.sample_batch()
+        indices = batch[1]
+        # the buffer is full, so these land in slots 0..7 and replace whatever the batch sampled there
+        learner.replay_buffer.add_batch(*random_transitions(np.random.default_rng(1), 8))
+        stale = indices < 8
+        assert stale.any() and not stale.all()
+        before = learner.replay_buffer.tree.get(indices)
+        # queued ahead of anything the sampler thread makes, so train_step trains on this batch
+        learner.batches.put(batch)
+        learner.train_step()
+        after = learner.replay_buffer.tree.get(indices)
+        assert np.array_equal(after[stale], before[stale])
+        assert not np.array_equal(after[~stale], before[~stale])
+
+
+def test_state_round_trip(tmp_path):
+    with make_learner(2) as learner:
+        learner.train(3)
+        state = learner.get_state()
+        ReplayBuffer.write_snapshot(str(tmp_path), state["replay"])
+        state["replay"] = ReplayBuffer.open_snapshot(str(tmp_path))
+        with make_learner(3) as restored:
+            restored.set_state(state)
+            assert weights_equal(learner.model.get_weights(), restored.model.get_weights())
+            assert weights_equal(learner.model_target.get_weights(), restored.model_target.get_weights())
+            assert weights_equal(learner.optimizer_weights(), restored.optimizer_weights())
+            assert restored.update_count == learner.update_count == 3
+            for name in ("states", "actions", "rewards", "next_states", "dones"):
+                assert np.array_equal(getattr(learner.replay_buffer, name), getattr(restored.replay_buffer, name))
+            assert np.array_equal(learner.replay_buffer.tree.tree, restored.replay_buffer.tree.tree)
+            # both continue with the same next update from the same batch
+            learner.stop()
+            batch = learner.sample_batch()
+            learner.batches.put(batch)
+            restored.batches.put(batch)
+            assert float(learner.train_step()) == pytest.approx(float(restored.train_step()))
+            for first, second in zip(learner.model.get_weights(), restored.model.get_weights()):
+                np.testing.assert_allclose(first, second, rtol=1e-5, atol=1e-6)
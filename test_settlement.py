@@ -0,0 +1,132 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from Settlement import settle, settle_heads_up, settle_batch
+from PokerEnv import PokerEnv, INITIAL_STACK_SIZE
+from BatchPokerEnv import BatchPokerEnv
+
+SEAT_COUNTS = (2, 3, 6, 9)
+SEEDS = (0, 1, 2)
+
+
+def random_ledgers(num_hands, num_seats, seed):
+    # contributions with plenty of zeros and equal levels, some folds and few distinct ranks so ties are common
+    rng = np.random.default_rng(seed)
+    contributions = rng.integers(0, 50, size=(num_hands, num_seats)) * rng.integers(0, 2, size=(num_hands, num_seats))
+    folded = rng.random((num_hands, num_seats)) < 0.3
+    scores = rng.integers(1, 20, size=(num_hands, num_seats))
+    return contributions, folded, scores
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("num_seats", SEAT_COUNTS)
+def test_settle_batch_conserves_chips(num_seats, seed):
+    contributions, folded, scores = random_ledgers(20000, num_seats, seed)
+    payouts = settle_batch(contributions, folded, scores)
+    np.testing.assert_array_equal(payouts.sum(axis=1), contributions.sum(axis=1))
+    assert (payouts >= 0).all()
+    # nobody gets back more than they could win from the seats they covered
+    cap = np.minimum(contributions[:, :, None], contributions[:, None, :]).sum(axis=2)
+    assert (payouts <= cap).all()
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("num_seats", SEAT_COUNTS)
+def test_settle_matches_settle_batch(num_seats, seed):
+    contributions, folded, scores = random_ledgers(2000, num_seats, seed)
+    payouts = settle_batch(contributions, folded, scores)
+    for i in range(len(contributions)):
+        args = contributions[i].tolist(), folded[i].tolist(), scores[i].tolist()
+        assert settle(*args) == payouts[i].tolist()
+        if num_seats == 2:
+            assert settle_heads_up(*args) == payouts[i].tolist()
+
+
+@pytest.mark.parametrize("num_seats", SEAT_COUNTS)
+def test_odd_chip_order(num_seats):
+    contributions, folded, scores = random_ledgers(2000, num_seats, 3)
+    order = np.roll(np.arange(num_seats), 1)
+    payouts = settle_batch(contributions, folded, scores, order)
+    for i in range(len(contributions)):
+        assert settle(contributions[i].tolist(), folded[i].tolist(), scores[i].tolist(), order.tolist()) == \
+            payouts[i].tolist()
+
+
+def test_poker_env_conserves_chips():
+    # random play, stacks plus pot stay constant after every action
+    env = PokerEnv(seed=0)
+    rng = np.random.default_rng(0)
+    seat = 0
+    while env.hands_dealt <= 2000:
+        cur_player, other_player = (env.player, env.opponent) if seat == 0 else (env.opponent, env.player)
+        env.execute_player_action(cur_player, other_player, rng.choice(env.get_player_valid_actions(other_player)))
+        assert env.player.stack_size + env.opponent.stack_size + env.pot == INITIAL_STACK_SIZE * 2
+        assert env.pot >= 0 and env.player.stack_size >= 0 and env.opponent.stack_size >= 0
+        seat = 1 - seat
+        if rng.random() < 0.001:
+            env.reset()
+
+
+def test_batch_env_conserves_chips():
+    env = BatchPokerEnv(256, seed=0)
+    rng = np.random.default_rng(0)
+    hands = 0
+    while hands < 20000:
+        mask = env.get_valid_action_mask()
+        _, _, hand_over, _ = env.step(np.argmax(np.where(mask, rng.random(mask.shape), -1), axis=1))
+        hands += int(hand_over.sum())
+        assert (env.stack.sum(axis=1) + env.pot == INITIAL_STACK_SIZE * 2).all()
+        assert (env.pot >= 0).all() and (env.stack >= 0).all()
+
+
+def runout_rewards(env, snapshot, cur_player, other_player, action, num_cards):
+    # the reward execute_player_action gives without all_in_ev for every way the last num_cards can come
+    env.restore(snapshot)
+    dealt, remaining = env.deck.order[:env.deck.pointer], env.deck.order[env.deck.pointer:]
+    rewards = []
+    for runout in combinations(range(len(remaining)), num_cards):
+        env.restore(snapshot)
+        rest = np.delete(remaining, runout)
+        env.deck.order = np.concatenate([dealt, remaining[list(runout)], rest])
+        rewards.append(env.execute_player_action(cur_player, other_player, action)[2])
+    return rewards
+
+
+def test_all_in_ev_reward_is_the_mean_runout_reward():
+    # flop and turn all-ins, where every runout can be dealt
+    env = PokerEnv(seed=0, all_in_ev=True)
+    rng = np.random.default_rng(0)
+    seat = 0
+    checked = {3: 0, 4: 0}
+    while min(checked.values()) < 5:
+        cur_player, other_player = (env.player, env.opponent) if seat == 0 else (env.opponent, env.player)
+        action = rng.choice(env.get_player_valid_actions(other_player))
+        before = env.snapshot()
+        hands_dealt = env.hands_dealt
+        reward = env.execute_player_action(cur_player, other_player, action)[2]
+        seat = 1 - seat
+        if env.hands_dealt == hands_dealt:
+            continue
+        after = env.snapshot()
+        env.restore(before)
+        env.apply_player_action(cur_player, other_player, action)
+        board_size = env.all_in_board_size
+        folded = env.player.is_fold or env.opponent.is_fold
+        if board_size in checked and not folded:
+            env.all_in_ev = False
+            rewards = runout_rewards(env, before, cur_player, other_player, action, 5 - board_size)
+            env.all_in_ev = True
+            assert reward == pytest.approx(np.mean(rewards), rel=1e-9, abs=1e-9)
+            checked[board_size] += 1
+        env.restore(after)
+
+
+def test_snapshot_keeps_the_all_in_board_size():
+    env = PokerEnv(seed=0)
+    env.all_in_board_size = 3
+    snapshot = env.snapshot()
+    env.all_in_board_size = None
+    env.restore(snapshot)
+    assert env.all_in_board_size == 3
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from Enums import Action
+from PokerEnv import SMALL_BLIND, BIG_BLIND
+from TableEnv import TableEnv
+
+SEAT_COUNTS = (2, 3, 6, 9)
+SEEDS = (0, 1, 2)
+NUM_STEPS = 3000
+
+
+def first_seat_after(seat, num_seats, in_hand):
+    for offset in range(1, num_seats + 1):
+        candidate = (seat + offset) % num_seats
+        if in_hand(candidate):
+            return candidate
+    return None
+
+
+def play(env, seed, num_steps=NUM_STEPS):
+    # random play checking chip conservation, who acts next, the button and the blinds after every step
+    rng = np.random.default_rng(seed)
+    total_chips = env.num_seats * env.stack_size
+    for _ in range(num_steps):
+        seat = env.to_act
+        button = env.button
+        board_size = len(env.community_cards)
+        start_stacks = list(env.hand_start_stacks)
+        hands_dealt = env.hands_dealt
+        assert not env.folded[seat] and env.stacks[seat] > 0
+        done, _, rewards = env.step(rng.choice(env.get_valid_actions()))
+        assert sum(env.stacks) + env.pot() == total_chips
+
+        def can_act(candidate):
+            return not env.folded[candidate] and env.stacks[candidate] > 0
+
+        if not done:
+            assert rewards is None
+            if len(env.community_cards) > board_size:
+                assert env.to_act == first_seat_after(env.button, env.num_seats, can_act)
+            else:
+                assert env.to_act == first_seat_after(seat, env.num_seats, can_act)
+            continue
+        assert sum(rewards) == 0
+        if env.hand_start_stacks != [env.stack_size] * env.num_seats:
+            # no top-up since the last hand, the rewards are every chip that moved
+            assert env.hand_start_stacks == [start + reward for start, reward in zip(start_stacks, rewards)]
+        if env.hands_dealt == hands_dealt + 1:
+            def has_chips(candidate):
+                return env.hand_start_stacks[candidate] > 0
+
+            assert env.button == first_seat_after(button, env.num_seats, has_chips)
+            if sum(1 for stack in env.hand_start_stacks if stack > 0) == 2:
+                assert env.small_blind_seat == env.button
+            else:
+                assert env.small_blind_seat == first_seat_after(env.button, env.num_seats, has_chips)
+            assert env.big_blind_seat == first_seat_after(env.small_blind_seat, env.num_seats, has_chips)
+        assert env.to_act == first_seat_after(env.big_blind_seat, env.num_seats, can_act)
+
+
+@pytest.mark.parametrize("num_seats", SEAT_COUNTS)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_random_play(num_seats, seed):
+    play(TableEnv(num_seats, seed=seed), seed)
+
+
+@pytest.mark.parametrize("num_seats", SEAT_COUNTS)
+@pytest.mark.parametrize("seed", SEEDS)
+def test_short_stacks(num_seats, seed):
+    play(TableEnv(num_seats, stack_size=BIG_BLIND, seed=seed), seed)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_blinds_put_everyone_all_in(seed):
+    # only reachable by setting the stacks, chips are conserved and stack_size covers the big blind
+    env = TableEnv(2, seed=seed)
+    env.stacks = [BIG_BLIND, SMALL_BLIND]
+    env.button = 1
+    hands_dealt = env.hands_dealt
+    env.reset_hand(move_button=False)
+    assert env.hands_dealt >= hands_dealt + 2
+    pending = list(env.pending_rewards)
+    assert sum(pending) == 0
+    start_stacks = list(env.hand_start_stacks)
+    done, _, rewards = env.step(Action.FOLD.value)
+    assert done
+    # the hand that was run out at once is paid with the next one
+    assert rewards == [earlier + stack - start for earlier, stack, start
+                       in zip(pending, env.hand_start_stacks, start_stacks)]
+
+
+def test_stack_size_below_the_big_blind():
+    with pytest.raises(ValueError):
+        TableEnv(2, stack_size=BIG_BLIND - 1)